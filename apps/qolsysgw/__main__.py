@@ -0,0 +1,12 @@
+import os
+import sys
+
+# The modules of the gateway are imported as top-level modules, as they are
+# when AppDaemon loads the app
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from standalone import main  # noqa: E402
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,566 @@
+import asyncio
+import logging
+import time
+import uuid
+
+from mqtt.listener import MqttQolsysControlListener
+from mqtt.listener import MqttQolsysEventListener
+from mqtt.publisher import MqttPublishQueue
+from mqtt.updater import MqttUpdater
+from mqtt.updater import MqttWrapperFactory
+
+from qolsys import codec
+from qolsys.config import QolsysGatewayConfig
+from qolsys.control import QolsysControl
+from qolsys.events import QolsysEvent
+from qolsys.exceptions import InvalidUserCodeException
+from qolsys.exceptions import MissingUserCodeException
+from qolsys.exceptions import recorded_on
+from qolsys.journal import QolsysJournal
+from qolsys.metrics import QolsysMetrics
+from qolsys.metrics import QolsysMetricsServer
+from qolsys.snapshot import QolsysStateSnapshot
+from qolsys.socket import QolsysSocket
+from qolsys.state import QolsysState
+from qolsys.utils import MacResolver
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class QolsysGatewayPanel(object):
+    """
+    A panel served by the gateway, with its own connection and state, and
+    publishing through the MQTT pipeline shared by all the panels
+    """
+
+    def __init__(self, app, cfg: QolsysGatewayConfig,
+                 mqtt_plugin_cfg: dict, session_token: str,
+                 mqtt_publish: callable, queue_publish: callable,
+                 metrics, mac_resolver: MacResolver = None,
+                 shared: bool = False) -> None:
+        self._app = app
+        self._cfg = cfg
+        self._session_token = session_token
+        self._mqtt_publish = mqtt_publish
+        self._mac_resolver = mac_resolver
+        self._mac_task = None
+        self._is_terminated = False
+
+        # Whether the entities are currently published as available, and
+        # whether their configuration changed since they were published
+        self._available = False
+        self._reconfigure = False
+
+        self._factory = MqttWrapperFactory(
+            mqtt_publish=queue_publish,
+            cfg=cfg,
+            mqtt_plugin_cfg=mqtt_plugin_cfg,
+            session_token=session_token,
+            # The gateway and its MQTT topics are shared with other panels,
+            # whose zones can have the same names as the zones of this one
+            node_id=cfg.panel_unique_id if shared else None,
+        )
+
+        self._state = QolsysState()
+        try:
+            self._factory.wrap(self._state).set_unavailable()
+        except:  # noqa: E722
+            LOGGER.exception('Error setting state unavailable; pursuing')
+
+        self._updater = MqttUpdater(
+            state=self._state,
+            factory=self._factory,
+            debounce=cfg.sensor_debounce,
+            activity_attributes=cfg.sensor_activity_attributes,
+            metrics=metrics,
+        )
+
+        self._journal = None
+        if cfg.journal_path:
+            self._journal = QolsysJournal(
+                path=cfg.journal_path,
+                max_segment_size=cfg.journal_max_segment_size,
+                max_segments=cfg.journal_max_segments,
+                metrics=metrics,
+            )
+
+        self._snapshot = None
+        if cfg.state_snapshot_path:
+            self._snapshot = QolsysStateSnapshot(
+                path=cfg.state_snapshot_path,
+                state=self._state,
+                interval=cfg.state_snapshot_interval,
+                metrics=metrics,
+            )
+
+        self._qolsys_socket = QolsysSocket(
+            hostname=cfg.panel_host,
+            port=cfg.panel_port,
+            token=cfg.panel_token,
+            callback=self.qolsys_event_callback,
+            connected_callback=self.qolsys_connected_callback,
+            disconnected_callback=self.qolsys_disconnected_callback,
+            metrics=metrics,
+            max_line_size=cfg.panel_max_line_size,
+            ack_timeout=cfg.panel_ack_timeout,
+            event_timeout=cfg.panel_event_timeout,
+            action_retries=cfg.panel_action_retries,
+            send_interval=cfg.panel_send_interval,
+            keep_alive=cfg.panel_keep_alive,
+            idle_timeout=cfg.panel_idle_timeout,
+            tcp_keepalive=cfg.panel_tcp_keepalive,
+            dns_ttl=cfg.panel_dns_ttl,
+            journal=self._journal,
+        )
+
+    @property
+    def cfg(self):
+        return self._cfg
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def factory(self):
+        return self._factory
+
+    @property
+    def socket(self):
+        return self._qolsys_socket
+
+    def start(self):
+        # The tasks of the panel record the exceptions they raise on the
+        # state of the panel, for them to be reported by its entities
+        with recorded_on(self._state):
+            if self._snapshot is not None:
+                self._warm_start()
+                self._app.create_task(self._snapshot.save_periodically())
+
+            self._discover_mac()
+
+            self._app.create_task(self._qolsys_socket.listen())
+            self._app.create_task(self._qolsys_socket.keep_alive())
+
+    def _warm_start(self):
+        # Publish the last known state right away, it will be reconciled
+        # with the summary of the panel once connected, or set unavailable
+        # if the connection fails
+        saved_at = self._snapshot.load()
+        if saved_at is None:
+            return
+
+        LOGGER.info(f'Restored the last known state of the panel from '
+                    f'{self._snapshot.path}, saved '
+                    f'{time.time() - saved_at:.0f}s ago')
+        self._factory.wrap(self._state).configure()
+        self._available = True
+
+    def _discover_mac(self):
+        if self._cfg.panel_mac or self._mac_resolver is None or (
+                self._mac_task is not None and not self._mac_task.done()):
+            return
+
+        self._mac_task = asyncio.get_running_loop().create_task(
+            self._resolve_mac())
+
+    async def _resolve_mac(self):
+        try:
+            mac = await self._mac_resolver.resolve(self._cfg.panel_host)
+        except asyncio.CancelledError:
+            raise
+        except:  # noqa: E722
+            LOGGER.exception('Error trying to get the mac address of the '
+                             'panel')
+            return
+
+        if mac is None:
+            # The ARP table might only know of the panel once connected to
+            # it, we will try again on the next connection
+            return
+
+        LOGGER.info(f"Found mac address '{mac}' for the panel")
+        self._cfg.set('panel_mac', mac)
+        self._factory.invalidate_configure_cache()
+
+        # Publish the configuration of the entities again, for the mac
+        # address to be part of their device
+        self._reconfigure = True
+        if self._available:
+            self._configure_all()
+
+    def _configure_all(self):
+        self._factory.wrap(self._state).configure()
+        for partition in self._state.partitions:
+            self._factory.wrap(partition).configure()
+            for sensor in partition.sensors:
+                self._factory.wrap(sensor).configure(partition=partition)
+
+        self._reconfigure = False
+
+    def terminate(self):
+        with recorded_on(self._state):
+            self._terminate()
+
+    def _terminate(self):
+        # A resolution still running must not configure the entities again
+        # once the panel is terminated
+        if self._mac_task is not None:
+            self._mac_task.cancel()
+
+        # Publish the last state of the sensors being debounced before
+        # setting them unavailable
+        self._updater.flush()
+
+        self._available = False
+        self._factory.wrap(self._state).set_unavailable()
+
+        for partition in self._state.partitions:
+            for sensor in partition.sensors:
+                try:
+                    self._factory.wrap(sensor).set_unavailable()
+                except:  # noqa: E722
+                    LOGGER.exception(f"Error setting sensor '{sensor.id}' "
+                                     f"({sensor.name}) unavailable")
+
+            try:
+                self._factory.wrap(partition).set_unavailable()
+            except:  # noqa: E722
+                LOGGER.exception(f"Error setting partition '{partition.id}' "
+                                 f"({partition.name}) unavailable")
+
+        if self._journal is not None:
+            self._journal.close()
+
+        if self._snapshot is not None:
+            self._snapshot.save()
+
+        self._is_terminated = True
+
+    async def qolsys_connected_callback(self):
+        LOGGER.debug('Qolsys callback for connection event')
+        if self._reconfigure:
+            self._configure_all()
+        else:
+            self._factory.wrap(self._state).configure()
+        self._available = True
+
+        self._discover_mac()
+
+    async def qolsys_disconnected_callback(self):
+        if self._is_terminated:
+            return
+
+        LOGGER.debug('Qolsys callback for disconnection event')
+        self._factory.wrap(self._state).set_unavailable()
+        self._available = False
+
+    async def qolsys_event_callback(self, event: QolsysEvent):
+        LOGGER.debug('Qolsys callback for event: %s', event)
+
+        if self._cfg.event_mode == 'direct':
+            # Mirror the event to the event topic without waiting for the
+            # publish to complete, and process the already-parsed event
+            self._mqtt_publish(
+                namespace=self._cfg.mqtt_namespace,
+                topic=self._cfg.event_topic,
+                payload=event.raw_str,
+            )
+            await self.mqtt_event_callback(event)
+            return
+
+        await self._mqtt_publish(
+            namespace=self._cfg.mqtt_namespace,
+            topic=self._cfg.event_topic,
+            payload=event.raw_str,
+        )
+
+    async def mqtt_event_callback(self, event: QolsysEvent):
+        LOGGER.debug('MQTT callback for event: %s', event)
+
+        with recorded_on(self._state):
+            self._state.apply(event)
+
+    async def mqtt_control_callback(self, control: QolsysControl):
+        with recorded_on(self._state):
+            await self._mqtt_control_callback(control)
+
+    async def _mqtt_control_callback(self, control: QolsysControl):
+        # Measure the latency of the action from the reception of the control
+        received_at = time.monotonic()
+
+        if control.session_token != self._session_token and (
+                self._cfg.user_control_token is None or
+                control.session_token != self._cfg.user_control_token):
+            LOGGER.error(f'invalid session token for {control}')
+            return
+
+        if control.requires_config:
+            control.configure(self._cfg, self._state)
+
+        try:
+            control.check()
+        except (MissingUserCodeException, InvalidUserCodeException) as e:
+            LOGGER.error(f'{e} for control event {control}')
+            return
+
+        action = control.action
+        if action is None:
+            LOGGER.info(f'Action missing for control event {control}')
+            return
+
+        await self._qolsys_socket.send(action, received_at=received_at)
+
+
+class QolsysGatewayBase(object):
+    """
+    The gateway between the panels and MQTT, independently of the runtime
+    it runs in; the runtime provides the MQTT API of AppDaemon's MQTT
+    plugin that the gateway uses: `args`, `create_task`, `mqtt_publish`,
+    `mqtt_subscribe` and `listen_event`, and the configuration of the MQTT
+    client through `_mqtt_plugin_config`
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._panels = []
+        self._event_topics = {}
+        self._control_topics = {}
+        self._qolsys_socket = None
+        self._publish_queue = None
+        self._factory = None
+        self._state = None
+        self._metrics = None
+        self._metrics_server = None
+
+    async def _mqtt_plugin_config(self, namespace: str) -> dict:
+        """
+        Return the configuration of the MQTT client, with its birth and
+        will topics and payloads
+        """
+        raise NotImplementedError
+
+    async def initialize(self):
+        LOGGER.info('Starting')
+        self._is_terminated = False
+
+        cfg = self._cfg = QolsysGatewayConfig(self.args)
+
+        codec.use(cfg.json_codec)
+
+        mqtt_plugin_cfg = await self._mqtt_plugin_config(cfg.mqtt_namespace)
+
+        self._session_token = str(uuid.uuid4())
+
+        self._init_metrics()
+
+        # Publish the entities' updates through a queue that will coalesce
+        # and batch them, to avoid flooding the MQTT broker on resync
+        self._publish_queue = MqttPublishQueue(
+            mqtt_publish=self._mqtt_publish,
+            window=cfg.mqtt_publish_window,
+            batch_size=cfg.mqtt_publish_batch_size,
+        )
+
+        # The mac address of the panels is found in the background, so
+        # their device can be linked to other integrations
+        mac_resolver = MacResolver(
+            cache_path=cfg.mac_cache_path,
+            ttl=cfg.mac_cache_ttl,
+        )
+
+        # Each panel gets its own labeled metrics when there are several
+        panel_cfgs = cfg.panels()
+        multiple = len(panel_cfgs) > 1
+        self._panels = [
+            QolsysGatewayPanel(
+                app=self,
+                cfg=panel_cfg,
+                mqtt_plugin_cfg=mqtt_plugin_cfg,
+                session_token=self._session_token,
+                mqtt_publish=self._mqtt_publish,
+                queue_publish=self._publish_queue.publish,
+                metrics=(self._metrics.scoped(panel=panel_cfg.panel_unique_id)
+                         if multiple else self._metrics),
+                mac_resolver=mac_resolver,
+                shared=multiple,
+            )
+            for panel_cfg in panel_cfgs
+        ]
+
+        # Shortcuts to the first panel, which is the only one in most setups
+        self._state = self._panels[0].state
+        self._factory = self._panels[0].factory
+        self._qolsys_socket = self._panels[0].socket
+
+        self._subscribe(wildcard=multiple)
+
+        for panel in self._panels:
+            panel.start()
+
+        if cfg.metrics_port is not None:
+            self._metrics_server = QolsysMetricsServer(
+                metrics=self._metrics,
+                host=cfg.metrics_host,
+                port=cfg.metrics_port,
+            )
+            try:
+                await self._metrics_server.start()
+            except OSError:
+                LOGGER.exception('Unable to start the metrics server; '
+                                 'pursuing without it')
+                self._metrics_server = None
+
+        if cfg.stats_interval:
+            self.create_task(self._publish_stats_periodically())
+
+        LOGGER.info('Started')
+
+    def _subscribe(self, wildcard: bool):
+        """
+        Listen to the event and control topics of the panels; with several
+        panels, a single subscription with a wildcard in place of the panel
+        unique id covers the topics of all the panels, and the messages are
+        routed to the panels by topic
+        """
+        cfg = self._cfg
+
+        # In direct mode, events are processed as soon as they are received
+        # from the panel, so we do not need to listen to the event topic
+        self._event_topics = {
+            panel.cfg.event_topic: panel for panel in self._panels
+            if panel.cfg.event_mode != 'direct'
+        }
+        self._control_topics = {
+            panel.cfg.control_topic: panel for panel in self._panels
+        }
+
+        def topics(panels, name):
+            if not wildcard:
+                return [getattr(panel.cfg, name) for panel in panels]
+            return sorted({panel.cfg.topic_filter(name) for panel in panels})
+
+        # Without a wildcard, the messages of a topic are all for the same
+        # panel, which can record the errors parsing them
+        def state(panels, topic):
+            return None if wildcard else panels[topic].state
+
+        for topic in topics(self._event_topics.values(), 'event_topic'):
+            MqttQolsysEventListener(
+                app=self,
+                namespace=cfg.mqtt_namespace,
+                topic=topic,
+                callback=self.mqtt_event_callback,
+                wildcard=wildcard,
+                state=state(self._event_topics, topic),
+            )
+
+        for topic in topics(self._control_topics.values(), 'control_topic'):
+            MqttQolsysControlListener(
+                app=self,
+                namespace=cfg.mqtt_namespace,
+                topic=topic,
+                callback=self.mqtt_control_callback,
+                wildcard=wildcard,
+                state=state(self._control_topics, topic),
+            )
+
+    def _route(self, panels: dict, topic: str):
+        if topic is None:
+            # Not listening with a wildcard, so there is only one panel
+            return next(iter(panels.values()), None)
+
+        panel = panels.get(topic)
+        if panel is None:
+            LOGGER.debug(f"No panel for topic '{topic}'; ignoring")
+        return panel
+
+    async def mqtt_event_callback(self, event: QolsysEvent,
+                                  topic: str = None):
+        panel = self._route(self._event_topics, topic)
+        if panel is not None:
+            await panel.mqtt_event_callback(event)
+
+    async def mqtt_control_callback(self, control: QolsysControl,
+                                    topic: str = None):
+        panel = self._route(self._control_topics, topic)
+        if panel is not None:
+            await panel.mqtt_control_callback(control)
+
+    def _init_metrics(self):
+        self._metrics = QolsysMetrics()
+
+        self._metric_publishes = self._metrics.counter(
+            'mqtt_publishes', 'Messages published to MQTT',
+            labelnames=('topic_class', ))
+
+        def queue_stat(name):
+            return lambda: (self._publish_queue.stats[name]
+                            if self._publish_queue else None)
+
+        self._metrics.gauge(
+            'mqtt_publish_queue_depth', 'Messages waiting in the publish '
+            'queue', function=queue_stat('depth'))
+        self._metrics.gauge(
+            'mqtt_publish_queue_max_depth', 'Maximum number of messages '
+            'that waited in the publish queue', function=queue_stat('max_depth'))
+        self._metrics.gauge(
+            'mqtt_publish_queue_coalesced', 'Messages of the publish queue '
+            'replaced by a newer message on the same topic',
+            function=queue_stat('coalesced'))
+        self._metrics.gauge(
+            'mqtt_publish_queue_last_flush_latency_seconds', 'Time between '
+            'the first message queued and the end of the last flush',
+            function=queue_stat('last_flush_latency'))
+
+    def _topic_class(self, topic):
+        if any(topic == panel.cfg.event_topic for panel in self._panels):
+            return 'event'
+        if topic == self._cfg.stats_topic:
+            return 'stats'
+
+        # The topics of the entities end with their type of message
+        suffix = topic.rsplit('/', 1)[-1]
+        if suffix in ('config', 'state', 'attributes', 'availability'):
+            return suffix
+
+        return 'other'
+
+    def _mqtt_publish(self, topic, **kwargs):
+        self._metric_publishes.inc(topic_class=self._topic_class(topic))
+        return self.mqtt_publish(topic=topic, **kwargs)
+
+    def publish_stats(self):
+        return self._mqtt_publish(
+            namespace=self._cfg.mqtt_namespace,
+            topic=self._cfg.stats_topic,
+            payload=codec.dumps(self._metrics.as_dict()),
+        )
+
+    async def _publish_stats_periodically(self):
+        while not self._is_terminated:
+            await asyncio.sleep(self._cfg.stats_interval)
+            try:
+                await self.publish_stats()
+            except:  # noqa: E722
+                LOGGER.exception('Error publishing the stats')
+
+    async def terminate(self):
+        LOGGER.info('Terminating')
+
+        if self._metrics_server:
+            await self._metrics_server.stop()
+
+        if not self._panels:
+            LOGGER.info('No state or factory, nothing to terminate.')
+            return
+
+        for panel in self._panels:
+            panel.terminate()
+
+        await self._publish_queue.flush()
+
+        self._is_terminated = True
+        LOGGER.info('Terminated')
@@ -0,0 +1,510 @@
+import asyncio
+import collections
+import itertools
+import logging
+import random
+import struct
+import time
+
+from mqtt.exceptions import MqttException
+from mqtt.utils import topic_matches
+from qolsys.metrics import QolsysMetrics
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+CONNECT = 1
+CONNACK = 2
+PUBLISH = 3
+PUBACK = 4
+SUBSCRIBE = 8
+SUBACK = 9
+UNSUBSCRIBE = 10
+UNSUBACK = 11
+PINGREQ = 12
+PINGRESP = 13
+DISCONNECT = 14
+
+
+class MqttProtocolException(MqttException):
+    pass
+
+
+class MqttConnectionRefusedException(MqttException):
+    pass
+
+
+MqttMessage = collections.namedtuple(
+    'MqttMessage', ['topic', 'payload', 'qos', 'retain'],
+    defaults=[0, False])
+
+
+def encode_length(length: int) -> bytes:
+    encoded = bytearray()
+    while True:
+        length, byte = divmod(length, 128)
+        encoded.append(byte | 0x80 if length else byte)
+        if not length:
+            return bytes(encoded)
+
+
+def encode_string(value) -> bytes:
+    if isinstance(value, str):
+        value = value.encode()
+    return struct.pack('!H', len(value)) + value
+
+
+def decode_string(body: bytes, pos: int = 0):
+    """
+    Return the string at `pos` in `body`, and the position after it
+    """
+    length, = struct.unpack_from('!H', body, pos)
+    pos += 2
+    return body[pos:pos + length].decode(), pos + length
+
+
+def encode_packet(packet_type: int, body: bytes = b'',
+                  flags: int = 0) -> bytes:
+    return bytes((packet_type << 4 | flags, )) + encode_length(len(body)) + body
+
+
+def encode_payload(payload) -> bytes:
+    if payload is None:
+        return b''
+    if isinstance(payload, bytes):
+        return payload
+    return str(payload).encode()
+
+
+def encode_publish(topic: str, payload: bytes, qos: int = 0,
+                   retain: bool = False, packet_id: int = None,
+                   dup: bool = False) -> bytes:
+    body = encode_string(topic)
+    if qos:
+        body += struct.pack('!H', packet_id)
+    flags = (dup << 3) | (qos << 1) | retain
+    return encode_packet(PUBLISH, body + payload, flags)
+
+
+def decode_publish(flags: int, body: bytes):
+    """
+    Return the topic, payload, QoS, retain flag and packet id of the body
+    of a PUBLISH packet
+    """
+    qos = (flags >> 1) & 0x3
+    topic, pos = decode_string(body)
+    packet_id = None
+    if qos:
+        packet_id, = struct.unpack_from('!H', body, pos)
+        pos += 2
+    return topic, body[pos:], qos, bool(flags & 0x1), packet_id
+
+
+async def read_packet(reader: asyncio.StreamReader):
+    """
+    Read a packet, and return its type, the flags of its fixed header and
+    its body
+    """
+    header, = await reader.readexactly(1)
+
+    length = 0
+    for shift in range(0, 28, 7):
+        byte, = await reader.readexactly(1)
+        length |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            break
+    else:
+        raise MqttProtocolException('Malformed remaining length')
+
+    body = await reader.readexactly(length) if length else b''
+    return header >> 4, header & 0x0f, body
+
+
+class MqttClient(object):
+    """
+    Minimal MQTT 3.1.1 client, keeping a persistent connection to the
+    broker: it reconnects with a capped exponential backoff, subscribes
+    again to its topic filters and publishes the birth message on each
+    connection.
+
+    Publishes are pipelined: they are written without waiting for the
+    acknowledgement of the previous ones, and the future they return is
+    done once written for QoS 0, or once acknowledged for QoS 1. The QoS 1
+    messages not acknowledged are sent again after a reconnection, and the
+    QoS 0 messages published while disconnected are buffered, up to
+    `max_buffered` of them, until the next connection. QoS 2 is not
+    supported, and downgraded to QoS 1.
+
+    Messages received on the subscribed topic filters are given to
+    `on_message` as MqttMessage objects, in the order they are received.
+    """
+
+    _CONNACK_ERRORS = {
+        1: 'unacceptable protocol version',
+        2: 'identifier rejected',
+        3: 'server unavailable',
+        4: 'bad user name or password',
+        5: 'not authorized',
+    }
+
+    def __init__(self, host: str, port: int = None, client_id: str = None,
+                 username: str = None, password: str = None,
+                 keepalive: int = None, will: MqttMessage = None,
+                 birth: MqttMessage = None, on_message: callable = None,
+                 connect_timeout: float = None, max_buffered: int = None,
+                 metrics: QolsysMetrics = None, logger=None) -> None:
+        self._host = host
+        self._port = port or 1883
+        self._client_id = client_id or ''
+        self._username = username
+        self._password = password
+        self._keepalive = 60 if keepalive is None else keepalive
+        self._will = will
+        self._birth = birth
+        self._on_message = on_message
+        self._connect_timeout = connect_timeout or 10
+        self._logger = logger or LOGGER
+
+        self._running = False
+        self._stopped = False
+        self._task = None
+        self._ping_task = None
+        self._drain_task = None
+        self._reader = None
+        self._writer = None
+        self._connected = asyncio.Event()
+        self._reconnect_attempts = 0
+        self._last_read_at = None
+        self._last_write_at = None
+
+        # Topic filters to subscribe to on each connection, with their QoS
+        self._subscriptions = {}
+
+        self._packet_ids = itertools.cycle(range(1, 0x10000))
+        # QoS 1 messages waiting for their PUBACK, by packet id, in the
+        # order they were published
+        self._inflight = {}
+        # QoS 0 messages published while disconnected
+        self._buffered = collections.deque(maxlen=max_buffered or 10000)
+        # Futures to resolve once the transport is drained
+        self._written = []
+
+        metrics = metrics or QolsysMetrics()
+        self._metric_connections = metrics.counter(
+            'mqtt_client_connections', 'Connections to the MQTT broker')
+        self._metric_received = metrics.counter(
+            'mqtt_client_received', 'Messages received from the MQTT broker')
+        metrics.gauge(
+            'mqtt_client_inflight', 'QoS 1 messages waiting for their '
+            'acknowledgement by the MQTT broker',
+            function=lambda: len(self._inflight))
+        metrics.gauge(
+            'mqtt_client_buffered', 'Messages waiting for a connection to '
+            'the MQTT broker', function=lambda: len(self._buffered))
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    async def wait_connected(self, timeout: float = None):
+        await asyncio.wait_for(self._connected.wait(), timeout)
+
+    def start(self):
+        self._running = True
+        self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self, publish_will: bool = True):
+        """
+        Disconnect from the broker; as a clean disconnection does not make
+        the broker publish the will message, it is published first unless
+        `publish_will` is False
+        """
+        self._running = False
+
+        if self._writer is not None:
+            if publish_will and self._will is not None:
+                self.publish(*self._will)
+            try:
+                self._writer.write(encode_packet(DISCONNECT))
+                await self._writer.drain()
+            except (ConnectionError, OSError):
+                pass
+            self._close()
+        self._stopped = True
+
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        exception = ConnectionError('MQTT client stopped')
+        for _, future in self._inflight.values():
+            if not future.done():
+                future.set_exception(exception)
+        self._inflight.clear()
+        for _, future in self._buffered:
+            if not future.done():
+                future.set_exception(exception)
+        self._buffered.clear()
+
+    def publish(self, topic: str, payload=None, qos: int = 0,
+                retain: bool = False) -> asyncio.Future:
+        future = asyncio.get_event_loop().create_future()
+        if self._stopped:
+            future.set_exception(ConnectionError('MQTT client stopped'))
+            return future
+
+        qos = min(int(qos or 0), 1)
+        payload = encode_payload(payload)
+
+        if qos:
+            packet_id = next(self._packet_ids)
+            message = MqttMessage(topic, payload, qos, retain)
+            self._inflight[packet_id] = (message, future)
+            if self._writer is not None:
+                self._write(encode_publish(topic, payload, qos, retain,
+                                           packet_id))
+            return future
+
+        packet = encode_publish(topic, payload, retain=retain)
+        if self._writer is None:
+            if len(self._buffered) == self._buffered.maxlen:
+                _, dropped = self._buffered.popleft()
+                dropped.set_exception(ConnectionError(
+                    'Message dropped while disconnected from the broker'))
+            self._buffered.append((packet, future))
+        else:
+            self._write(packet, future)
+
+        return future
+
+    def subscribe(self, topic_filter: str, qos: int = 0):
+        qos = min(int(qos or 0), 1)
+        self._subscriptions[topic_filter] = qos
+        if self._writer is not None:
+            self._write(self._subscribe_packet({topic_filter: qos}))
+
+    def unsubscribe(self, topic_filter: str):
+        if self._subscriptions.pop(topic_filter, None) is None:
+            return
+
+        if self._writer is not None:
+            body = struct.pack('!H', next(self._packet_ids)) + \
+                encode_string(topic_filter)
+            self._write(encode_packet(UNSUBSCRIBE, body, 0x2))
+
+    def matches(self, topic: str):
+        return any(topic_matches(topic_filter, topic)
+                   for topic_filter in self._subscriptions)
+
+    def _subscribe_packet(self, subscriptions: dict) -> bytes:
+        body = struct.pack('!H', next(self._packet_ids))
+        for topic_filter, qos in subscriptions.items():
+            body += encode_string(topic_filter) + bytes((qos, ))
+        return encode_packet(SUBSCRIBE, body, 0x2)
+
+    def _connect_packet(self) -> bytes:
+        flags = 0x2  # Clean session
+        payload = encode_string(self._client_id)
+
+        if self._will is not None:
+            flags |= 0x4 | (min(self._will.qos, 1) << 3) | \
+                (bool(self._will.retain) << 5)
+            payload += encode_string(self._will.topic) + \
+                encode_string(encode_payload(self._will.payload))
+        if self._username is not None:
+            flags |= 0x80
+            payload += encode_string(self._username)
+            if self._password is not None:
+                flags |= 0x40
+                payload += encode_string(self._password)
+
+        body = encode_string('MQTT') + bytes((4, flags)) + \
+            struct.pack('!H', self._keepalive) + payload
+        return encode_packet(CONNECT, body)
+
+    def _write(self, packet: bytes, future: asyncio.Future = None):
+        self._writer.write(packet)
+        self._last_write_at = time.monotonic()
+        if future is not None:
+            self._written.append(future)
+            if self._drain_task is None:
+                self._drain_task = asyncio.get_event_loop().create_task(
+                    self._drain())
+
+    async def _drain(self):
+        # Resolve the futures of the messages written so far once the
+        # transport accepted them, in a single drain for all of them
+        try:
+            await self._writer.drain()
+        except (ConnectionError, OSError, AttributeError):
+            pass
+        finally:
+            self._drain_task = None
+
+        written, self._written = self._written, []
+        for future in written:
+            if not future.done():
+                future.set_result(None)
+
+    def _backoff(self):
+        # Capped exponential backoff, with jitter so that clients do not
+        # all reconnect at the same time after the broker restarts
+        delay = min(2 ** (self._reconnect_attempts - 1), 60)
+        return random.uniform(delay / 2, delay)
+
+    async def _run(self):
+        while self._running:
+            try:
+                await self._connect()
+                self._reconnect_attempts = 0
+                await self._read_loop()
+            except asyncio.CancelledError:
+                raise
+            except (ConnectionError, OSError, asyncio.IncompleteReadError,
+                    asyncio.TimeoutError, MqttException) as e:
+                if not self._running:
+                    break
+                self._logger.warning(
+                    f'Connection to the MQTT broker {self._host}:'
+                    f'{self._port} lost: {e!r}')
+            finally:
+                self._close()
+
+            if self._running:
+                self._reconnect_attempts += 1
+                delay = self._backoff()
+                self._logger.info(f'Reconnecting to the MQTT broker in '
+                                  f'{delay:.1f} second(s)')
+                await asyncio.sleep(delay)
+
+    async def _connect(self):
+        self._reader, writer = await asyncio.wait_for(
+            asyncio.open_connection(self._host, self._port),
+            self._connect_timeout)
+
+        writer.write(self._connect_packet())
+        packet_type, _, body = await asyncio.wait_for(
+            read_packet(self._reader), self._connect_timeout)
+        if packet_type != CONNACK or len(body) != 2:
+            writer.close()
+            raise MqttProtocolException(
+                f'Expected CONNACK, received packet type {packet_type}')
+        if body[1] != 0:
+            writer.close()
+            raise MqttConnectionRefusedException(
+                'Connection refused by the MQTT broker: ' +
+                self._CONNACK_ERRORS.get(body[1], f'error {body[1]}'))
+
+        self._writer = writer
+        self._last_read_at = self._last_write_at = time.monotonic()
+        self._metric_connections.inc()
+        self._logger.info(f'Connected to the MQTT broker {self._host}:'
+                          f'{self._port}')
+
+        if self._subscriptions:
+            self._write(self._subscribe_packet(self._subscriptions))
+
+        if self._birth is not None:
+            self.publish(*self._birth)
+
+        # Send again what was not acknowledged, and what was published
+        # while disconnected, in order
+        for packet_id, (message, _) in self._inflight.items():
+            self._write(encode_publish(message.topic, message.payload,
+                                       message.qos, message.retain,
+                                       packet_id, dup=True))
+        while self._buffered:
+            self._write(*self._buffered.popleft())
+
+        if self._keepalive:
+            self._ping_task = asyncio.get_event_loop().create_task(
+                self._ping())
+
+        self._connected.set()
+
+    async def _read_loop(self):
+        while True:
+            packet_type, flags, body = await read_packet(self._reader)
+            self._last_read_at = time.monotonic()
+
+            if packet_type == PUBLISH:
+                topic, payload, qos, retain, packet_id = \
+                    decode_publish(flags, body)
+                if qos:
+                    self._write(encode_packet(PUBACK,
+                                              struct.pack('!H', packet_id)))
+
+                self._metric_received.inc()
+                if self._on_message is not None:
+                    try:
+                        self._on_message(
+                            MqttMessage(topic, payload, qos, retain))
+                    except:  # noqa: E722
+                        self._logger.exception(
+                            f"Error handling message on topic '{topic}'")
+            elif packet_type == PUBACK:
+                packet_id, = struct.unpack('!H', body)
+                _, future = self._inflight.pop(packet_id, (None, None))
+                if future is not None and not future.done():
+                    future.set_result(None)
+            elif packet_type == SUBACK:
+                if b'\x80' in body[2:]:
+                    self._logger.error('Subscription refused by the MQTT '
+                                       'broker')
+            elif packet_type in (UNSUBACK, PINGRESP):
+                pass
+            else:
+                raise MqttProtocolException(
+                    f'Unexpected packet type {packet_type}')
+
+    async def _ping(self):
+        # Send a PINGREQ when nothing was sent for half the keep alive
+        # period, as the broker expects a packet from the client within the
+        # keep alive period, or when nothing was received for half the keep
+        # alive period, for the broker to answer; consider the connection
+        # lost if still nothing was received after the keep alive period
+        interval = self._keepalive / 2
+        delay = interval
+        while self._writer is not None:
+            await asyncio.sleep(delay)
+            if self._writer is None:
+                return
+
+            now = time.monotonic()
+            idle = now - self._last_read_at
+            if idle >= self._keepalive + interval:
+                self._logger.warning('No answer from the MQTT broker, '
+                                     'closing the connection')
+                self._writer.close()
+                return
+            if idle >= interval or now - self._last_write_at >= interval:
+                self._write(encode_packet(PINGREQ))
+
+            # Check again when half the keep alive period passed since the
+            # last packet sent
+            delay = max(interval - (time.monotonic() - self._last_write_at),
+                        0.01)
+
+    def _close(self):
+        self._connected.clear()
+
+        if self._ping_task is not None:
+            self._ping_task.cancel()
+            self._ping_task = None
+
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        self._reader = None
+
+        # The messages written to the closed connection might not have
+        # been sent; only QoS 1 messages are sent again
+        written, self._written = self._written, []
+        for future in written:
+            if not future.done():
+                future.set_result(None)
@@ -1,16 +1,19 @@
 from datetime import datetime, timezone
 
+from qolsys.exceptions import QolsysException
+
 
 class MqttException(Exception):
-    STATE = None
+    STATE = QolsysException.STATE
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._at = datetime.now(timezone.utc).isoformat()
 
-        if self.STATE:
-            self.STATE.last_exception = self
+        state = self.STATE.get()
+        if state is not None:
+            state.last_exception = self
 
     @property
     def at(self):
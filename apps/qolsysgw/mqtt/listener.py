@@ -1,12 +1,11 @@
 import json
 import logging
 
-from appdaemon.plugins.mqtt.mqttapi import Mqtt
-
 from qolsys.control import QolsysControl
 from qolsys.events import QolsysEvent
 from qolsys.exceptions import UnknownQolsysControlException
 from qolsys.exceptions import UnknownQolsysEventException
+from qolsys.exceptions import recorded_on
 from qolsys.utils import defaultLoggerCallback
 
 
@@ -14,19 +13,44 @@ LOGGER = logging.getLogger(__name__)
 
 
 class MqttListener(object):
-    def __init__(self, app: Mqtt, namespace: str, topic: str,
-                 callback: callable = None, logger=None):
+    """
+    Listen to the messages of `topic`; if `wildcard` is set, `topic` is a
+    topic filter that can contain wildcards, and the callback is also given
+    the topic of each message so it can be routed. The exceptions raised
+    while handling the messages are recorded on `state`, if given.
+    """
+
+    def __init__(self, app, namespace: str, topic: str,
+                 callback: callable = None, logger=None,
+                 wildcard: bool = False, state=None):
         self._callback = callback or defaultLoggerCallback
         self._logger = logger or LOGGER
+        self._wildcard = wildcard
+        self._state = state
 
         app.mqtt_subscribe(topic, namespace=namespace)
-        app.listen_event(self.event_callback, event='MQTT_MESSAGE',
-                         topic=topic, namespace=namespace)
+        if wildcard:
+            app.listen_event(self.event_callback, event='MQTT_MESSAGE',
+                             wildcard=topic, namespace=namespace)
+        else:
+            app.listen_event(self.event_callback, event='MQTT_MESSAGE',
+                             topic=topic, namespace=namespace)
+
+    async def event_callback(self, event_name, data, kwargs):
+        with recorded_on(self._state):
+            await self._event_callback(event_name, data, kwargs)
+
+    async def _call(self, obj, data):
+        if self._wildcard:
+            await self._callback(obj, topic=data.get('topic'))
+        else:
+            await self._callback(obj)
 
 
 class MqttQolsysEventListener(MqttListener):
-    async def event_callback(self, event_name, data, kwargs):
-        self._logger.debug(f'Received {event_name} with data={data} and kwargs={kwargs}')
+    async def _event_callback(self, event_name, data, kwargs):
+        self._logger.debug('Received %s with data=%s and kwargs=%s',
+                           event_name, data, kwargs)
 
         event_str = data.get('payload')
         if not event_str:
@@ -44,15 +68,15 @@ class MqttQolsysEventListener(MqttListener):
             return
 
         try:
-            await self._callback(event)
+            await self._call(event, data)
         except:  # noqa: E722
             self._logger.exception(f'Error calling callback for event: {event}')
 
 
 class MqttQolsysControlListener(MqttListener):
-    async def event_callback(self, event_name, data, kwargs):
-        self._logger.debug(f'Received {event_name} with data={data} '
-                           f'and kwargs={kwargs}')
+    async def _event_callback(self, event_name, data, kwargs):
+        self._logger.debug('Received %s with data=%s and kwargs=%s',
+                           event_name, data, kwargs)
 
         control_str = data.get('payload')
         if not control_str:
@@ -70,6 +94,6 @@ class MqttQolsysControlListener(MqttListener):
             return
 
         try:
-            await self._callback(control)
+            await self._call(control, data)
         except:  # noqa: E722
             self._logger.exception(f'Error calling callback for control: {control}')
@@ -0,0 +1,110 @@
+import asyncio
+import inspect
+import itertools
+import logging
+import time
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class MqttPublishQueue(object):
+    """
+    Queue sitting between the MQTT wrappers and the actual MQTT publish
+    function. Messages published to the same topic while waiting to be
+    flushed are coalesced (the last value wins, at the position of the
+    first one), and the queue is flushed in batches of bounded size.
+    """
+
+    def __init__(self, mqtt_publish: callable, window: float = 0,
+                 batch_size: int = 50, logger=None) -> None:
+        self._mqtt_publish = mqtt_publish
+        self._window = window or 0
+        self._batch_size = batch_size or 50
+        self._logger = logger or LOGGER
+
+        self._pending = {}
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._first_queued_at = None
+
+        self._published = 0
+        self._coalesced = 0
+        self._max_depth = 0
+        self._flushes = 0
+        self._last_flush_latency = None
+        self._total_flush_latency = 0
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    @property
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'max_depth': self._max_depth,
+            'published': self._published,
+            'coalesced': self._coalesced,
+            'flushes': self._flushes,
+            'last_flush_latency': self._last_flush_latency,
+            'avg_flush_latency': (self._total_flush_latency / self._flushes
+                                  if self._flushes else None),
+        }
+
+    def publish(self, topic: str, **kwargs):
+        key = (kwargs.get('namespace'), topic)
+        if key in self._pending:
+            self._coalesced += 1
+        elif not self._pending:
+            self._first_queued_at = time.monotonic()
+
+        self._pending[key] = {'topic': topic, **kwargs}
+        self._max_depth = max(self._max_depth, len(self._pending))
+
+        if self._flush_task is None:
+            self._flush_task = asyncio.get_event_loop().create_task(
+                self._flush_after_window())
+
+    async def _flush_after_window(self):
+        try:
+            await asyncio.sleep(self._window)
+            await self.flush()
+        finally:
+            self._flush_task = None
+
+    async def flush(self):
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            while self._pending:
+                batch = [
+                    self._pending.pop(key)
+                    for key in list(itertools.islice(self._pending,
+                                                     self._batch_size))
+                ]
+
+                results = []
+                for message in batch:
+                    try:
+                        results.append(self._mqtt_publish(**message))
+                    except:  # noqa: E722
+                        self._logger.exception(
+                            f"Error publishing to topic '{message['topic']}'")
+
+                # Wait for the batch to be published before publishing
+                # the next one, so we do not flood the MQTT client
+                awaitables = [r for r in results if inspect.isawaitable(r)]
+                if awaitables:
+                    for r in await asyncio.gather(*awaitables,
+                                                  return_exceptions=True):
+                        if isinstance(r, Exception):
+                            self._logger.error(f'Error publishing: {r!r}')
+
+                self._published += len(batch)
+
+            latency = time.monotonic() - self._first_queued_at
+            self._flushes += 1
+            self._last_flush_latency = latency
+            self._total_flush_latency += latency
@@ -1,12 +1,15 @@
-import json
+import asyncio
 import logging
 import posixpath
+import time
 
 from mqtt.exceptions import UnknownDeviceClassException
 from mqtt.exceptions import UnknownMqttWrapperException
 from mqtt.utils import normalize_name_to_id
 
+from qolsys import codec
 from qolsys.config import QolsysGatewayConfig
+from qolsys.metrics import QolsysMetrics
 from qolsys.partition import QolsysPartition
 from qolsys.sensors import QolsysSensor
 from qolsys.sensors import QolsysSensorAuxiliaryPendant
@@ -31,35 +34,160 @@ from qolsys.sensors import QolsysSensorWater
 from qolsys.sensors import _QolsysSensorWithoutUpdates
 from qolsys.state import QolsysState
 from qolsys.utils import defaultLoggerCallback
-from qolsys.utils import find_subclass
 
 
 LOGGER = logging.getLogger(__name__)
 
 
+class MqttSensorDebouncer(object):
+    """
+    Limit the state publishes of each sensor to one per debounce delay: the
+    first change is published right away, and the changes that follow
+    within the delay are folded into a single publish of the state of the
+    sensor at the end of the delay, so the last state is always published
+    """
+
+    # Sensors reporting a danger are always published right away
+    EXEMPT_TYPES = (
+        QolsysSensorCODetector,
+        QolsysSensorSmokeDetector,
+        QolsysSensorWater,
+    )
+
+    def __init__(self, debounce: dict, publish: callable, metrics=None,
+                 logger=None):
+        self._debounce = debounce
+        self._publish = publish
+        self._logger = logger or LOGGER
+
+        # Delay by sensor class, resolved on first use
+        self._delays = {}
+        # Time of the last publish, and pending trailing publish, by sensor
+        self._published_at = {}
+        self._pending = {}
+
+        metrics = metrics or QolsysMetrics()
+        self._metric_suppressed = metrics.counter(
+            'sensor_publishes_suppressed', 'Sensor state publishes folded '
+            'into a later publish by the debounce')
+        metrics.gauge(
+            'sensor_publishes_pending', 'Sensor state publishes waiting for '
+            'the end of their debounce delay',
+            function=lambda: len(self._pending))
+
+    def delay(self, sensor: QolsysSensor) -> float:
+        klass = type(sensor)
+        delay = self._delays.get(klass)
+        if delay is None:
+            delay = self._delays[klass] = self._resolve_delay(klass)
+        return delay
+
+    def _resolve_delay(self, klass) -> float:
+        if issubclass(klass, self.EXEMPT_TYPES):
+            return 0
+
+        # Use the delay of the closest sensor type configured, so that a
+        # panel motion sensor uses the delay of the motion sensors
+        for base in klass.__mro__:
+            sensor_type = base.__dict__.get('_SENSOR_TYPE')
+            if sensor_type in self._debounce:
+                return self._debounce[sensor_type]
+        return self._debounce.get('default', 0)
+
+    @staticmethod
+    def _key(sensor: QolsysSensor):
+        # Sensor ids are not unique, sensors sharing an id are told apart
+        # by their zone id, as for their unique id
+        return (sensor.partition_id, sensor.zone_id)
+
+    def update(self, sensor: QolsysSensor):
+        if not self._debounce:
+            self._publish(sensor)
+            return
+
+        delay = self.delay(sensor)
+        if not delay:
+            self._publish(sensor)
+            return
+
+        key = self._key(sensor)
+        pending = self._pending.get(key)
+        if pending is not None:
+            # The trailing publish will publish the state of the sensor at
+            # that time, which includes this change
+            pending[1] = sensor
+            self._metric_suppressed.inc()
+            return
+
+        now = time.monotonic()
+        published_at = self._published_at.get(key)
+        if published_at is None or now - published_at >= delay:
+            self._published_at[key] = now
+            self._publish(sensor)
+            return
+
+        handle = asyncio.get_running_loop().call_later(
+            published_at + delay - now, self._publish_pending, key)
+        self._pending[key] = [handle, sensor]
+
+    def _publish_pending(self, key):
+        _, sensor = self._pending.pop(key)
+        self._published_at[key] = time.monotonic()
+        try:
+            self._publish(sensor)
+        except:  # noqa: E722
+            self._logger.exception(f"Error publishing state of sensor "
+                                   f"'{sensor.id}' ({sensor.name})")
+
+    def reset(self, sensor: QolsysSensor):
+        # The sensor is configured again, which publishes its state, or is
+        # removed; either way the trailing publish is not needed anymore
+        key = self._key(sensor)
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending[0].cancel()
+        self._published_at.pop(key, None)
+
+    def flush(self):
+        # Publish the pending states right away, e.g. before terminating
+        for key in list(self._pending):
+            self._pending[key][0].cancel()
+            self._publish_pending(key)
+
+
 class MqttUpdater(object):
     def __init__(self, state: QolsysState, factory: 'MqttWrapperFactory',
-                 callback: callable = None, logger=None):
+                 callback: callable = None, logger=None,
+                 debounce: dict = None, activity_attributes: bool = False,
+                 metrics=None):
         self._factory = factory
         self._callback = callback or defaultLoggerCallback
         self._logger = logger or LOGGER
+        self._activity_attributes = activity_attributes
+        self._debouncer = MqttSensorDebouncer(
+            debounce=debounce,
+            publish=self._publish_sensor_state,
+            metrics=metrics,
+            logger=self._logger,
+        )
 
         state.register(self, callback=self._state_update)
 
+    def flush(self):
+        self._debouncer.flush()
+
     def _state_update(self, state: QolsysState, change, prev_value=None, new_value=None):
-        self._logger.debug(f"Received update from state for CHANGE={change}")
+        self._logger.debug('Received update from state for CHANGE=%s', change)
 
         if change == QolsysState.NOTIFY_UPDATE_PARTITIONS:
             # The partitions have been updated, make sure we are registered for
             # all those partitions
             for partition in state.partitions:
-                partition.register(self, callback=self._partition_update)
-                self._factory.wrap(partition).configure()
-                # The partition might already have sensors on it, so register
-                # for each sensor individually too
-                for sensor in partition.sensors:
-                    sensor.register(self, callback=self._sensor_update)
-                    self._factory.wrap(sensor).configure(partition=partition)
+                self._add_partition(partition)
+        elif change == QolsysState.NOTIFY_ADD_PARTITION:
+            self._add_partition(new_value)
+        elif change == QolsysState.NOTIFY_REMOVE_PARTITION:
+            self._remove_partition(prev_value)
         elif change == QolsysState.NOTIFY_UPDATE_ERROR:
             # An error has happened on qolsysgw, so we want to update the
             # state sensor
@@ -67,40 +195,101 @@ class MqttUpdater(object):
             wrapped_state.update_state()
             wrapped_state.update_attributes()
 
+    def _add_partition(self, partition: QolsysPartition):
+        partition.register(self, callback=self._partition_update)
+        self._factory.wrap(partition).configure()
+        # The partition might already have sensors on it, so register
+        # for each sensor individually too
+        for sensor in partition.sensors:
+            self._add_sensor(partition, sensor)
+
+    def _remove_partition(self, partition: QolsysPartition):
+        for sensor in partition.sensors:
+            self._remove_sensor(sensor)
+
+        partition.unregister(self)
+        self._factory.wrap(partition).set_unavailable()
+
+    def _add_sensor(self, partition: QolsysPartition, sensor: QolsysSensor):
+        sensor.register(self, callback=self._sensor_update)
+        self._debouncer.reset(sensor)
+        self._factory.wrap(sensor).configure(partition=partition)
+
+    def _remove_sensor(self, sensor: QolsysSensor):
+        sensor.unregister(self)
+        self._debouncer.reset(sensor)
+        self._factory.wrap(sensor).set_unavailable()
+
+    def _publish_sensor_state(self, sensor: QolsysSensor):
+        wrapped_sensor = self._factory.wrap(sensor)
+        wrapped_sensor.update_state()
+        if self._activity_attributes:
+            # The activity statistics changed with the status
+            wrapped_sensor.update_attributes()
+
     def _partition_update(self, partition: QolsysPartition, change, prev_value=None, new_value=None):
-        self._logger.debug(f"Received update from partition "
-                           f"'{partition.name}' for CHANGE={change}, from "
-                           f"prev_value={prev_value} to new_value={new_value}")
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(f"Received update from partition "
+                               f"'{partition.name}' for CHANGE={change}, from "
+                               f"prev_value={prev_value} to new_value={new_value}")
 
         if change == QolsysPartition.NOTIFY_ADD_SENSOR:
-            sensor = new_value
-            sensor.register(self, callback=self._sensor_update)
-            self._factory.wrap(sensor).configure(partition=partition)
+            self._add_sensor(partition, new_value)
+        elif change == QolsysPartition.NOTIFY_REMOVE_SENSOR:
+            self._remove_sensor(prev_value)
         elif change == QolsysPartition.NOTIFY_UPDATE_STATUS:
             self._factory.wrap(partition).update_state()
-        elif change == QolsysPartition.NOTIFY_UPDATE_SECURE_ARM:
+        elif change == QolsysPartition.NOTIFY_UPDATE_SECURE_ARM or \
+                change == QolsysPartition.NOTIFY_UPDATE_NAME:
             self._factory.wrap(partition).configure()
         elif change == QolsysPartition.NOTIFY_UPDATE_ALARM_TYPE or \
                 change == QolsysPartition.NOTIFY_UPDATE_ATTRIBUTES:
             self._factory.wrap(partition).update_attributes()
 
-    def _sensor_update(self, sensor: QolsysSensor, change, prev_value=None, new_value=None):
-        self._logger.debug(f"Received update from sensor '{sensor.name}' for "
-                           f"CHANGE={change}, from prev_value={prev_value} to "
-                           f"new_value={new_value}")
+    def _sensor_update(self, sensor: QolsysSensor, change, prev_value=None,
+                       new_value=None, changes=None):
+        if change == QolsysSensor.NOTIFY_BATCH:
+            # Handle each kind of change only once, as the wrapper will
+            # publish the current state of the sensor anyway
+            unique_changes = {c['change']: c for c in changes}
+            for c in unique_changes.values():
+                self._sensor_update(sensor, **c)
+            return
+
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug(f"Received update from sensor '{sensor.name}' for "
+                               f"CHANGE={change}, from prev_value={prev_value} to "
+                               f"new_value={new_value}")
 
         if change == QolsysSensor.NOTIFY_UPDATE_STATUS:
-            self._factory.wrap(sensor).update_state()
+            self._debouncer.update(sensor)
         elif change == QolsysSensor.NOTIFY_UPDATE_ATTRIBUTES:
             self._factory.wrap(sensor).update_attributes()
 
 
 class MqttWrapper(object):
 
+    # The type of object this wrapper class is able to wrap
+    _WRAPPED_TYPE = None
+
+    _REGISTRY = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if '_WRAPPED_TYPE' in cls.__dict__:
+            MqttWrapper._REGISTRY[cls._WRAPPED_TYPE] = cls
+
     def __init__(self, mqtt_publish: callable, cfg: QolsysGatewayConfig,
-                 mqtt_plugin_cfg, session_token: str) -> None:
+                 mqtt_plugin_cfg, session_token: str,
+                 configure_cache: 'MqttConfigureCache' = None,
+                 node_id: str = None) -> None:
         self._mqtt_publish = mqtt_publish
         self._cfg = cfg
+        self._configure_cache = configure_cache
+        # Level added to the topics of the entities whose names are only
+        # unique within a panel, when the gateway serves several panels
+        self._node_id = node_id
 
         self._birth_topic = mqtt_plugin_cfg.get('birth_topic')
         self._will_topic = mqtt_plugin_cfg.get('will_topic')
@@ -206,14 +395,46 @@ class MqttWrapper(object):
 
         return availability
 
-    def configure(self, **kwargs):
-        self._mqtt_publish(
-            namespace=self._cfg.mqtt_namespace,
-            topic=self.config_topic,
-            retain=True,
-            payload=json.dumps(self.configure_payload(**kwargs)),
+    def configure_cache_key(self, **kwargs):
+        # The values the configuration payload depends on, other than the
+        # configuration of the gateway; None if the payload cannot be cached
+        return None
+
+    def _configure_topic_and_payload(self, **kwargs):
+        key = None
+        if self._configure_cache is not None:
+            key = self.configure_cache_key(**kwargs)
+
+        if key is not None:
+            key = (type(self), key)
+            cached = self._configure_cache.get(key)
+            if cached is not None:
+                return cached
+
+        topic_and_payload = (
+            self.config_topic,
+            codec.dumps(self.configure_payload(**kwargs)),
         )
 
+        if key is not None:
+            self._configure_cache.set(key, topic_and_payload)
+
+        return topic_and_payload
+
+    def configure(self, **kwargs):
+        topic, payload = self._configure_topic_and_payload(**kwargs)
+
+        # The configuration is retained, so there is no need to publish it
+        # again if it did not change since the last time we published it
+        if self._configure_cache is None or \
+                self._configure_cache.should_publish(topic, payload):
+            self._mqtt_publish(
+                namespace=self._cfg.mqtt_namespace,
+                topic=topic,
+                retain=True,
+                payload=payload,
+            )
+
         self.set_available()
         self.update_state()
         self.update_attributes()
@@ -242,6 +463,9 @@ class MqttWrapper(object):
 
 
 class MqttWrapperQolsysState(MqttWrapper):
+
+    _WRAPPED_TYPE = QolsysState
+
     def __init__(self, state: QolsysState, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
@@ -255,6 +479,9 @@ class MqttWrapperQolsysState(MqttWrapper):
     def entity_id(self):
         return f'{self.name}_last_error'
 
+    def configure_cache_key(self, **kwargs):
+        return ()
+
     @property
     def availability_topic(self):
         return self.device_availability_topic
@@ -293,7 +520,7 @@ class MqttWrapperQolsysState(MqttWrapper):
             namespace=self._cfg.mqtt_namespace,
             topic=self.attributes_topic,
             retain=self._mqtt_retain,
-            payload=json.dumps({
+            payload=codec.dumps({
                 'type': exc_type,
                 'desc': exc_desc,
             }),
@@ -312,6 +539,8 @@ class MqttWrapperQolsysState(MqttWrapper):
 
 class MqttWrapperQolsysPartition(MqttWrapper):
 
+    _WRAPPED_TYPE = QolsysPartition
+
     QOLSYS_TO_HA_STATUS = {
         'DISARM': 'disarmed',
         'ARM_STAY': 'armed_home',
@@ -352,6 +581,13 @@ class MqttWrapperQolsysPartition(MqttWrapper):
             self.entity_id,
         )
 
+    def configure_cache_key(self, **kwargs):
+        return (
+            self._partition.id,
+            self._partition.name,
+            self._partition.secure_arm,
+        )
+
     def configure_payload(self, **kwargs):
         command_template = {
             'partition_id': str(self._partition.id),
@@ -376,7 +612,7 @@ class MqttWrapperQolsysPartition(MqttWrapper):
             'code_disarm_required': self._cfg.code_disarm_required,
             'code_trigger_required': self._cfg.code_trigger_required or secure_arm,
             'command_topic': self._cfg.control_topic,
-            'command_template': json.dumps(command_template),
+            'command_template': codec.dumps(command_template),
             'availability_mode': 'all',
             'availability': self.configure_availability,
             'json_attributes_topic': self.attributes_topic,
@@ -408,7 +644,7 @@ class MqttWrapperQolsysPartition(MqttWrapper):
             namespace=self._cfg.mqtt_namespace,
             topic=self.attributes_topic,
             retain=self._mqtt_retain,
-            payload=json.dumps({
+            payload=codec.dumps({
                 'secure_arm': self._partition.secure_arm,
                 'alarm_type': self._partition.alarm_type,
                 'last_error_type': self._partition.last_error_type,
@@ -429,6 +665,8 @@ class MqttWrapperQolsysPartition(MqttWrapper):
 
 class MqttWrapperQolsysSensor(MqttWrapper):
 
+    _WRAPPED_TYPE = QolsysSensor
+
     PAYLOAD_ON = 'Open'
     PAYLOAD_OFF = 'Closed'
 
@@ -482,11 +720,26 @@ class MqttWrapperQolsysSensor(MqttWrapper):
 
     @property
     def topic_path(self):
+        if self._node_id:
+            return posixpath.join(
+                'binary_sensor',
+                self._node_id,
+                self.entity_id,
+            )
+
         return posixpath.join(
             'binary_sensor',
             self.entity_id,
         )
 
+    def configure_cache_key(self, partition: QolsysPartition, **kwargs):
+        return (
+            type(self._sensor),
+            self._sensor.id,
+            self._sensor.name,
+            self._sensor.unique_id,
+        )
+
     def configure_payload(self, partition: QolsysPartition, **kwargs):
         payload = {
             'name': self.name,
@@ -511,6 +764,11 @@ class MqttWrapperQolsysSensor(MqttWrapper):
                                f"s{normalize_name_to_id(self._sensor.unique_id)}"
         payload['device'] = self.device_payload
 
+        # Zones of different panels can have the same name, so their entity
+        # ids also need the panel
+        if self._node_id:
+            payload['object_id'] = f'{self._node_id}_{self.entity_id}'
+
         return payload
 
     def update_attributes(self):
@@ -518,12 +776,14 @@ class MqttWrapperQolsysSensor(MqttWrapper):
             k: getattr(self._sensor, k)
             for k in self._sensor.ATTRIBUTES
         }
+        if self._cfg.sensor_activity_attributes:
+            attributes.update(self._sensor.activity.as_dict())
 
         self._mqtt_publish(
             namespace=self._cfg.mqtt_namespace,
             topic=self.attributes_topic,
             retain=self._mqtt_retain,
-            payload=json.dumps(attributes),
+            payload=codec.dumps(attributes),
         )
 
     def update_state(self):
@@ -535,6 +795,38 @@ class MqttWrapperQolsysSensor(MqttWrapper):
         )
 
 
+class MqttConfigureCache(object):
+    """
+    Cache of the configuration payloads of the entities, and of the last
+    payload published on each configuration topic, shared by the wrappers
+    created by a factory. The payloads are cached using the values they
+    depend on as a key; the configuration of the gateway is not part of
+    that key, as it does not change during the life of the factory.
+    """
+
+    def __init__(self) -> None:
+        self._payloads = {}
+        self._published = {}
+
+    def get(self, key):
+        return self._payloads.get(key)
+
+    def invalidate(self):
+        # The configuration of the gateway changed, e.g. the mac address of
+        # the panel was found, so the payloads need to be built again
+        self._payloads.clear()
+
+    def set(self, key, topic_and_payload):
+        self._payloads[key] = topic_and_payload
+
+    def should_publish(self, topic, payload):
+        if self._published.get(topic) == payload:
+            return False
+
+        self._published[topic] = payload
+        return True
+
+
 class MqttWrapperFactory(object):
 
     __WRAPPERCLASSES_CACHE = {}
@@ -542,21 +834,29 @@ class MqttWrapperFactory(object):
     def __init__(self, *args, **kwargs):
         self._args = args
         self._kwargs = kwargs
+        self._kwargs.setdefault('configure_cache', MqttConfigureCache())
+
+    def invalidate_configure_cache(self):
+        self._kwargs['configure_cache'].invalidate()
 
     def wrap(self, obj):
-        # Search the class that corresponds to that type, and use all the
-        # parents (in order, thanks to the call to mro()) to try and find
-        # one that works by inheritance
-        for base in type(obj).mro():
-            klass = find_subclass(MqttWrapper, base.__name__,
-                                  cache=self.__WRAPPERCLASSES_CACHE,
-                                  normalize=False)
-            if klass:
-                break
-
-        if not klass:
-            raise UnknownMqttWrapperException(
-                f'Unable to wrap object type {type(obj).__name__}'
-            )
+        obj_type = type(obj)
+        klass = self.__WRAPPERCLASSES_CACHE.get(obj_type)
+
+        if klass is None:
+            # Search the wrapper class that corresponds to that type, and
+            # use all the parents (in order, thanks to the mro) to try and
+            # find one that works by inheritance
+            for base in obj_type.__mro__:
+                klass = MqttWrapper._REGISTRY.get(base)
+                if klass:
+                    break
+
+            if not klass:
+                raise UnknownMqttWrapperException(
+                    f'Unable to wrap object type {obj_type.__name__}'
+                )
+
+            self.__WRAPPERCLASSES_CACHE[obj_type] = klass
 
         return klass(obj, *self._args, **self._kwargs)
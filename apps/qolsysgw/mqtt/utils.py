@@ -1,5 +1,6 @@
+import functools
 import logging
-import re
+import string
 import unicodedata
 
 
@@ -24,7 +25,58 @@ def rmdiacritics(char):
     return char
 
 
+_ID_CHARS = frozenset(string.ascii_letters + string.digits + '_')
+
+
+def _normalize_char(char):
+    try:
+        base = rmdiacritics(char)
+    except ValueError:
+        # Characters without a name, like control characters
+        return '_'
+    return ''.join(c.lower() if c in _ID_CHARS else '_' for c in base)
+
+
+class _NormalizeTable(dict):
+    """
+    Translation table from the code point of a character to what it
+    becomes in an id; the characters that are not in the table yet are
+    computed, and added to it, the first time they are seen
+    """
+
+    def __missing__(self, codepoint):
+        value = self[codepoint] = _normalize_char(chr(codepoint))
+        return value
+
+
+# Precompute the ASCII and latin characters, which make most of the names
+_NORMALIZE_TABLE = _NormalizeTable(
+    (codepoint, _normalize_char(chr(codepoint)))
+    for codepoint in range(0x250)
+)
+
+
+@functools.lru_cache(maxsize=4096)
 def normalize_name_to_id(name):
-    ascii_name = ''.join([rmdiacritics(c) for c in name])
-    clean_name = re.sub(r'[^a-zA-Z0-9_]', '_', ascii_name)
-    return clean_name.lower()
+    # The same names are normalized many times, for each topic of each
+    # entity every time they are configured
+    return name.translate(_NORMALIZE_TABLE)
+
+
+def topic_matches(topic_filter, topic):
+    """
+    Return whether `topic` matches `topic_filter`, which can contain the
+    single-level (+) and multi-level (#) wildcards of MQTT
+    """
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+
+    return len(filter_levels) == len(topic_levels)
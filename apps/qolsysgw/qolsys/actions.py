@@ -1,12 +1,25 @@
-import json
 import logging
 
+from qolsys import codec
+from qolsys.events import QolsysEventAlarm
+from qolsys.events import QolsysEventArming
+from qolsys.events import QolsysEventError
+from qolsys.events import QolsysEventInfoSummary
+
 
 LOGGER = logging.getLogger(__name__)
 
 
 class QolsysAction(object):
 
+    # Priority of the action when writing to the panel, the lowest first;
+    # the keep-alives go after all the actions
+    PRIORITY_URGENT = 0
+    PRIORITY_HIGH = 1
+    PRIORITY_NORMAL = 2
+    PRIORITY_LOW = 3
+    PRIORITY_KEEP_ALIVE = 4
+
     _PARAMS_TO_REDACT = []
 
     _DEFAULT_DATA = {
@@ -19,19 +32,44 @@ class QolsysAction(object):
     def data(self) -> dict:
         return {**self._DEFAULT_DATA, **self._data}
 
+    @property
+    def name(self) -> str:
+        """
+        Name of the action, as used in the logs and metrics
+        """
+        return self._data['action']
+
+    def matches(self, event) -> bool:
+        """
+        Whether `event` is the panel's response to this action
+        """
+        return False
+
+    def _matches_partition(self, event) -> bool:
+        # The partition id of the controls received from Home Assistant is
+        # a string, while the panel sends it as an integer
+        return str(event.partition_id) == str(self._data['partition_id'])
+
+    @property
+    def priority(self) -> int:
+        return self.PRIORITY_NORMAL
+
     @property
     def redacted(self) -> str:
-        return json.dumps({
+        return codec.dumps({
             **{k: '<redacted>' if k in self._PARAMS_TO_REDACT else v
                for k, v in self.data.items()},
             'token': '<redacted>'
         })
 
     def with_token(self, token) -> str:
-        return json.dumps({**self.data, 'token': token})
+        return codec.dumps({**self.data, 'token': token})
+
+    def with_token_bytes(self, token) -> bytes:
+        return codec.dumps_bytes({**self.data, 'token': token})
 
     def __str__(self) -> str:
-        return json.dumps(self.data)
+        return codec.dumps(self.data)
 
 
 class QolsysActionInfo(QolsysAction):
@@ -41,6 +79,13 @@ class QolsysActionInfo(QolsysAction):
             'info_type': 'SUMMARY',
         }
 
+    def matches(self, event) -> bool:
+        return isinstance(event, QolsysEventInfoSummary)
+
+    @property
+    def priority(self) -> int:
+        return self.PRIORITY_LOW
+
 
 class QolsysActionArm(QolsysAction):
 
@@ -61,6 +106,21 @@ class QolsysActionArm(QolsysAction):
         if panel_code:
             self._data['usercode'] = str(panel_code)
 
+    @property
+    def name(self) -> str:
+        return self._data['arming_type']
+
+    @property
+    def priority(self) -> int:
+        # Disarming cannot wait behind other actions
+        if self._data['arming_type'] == 'DISARM':
+            return self.PRIORITY_URGENT
+        return self.PRIORITY_HIGH
+
+    def matches(self, event) -> bool:
+        return isinstance(event, (QolsysEventArming, QolsysEventError)) and \
+            self._matches_partition(event)
+
 
 class QolsysActionArmWithDelayAndBypass(QolsysActionArm):
     def __init__(self, delay: int = None, bypass: bool = None,
@@ -103,3 +163,11 @@ class QolsysActionTrigger(QolsysAction):
             'alarm_type': alarm_type or self.ALARM_TYPE_POLICE,
             'partition_id': partition_id,
         }
+
+    def matches(self, event) -> bool:
+        return isinstance(event, (QolsysEventAlarm, QolsysEventError)) and \
+            self._matches_partition(event)
+
+    @property
+    def priority(self) -> int:
+        return self.PRIORITY_URGENT
@@ -0,0 +1,133 @@
+import array
+import datetime
+import math
+import time
+
+
+class QolsysSensorActivity(object):
+    """
+    Recent transitions of a sensor, kept in fixed-size ring buffers of
+    monotonic timestamps and transition kinds, along with statistics on
+    the activity of the sensor that are updated as each transition is
+    recorded, so that reading them never goes through the history.
+
+    The rate of opens is a decaying average over about an hour, and the
+    average open duration covers the opens that were followed by a close.
+    """
+
+    OPEN = 0
+    CLOSED = 1
+    TAMPERED = 2
+    UNTAMPERED = 3
+    KIND_NAMES = ('open', 'closed', 'tampered', 'untampered')
+
+    # Number of transitions kept for each sensor
+    CAPACITY = 32
+    # Time constant of the decaying average of the rate of opens, in seconds
+    RATE_WINDOW = 3600
+
+    __slots__ = (
+        '_times',
+        '_kinds',
+        '_next',
+        '_size',
+        '_opened_at',
+        '_changed_at',
+        '_open_rate',
+        '_open_rate_at',
+        '_open_durations',
+        '_open_duration_total',
+    )
+
+    def __init__(self, capacity: int = None) -> None:
+        capacity = capacity or self.CAPACITY
+        self._times = array.array('d', bytes(8 * capacity))
+        self._kinds = array.array('B', bytes(capacity))
+        self._next = 0
+        self._size = 0
+
+        self._opened_at = None
+        self._changed_at = None
+        self._open_rate = 0.0
+        self._open_rate_at = None
+        self._open_durations = 0
+        self._open_duration_total = 0.0
+
+    def __len__(self):
+        return self._size
+
+    def record(self, kind: int, at: float = None):
+        if at is None:
+            at = time.monotonic()
+
+        i = self._next
+        self._times[i] = at
+        self._kinds[i] = kind
+        self._next = (i + 1) % len(self._times)
+        if self._size < len(self._times):
+            self._size += 1
+
+        if kind == self.OPEN:
+            self._open_rate = self._open_rate_at_time(at) + \
+                1 / self.RATE_WINDOW
+            self._open_rate_at = at
+            self._opened_at = at
+            self._changed_at = at
+        elif kind == self.CLOSED:
+            if self._opened_at is not None:
+                self._open_durations += 1
+                self._open_duration_total += at - self._opened_at
+                self._opened_at = None
+            self._changed_at = at
+
+    def _open_rate_at_time(self, at: float) -> float:
+        if self._open_rate_at is None:
+            return 0.0
+        return self._open_rate * math.exp(
+            (self._open_rate_at - at) / self.RATE_WINDOW)
+
+    def transitions(self):
+        """
+        Return the transitions kept, from the oldest to the most recent, as
+        tuples of their monotonic timestamp and the name of their kind
+        """
+        capacity = len(self._times)
+        start = self._next - self._size
+        return [
+            (self._times[(start + i) % capacity],
+             self.KIND_NAMES[self._kinds[(start + i) % capacity]])
+            for i in range(self._size)
+        ]
+
+    @property
+    def opens_per_hour(self) -> float:
+        return self._open_rate_at_time(time.monotonic()) * 3600
+
+    @property
+    def average_open_seconds(self) -> float:
+        if not self._open_durations:
+            return None
+        return self._open_duration_total / self._open_durations
+
+    @property
+    def last_changed_at(self) -> float:
+        # Monotonic timestamp of the last change of status
+        return self._changed_at
+
+    def as_dict(self):
+        last_changed = None
+        if self._changed_at is not None:
+            timestamp = time.time() - (time.monotonic() - self._changed_at)
+            last_changed = datetime.datetime.fromtimestamp(
+                timestamp, datetime.timezone.utc).isoformat(
+                    timespec='seconds')
+
+        average_open_seconds = self.average_open_seconds
+        if average_open_seconds is not None:
+            average_open_seconds = round(average_open_seconds, 1)
+
+        return {
+            'opens_per_hour': round(self.opens_per_hour, 2),
+            'average_open_seconds': average_open_seconds,
+            'last_changed': last_changed,
+        }
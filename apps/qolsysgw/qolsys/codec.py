@@ -0,0 +1,174 @@
+import importlib.util
+import json
+import logging
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class QolsysJsonCodec(object):
+    """
+    JSON encoder and decoder used for the data exchanged with the panel and
+    with MQTT; the backend in use is selected with `use`, and all the
+    modules go through the `loads`, `dumps` and `dumps_bytes` functions
+    of this module so they follow that selection. The selection applies to
+    the whole process, and thus to all the gateways running in it.
+    """
+
+    # Name of the backend, as used in the configuration, and its priority
+    # when selecting the backend automatically (the highest wins)
+    NAME = None
+    PRIORITY = 0
+
+    __REGISTRY = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        if 'NAME' in cls.__dict__:
+            QolsysJsonCodec.__REGISTRY[cls.NAME] = cls
+
+    @classmethod
+    def available(cls) -> bool:
+        return True
+
+    @classmethod
+    def get(cls, name: str = None) -> 'QolsysJsonCodec':
+        """
+        Return an instance of the backend `name`, or of the available
+        backend with the highest priority if `name` is None or 'auto'
+        """
+        if name is None or name == 'auto':
+            candidates = sorted(
+                (c for c in QolsysJsonCodec.__REGISTRY.values()
+                 if c.available()),
+                key=lambda c: c.PRIORITY,
+                reverse=True,
+            )
+            return candidates[0]()
+
+        klass = QolsysJsonCodec.__REGISTRY.get(name)
+        if klass is None:
+            raise ValueError(
+                f"Unknown JSON codec '{name}'; must be one of auto, "
+                f"{', '.join(QolsysJsonCodec.__REGISTRY)}")
+        if not klass.available():
+            raise ValueError(f"JSON codec '{name}' is not available, "
+                             'is the module installed?')
+
+        return klass()
+
+    @classmethod
+    def names(cls) -> list:
+        return list(QolsysJsonCodec.__REGISTRY)
+
+    def loads(self, data):
+        """
+        Decode `data`, which can be a str or bytes-like object; raises
+        json.JSONDecodeError (or a subclass of it) on invalid data
+        """
+        raise NotImplementedError
+
+    def dumps(self, obj) -> str:
+        raise NotImplementedError
+
+    def dumps_bytes(self, obj) -> bytes:
+        return self.dumps(obj).encode()
+
+
+class QolsysJsonCodecStdlib(QolsysJsonCodec):
+
+    NAME = 'json'
+    PRIORITY = 0
+
+    def __init__(self):
+        # json.dumps creates a new encoder for every call with non-default
+        # arguments, keep ours around instead
+        self._encoder = json.JSONEncoder()
+        self._decoder = json.JSONDecoder()
+
+    def loads(self, data):
+        if not isinstance(data, str):
+            data = str(data, 'utf-8')
+        return self._decoder.decode(data)
+
+    def dumps(self, obj) -> str:
+        return self._encoder.encode(obj)
+
+
+class QolsysJsonCodecOrjson(QolsysJsonCodec):
+    """
+    Backend using orjson, if installed; its output is compact, without the
+    spaces after the separators that the stdlib adds
+    """
+
+    NAME = 'orjson'
+    PRIORITY = 10
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    @classmethod
+    def available(cls) -> bool:
+        return importlib.util.find_spec('orjson') is not None
+
+    def loads(self, data):
+        return self._orjson.loads(data)
+
+    def dumps(self, obj) -> str:
+        return self._orjson.dumps(obj).decode()
+
+    def dumps_bytes(self, obj) -> bytes:
+        return self._orjson.dumps(obj)
+
+
+_codec = QolsysJsonCodecStdlib()
+# Whether a backend was selected with `use`, to warn when gateways sharing
+# the process select different backends
+_selected = False
+
+
+def use(name: str = None) -> QolsysJsonCodec:
+    """
+    Select the JSON backend to use, by name or 'auto', for the whole
+    process; as the last selection wins, a warning is logged if it replaces
+    a different backend selected before
+    """
+    global _codec, _selected
+    new_codec = QolsysJsonCodec.get(name)
+    if _selected and new_codec.NAME != _codec.NAME:
+        LOGGER.warning(f"Using JSON codec '{new_codec.NAME}' instead of "
+                       f"'{_codec.NAME}' for all the gateways of the "
+                       "process, as the JSON codec cannot differ between "
+                       "them")
+
+    _codec = new_codec
+    _selected = True
+    LOGGER.debug(f"Using JSON codec '{_codec.NAME}'")
+    return _codec
+
+
+def reset():
+    """
+    Go back to the default backend, as if none was selected
+    """
+    global _codec, _selected
+    _codec = QolsysJsonCodecStdlib()
+    _selected = False
+
+
+def current() -> QolsysJsonCodec:
+    return _codec
+
+
+def loads(data):
+    return _codec.loads(data)
+
+
+def dumps(obj) -> str:
+    return _codec.dumps(obj)
+
+
+def dumps_bytes(obj) -> bytes:
+    return _codec.dumps_bytes(obj)
@@ -1,8 +1,8 @@
 import logging
 
+from qolsys.codec import QolsysJsonCodec
 from qolsys.exceptions import QolsysGwConfigIncomplete
 from qolsys.exceptions import QolsysGwConfigError
-from qolsys.utils import get_mac_from_host
 
 
 LOGGER = logging.getLogger(__name__)
@@ -16,6 +16,15 @@ class QolsysGatewayConfig(object):
         'panel_port': None,
         'panel_mac': None,
         'panel_token': _SENTINEL,
+        'panel_max_line_size': None,
+        'panel_ack_timeout': None,
+        'panel_event_timeout': None,
+        'panel_action_retries': None,
+        'panel_send_interval': None,
+        'panel_keep_alive': None,
+        'panel_idle_timeout': None,
+        'panel_tcp_keepalive': None,
+        'panel_dns_ttl': None,
         'panel_user_code': None,
         'panel_unique_id': 'qolsys_panel',
         'panel_device_name': 'Qolsys Panel',
@@ -27,10 +36,28 @@ class QolsysGatewayConfig(object):
 
         'mqtt_namespace': 'mqtt',
         'mqtt_retain': True,
+        'mqtt_publish_window': 0,
+        'mqtt_publish_batch_size': 50,
         'discovery_topic': 'homeassistant',
         'control_topic': '{discovery_topic}/alarm_control_panel/{panel_unique_id}/set',
         'event_topic': 'qolsys/{panel_unique_id}/event',
+        'event_mode': 'mqtt',
         'user_control_token': None,
+        'json_codec': 'json',
+        'stats_topic': 'qolsys/{panel_unique_id}/stats',
+        'stats_interval': 0,
+        'metrics_host': '127.0.0.1',
+        'metrics_port': None,
+        'mac_cache_path': None,
+        'mac_cache_ttl': None,
+        'panels': None,
+        'journal_path': None,
+        'journal_max_segment_size': None,
+        'journal_max_segments': None,
+        'state_snapshot_path': None,
+        'state_snapshot_interval': None,
+        'sensor_debounce': None,
+        'sensor_activity_attributes': False,
 
         'ha_check_user_code': True,
         'ha_user_code': None,
@@ -42,8 +69,25 @@ class QolsysGatewayConfig(object):
         'enable_static_sensors_by_default': False,
     }
 
+    # Keys that only apply to the gateway as a whole, and not to each panel
+    _GATEWAY_KEYS = (
+        'mqtt_namespace',
+        'mqtt_publish_window',
+        'mqtt_publish_batch_size',
+        'json_codec',
+        'stats_topic',
+        'stats_interval',
+        'metrics_host',
+        'metrics_port',
+        'mac_cache_path',
+        'mac_cache_ttl',
+        'panels',
+    )
+
     def __init__(self, args=None, check=True):
+        self._args = dict(args or {})
         self._override_config = {}
+        self._panels = None
 
         if args:
             self.load(args)
@@ -57,8 +101,15 @@ class QolsysGatewayConfig(object):
                 self._override_config[k] = v
 
     def check(self):
+        panels = self.get('panels')
+        if panels is not None:
+            self._check_panels(panels)
+
         errors = 0
         for k in self._DEFAULT_CONFIG.keys():
+            if panels and k.startswith('panel_'):
+                # Checked in the configuration of each panel
+                continue
             if self.get(k) is self._SENTINEL:
                 LOGGER.error(f"Missing mandatory configuration key '{k}'")
                 errors += 1
@@ -114,14 +165,56 @@ class QolsysGatewayConfig(object):
                 f"one of {', '.join(valid_arm_type)}")
         self._override_config['arm_type_custom_bypass'] = arm_type
 
-        if self.get('panel_mac') is None:
-            mac = get_mac_from_host(self.get('panel_host'))
-            if mac:
-                self._override_config['panel_mac'] = mac
+        # The event mode defines if the events received from the panel are
+        # processed after a round-trip through the MQTT event topic ('mqtt'),
+        # or directly when received, in which case the event topic is only
+        # a mirror of the events ('direct')
+        event_mode = self.get('event_mode')
+        if event_mode:
+            event_mode = event_mode.lower()
+        valid_event_mode = [
+            'mqtt',
+            'direct',
+        ]
+        if event_mode not in valid_event_mode:
+            raise QolsysGwConfigError(
+                f"Invalid event mode '{event_mode}'; must be "
+                f"one of {', '.join(valid_event_mode)}")
+        self._override_config['event_mode'] = event_mode
 
-        # Apply a template to the control and event topics if the unique id
-        # is part of the requested topics
-        for k in ('control_topic', 'event_topic'):
+        # The JSON backend can be any of the known backends, or 'auto' to
+        # use the fastest one installed
+        json_codec = self.get('json_codec')
+        if json_codec:
+            json_codec = json_codec.lower()
+        valid_json_codec = ['auto'] + QolsysJsonCodec.names()
+        if json_codec not in valid_json_codec:
+            raise QolsysGwConfigError(
+                f"Invalid JSON codec '{json_codec}'; must be "
+                f"one of {', '.join(valid_json_codec)}")
+        self._override_config['json_codec'] = json_codec
+
+        # The debounce of the sensor state publishes is either a delay in
+        # seconds for all the sensors, or a delay per sensor type, in which
+        # case the 'default' key applies to the types not listed
+        debounce = self.get('sensor_debounce')
+        if debounce is not None:
+            delays = debounce if isinstance(debounce, dict) else {
+                'default': debounce}
+            for sensor_type, delay in delays.items():
+                if isinstance(delay, bool) or \
+                        not isinstance(delay, (int, float)) or delay < 0:
+                    raise QolsysGwConfigError(
+                        f"Invalid sensor debounce '{delay}' for "
+                        f"'{sensor_type}'; must be a positive number of "
+                        "seconds")
+            self._override_config['sensor_debounce'] = {
+                k: float(v) for k, v in delays.items()}
+
+        # Apply a template to the control, event and stats topics and to
+        # the journal and snapshot paths if the unique id is part of them
+        for k in ('control_topic', 'event_topic', 'stats_topic',
+                  'journal_path', 'state_snapshot_path'):
             v = self.get(k)
             if v:
                 self._override_config[k] = v.format(
@@ -134,6 +227,58 @@ class QolsysGatewayConfig(object):
             if v and not isinstance(v, str):
                 self._override_config[k] = str(v)
 
+    def _check_panels(self, panels):
+        if not isinstance(panels, list) or not panels or \
+                not all(isinstance(p, dict) for p in panels):
+            raise QolsysGwConfigError(
+                "'panels' must be a non-empty list of panel configurations")
+
+        # Each panel uses the configuration of the gateway as defaults
+        defaults = {k: v for k, v in self._args.items() if k != 'panels'}
+        self._panels = []
+        for panel in panels:
+            ignored = [k for k in panel if k in self._GATEWAY_KEYS]
+            if ignored:
+                raise QolsysGwConfigError(
+                    f"Cannot set {', '.join(ignored)} for a single panel")
+            self._panels.append(QolsysGatewayConfig({**defaults, **panel}))
+
+        for k in ('panel_unique_id', 'control_topic', 'event_topic',
+                  'journal_path', 'state_snapshot_path'):
+            values = [p.get(k) for p in self._panels if p.get(k)]
+            if len(set(values)) != len(values):
+                raise QolsysGwConfigError(
+                    f"Each panel must have a different '{k}'")
+
+    def panels(self):
+        """
+        Return the configuration of each panel: those listed in 'panels' if
+        any, or else this configuration for the single panel
+        """
+        if self._panels is None:
+            return [self]
+        return list(self._panels)
+
+    def topic_filter(self, name):
+        """
+        Return the MQTT topic filter matching the topic `name` of all the
+        panels, with a wildcard in place of the unique id of the panel, or
+        the topic itself if it does not depend on the unique id
+        """
+        template = self._args.get(name) or self._DEFAULT_CONFIG[name]
+        topic_filter = template.format(
+            panel_unique_id='+',
+            discovery_topic=self.get('discovery_topic'))
+
+        # The wildcard can only stand for a whole level of the topic
+        if any('+' in level and level != '+'
+               for level in topic_filter.split('/')):
+            return self.get(name)
+        return topic_filter
+
+    def set(self, name, value):
+        self._override_config[name] = value
+
     def get(self, name):
         value = self._override_config.get(name, self._SENTINEL)
         if value is self._SENTINEL:
@@ -1,6 +1,7 @@
-import json
 import logging
+import re
 
+from qolsys import codec
 from qolsys.actions import QolsysActionArmAway
 from qolsys.actions import QolsysActionArmStay
 from qolsys.actions import QolsysActionDisarm
@@ -8,7 +9,6 @@ from qolsys.actions import QolsysActionTrigger
 from qolsys.exceptions import UnknownQolsysControlException
 from qolsys.exceptions import MissingUserCodeException
 from qolsys.exceptions import InvalidUserCodeException
-from qolsys.utils import find_subclass
 
 
 LOGGER = logging.getLogger(__name__)
@@ -16,7 +16,19 @@ LOGGER = logging.getLogger(__name__)
 
 class QolsysControl(object):
 
-    __SUBCLASSES_CACHE = {}
+    # The value of the 'action' key for this control class
+    _ACTION = None
+
+    __REGISTRY = {}
+    __NORMALIZE_ACTION = re.compile(r'[\W_]+')
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Only register classes that declare their own action, so that
+        # subclassing a control class does not override its registration
+        if '_ACTION' in cls.__dict__:
+            QolsysControl.__REGISTRY[cls._ACTION] = cls
 
     def __init__(self, raw: dict, partition_id: int, code: str = None,
                  session_token: str = None):
@@ -48,7 +60,7 @@ class QolsysControl(object):
 
     @property
     def raw_str(self):
-        return json.dumps(self.raw)
+        return codec.dumps(self.raw)
 
     @property
     def requires_config(self):
@@ -72,11 +84,15 @@ class QolsysControl(object):
     @classmethod
     def from_json(cls, data):
         if isinstance(data, str):
-            data = json.loads(data)
+            data = codec.loads(data)
 
         action_type = data.get('action')
-        klass = find_subclass(QolsysControl, action_type,
-                              cache=QolsysControl.__SUBCLASSES_CACHE)
+        klass = QolsysControl.__REGISTRY.get(action_type)
+        if not klass and action_type:
+            # Be lenient on the format of actions sent by hand, so that
+            # e.g. 'arm-away' or 'arm_away' resolve to 'ARM_AWAY'
+            klass = QolsysControl.__REGISTRY.get(
+                QolsysControl.__NORMALIZE_ACTION.sub('_', action_type).upper())
         if not klass:
             raise UnknownQolsysControlException(
                 "Unable to find a QolsysControl class for "
@@ -153,6 +169,7 @@ class _QolsysControlCheckCode(QolsysControl):
 
 class QolsysControlDisarm(_QolsysControlCheckCode):
 
+    _ACTION = 'DISARM'
     _CODE_REQUIRED_ATTR = 'code_disarm_required'
     _PANEL_CODE_REQUIRED = True
 
@@ -202,24 +219,27 @@ class QolsysControlArm(_QolsysControlCheckCode):
 
 
 class QolsysControlArmAway(QolsysControlArm):
+    _ACTION = 'ARM_AWAY'
     _ATTR_PREFIX = 'arm_away'
     _ACTION_CLASS = QolsysActionArmAway
 
 
 class QolsysControlArmVacation(QolsysControlArmAway):
-    pass
+    _ACTION = 'ARM_VACATION'
 
 
 class QolsysControlArmHome(QolsysControlArm):
+    _ACTION = 'ARM_HOME'
     _ATTR_PREFIX = 'arm_stay'
     _ACTION_CLASS = QolsysActionArmStay
 
 
 class QolsysControlArmNight(QolsysControlArmHome):
-    pass
+    _ACTION = 'ARM_NIGHT'
 
 
 class QolsysControlArmCustomBypass(QolsysControlArm):
+    _ACTION = 'ARM_CUSTOM_BYPASS'
     _ACTION_CLASSES = {
         'arm_stay': QolsysActionArmStay,
         'arm_away': QolsysActionArmAway,
@@ -242,6 +262,7 @@ class QolsysControlArmCustomBypass(QolsysControlArm):
 # has been merged and is available starting with Home Assitant 2021.12
 class QolsysControlTrigger(_QolsysControlCheckCode):
 
+    _ACTION = 'TRIGGER'
     _CODE_REQUIRED_ATTR = 'code_trigger_required'
     _PANEL_CODE_REQUIRED = False
 
@@ -259,18 +280,24 @@ class QolsysControlTrigger(_QolsysControlCheckCode):
 
 
 class QolsysControlTriggerPolice(QolsysControlTrigger):
+    _ACTION = 'TRIGGER_POLICE'
+
     def __init__(self, *args, **kwargs):
         super().__init__(alarm_type=QolsysActionTrigger.ALARM_TYPE_POLICE,
                          *args, **kwargs)
 
 
 class QolsysControlTriggerFire(QolsysControlTrigger):
+    _ACTION = 'TRIGGER_FIRE'
+
     def __init__(self, *args, **kwargs):
         super().__init__(alarm_type=QolsysActionTrigger.ALARM_TYPE_FIRE,
                          *args, **kwargs)
 
 
 class QolsysControlTriggerAuxiliary(QolsysControlTrigger):
+    _ACTION = 'TRIGGER_AUXILIARY'
+
     def __init__(self, *args, **kwargs):
         super().__init__(alarm_type=QolsysActionTrigger.ALARM_TYPE_AUXILIARY,
                          *args, **kwargs)
@@ -1,13 +1,15 @@
+import codecs
 import json
 import logging
+import re
 
 from types import SimpleNamespace
 
+from qolsys import codec
 from qolsys.exceptions import UnableToParseEventException
 from qolsys.exceptions import UnknownQolsysEventException
 from qolsys.exceptions import UnknownQolsysSensorException
 from qolsys.partition import QolsysPartition
-from qolsys.utils import find_subclass
 from qolsys.sensors import QolsysSensor
 
 LOGGER = logging.getLogger(__name__)
@@ -15,11 +17,38 @@ LOGGER = logging.getLogger(__name__)
 
 class QolsysEvent(object):
 
-    __SUBCLASSES_CACHE = {}
+    __slots__ = ('_request_id', '_raw_event', '_raw_str')
+
+    # The value of the 'event' key for this event class; if the event is
+    # divided in subtypes, _SUBTYPE_KEY gives the key holding the subtype,
+    # and _SUBTYPE the value of that key for this event class
+    _EVENT_TYPE = None
+    _SUBTYPE_KEY = None
+    _SUBTYPE = None
+
+    __SUBTYPE_KEYS = {}
+    __REGISTRY = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Only register classes that declare their own type, so that
+        # subclassing an event class does not override its registration
+        if '_EVENT_TYPE' not in cls.__dict__ and \
+                '_SUBTYPE' not in cls.__dict__:
+            return
+
+        if cls._SUBTYPE_KEY is not None:
+            QolsysEvent.__SUBTYPE_KEYS[cls._EVENT_TYPE] = cls._SUBTYPE_KEY
+            if cls._SUBTYPE is None:
+                return
+
+        QolsysEvent.__REGISTRY[(cls._EVENT_TYPE, cls._SUBTYPE)] = cls
 
     def __init__(self, request_id: str, raw_event: dict) -> None:
         self._request_id = request_id
         self._raw_event = raw_event
+        self._raw_str = None
 
     @property
     def request_id(self):
@@ -27,16 +56,22 @@ class QolsysEvent(object):
 
     @property
     def raw(self):
+        if self._raw_event is None and self._raw_str is not None:
+            return codec.loads(self._raw_str)
         return self._raw_event
 
     @property
     def raw_str(self):
-        return json.dumps(self.raw)
+        if self._raw_str is None:
+            self._raw_str = codec.dumps(self.raw)
+        return self._raw_str
 
     @classmethod
     def from_json(cls, data):
+        raw_str = None
         if isinstance(data, str):
-            data = json.loads(data)
+            raw_str = data
+            data = codec.loads(data)
 
         event_type = data.get('event')
         if not event_type:
@@ -44,38 +79,56 @@ class QolsysEvent(object):
                 f'Event type not found for event {data}'
             )
 
-        klass = find_subclass(cls, event_type, cache=cls.__SUBCLASSES_CACHE)
+        subtype = None
+        subtype_key = QolsysEvent.__SUBTYPE_KEYS.get(event_type)
+        if subtype_key is not None:
+            subtype = data.get(subtype_key)
+
+        klass = QolsysEvent.__REGISTRY.get((event_type, subtype))
         if not klass:
+            if subtype_key is None:
+                raise UnknownQolsysEventException(
+                    f"Event type '{event_type}' unsupported for event {data}"
+                )
             raise UnknownQolsysEventException(
-                f"Event type '{event_type}' unsupported for event {data}"
+                f"Event {event_type} subtype '{subtype}' unsupported "
+                f"for event {data}"
             )
 
-        return klass.from_json(data)
+        if cls is not QolsysEvent and not issubclass(klass, cls):
+            raise UnableToParseEventException(
+                f"Cannot parse event '{event_type}' as {cls.__name__}")
 
+        event = klass._from_data(data)
 
-class QolsysEventInfo(QolsysEvent):
-
-    __INFOCLASSES_CACHE = {}
+        # Keep the string we parsed the event from, so we do not have to
+        # serialize it again if we need to forward it; the string is more
+        # compact than the parsed data, which we can get back from it if
+        # needed, so we do not keep both alive
+        if raw_str is not None:
+            event._raw_str = raw_str
+            event._raw_event = None
+        return event
 
     @classmethod
-    def from_json(cls, data):
-        event_type = data.get('event')
-        if event_type != 'INFO':
-            raise UnableToParseEventException(f"Cannot parse event '{event_type}'")
+    def _from_data(cls, data):
+        raise NotImplementedError
 
-        info_type = data.get('info_type')
-        klass = find_subclass(cls, info_type, cache=cls.__INFOCLASSES_CACHE)
-        if not klass:
-            raise UnknownQolsysEventException(
-                f"Event INFO subtype '{info_type}' unsupported "
-                f"for event {data}"
-            )
 
-        return klass.from_json(data)
+class QolsysEventInfo(QolsysEvent):
+
+    __slots__ = ()
+
+    _EVENT_TYPE = 'INFO'
+    _SUBTYPE_KEY = 'info_type'
 
 
 class QolsysEventInfoSummary(QolsysEventInfo):
 
+    __slots__ = ('_partitions',)
+
+    _SUBTYPE = 'SUMMARY'
+
     def __init__(self, partitions: list = None, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
 
@@ -95,27 +148,19 @@ class QolsysEventInfoSummary(QolsysEventInfo):
                 f"[{', '.join([str(p) for p in self.partitions])}]>")
 
     @classmethod
-    def from_json(cls, data):
-        if isinstance(data, str):
-            data = json.loads(data)
-
-        info_type = data.get('info_type')
-        if info_type != 'SUMMARY':
-            raise UnableToParseEventException(
-                f"Cannot parse event with info type '{info_type}'")
-
+    def _from_data(cls, data, zone_sensors=None):
         return QolsysEventInfoSummary(
-            partitions=cls._parse_partitions(data),
+            partitions=cls._parse_partitions(data, zone_sensors),
             request_id=data.get('requestID'),
             raw_event=data,
         )
 
     @classmethod
-    def _parse_partitions(cls, data):
+    def _parse_partitions(cls, data, zone_sensors=None):
         partitions = []
 
         partition_list = data['partition_list']
-        for partition_info in partition_list:
+        for i, partition_info in enumerate(partition_list):
             partition = QolsysPartition(
                 partition_id=partition_info.get('partition_id'),
                 name=partition_info.get('name'),
@@ -123,20 +168,197 @@ class QolsysEventInfoSummary(QolsysEventInfo):
                 secure_arm=partition_info.get('secure_arm'),
             )
 
-            zone_list = partition_info['zone_list']
-            for sensor_info in zone_list:
-                try:
-                    partition.add_sensor(QolsysSensor.from_json(sensor_info, partition))
-                except UnknownQolsysSensorException:
-                    LOGGER.warning(f"sensor of unknown type: {sensor_info}")
+            if zone_sensors is not None:
+                # The sensors were already built while the event was
+                # streamed, we only need to attach them to their partition
+                for sensor in zone_sensors[i]:
+                    sensor.partition = partition
+                    partition.add_sensor(sensor)
+            else:
+                zone_list = partition_info['zone_list']
+                for sensor_info in zone_list:
+                    sensor = cls._parse_sensor(sensor_info, partition)
+                    if sensor is not None:
+                        partition.add_sensor(sensor)
 
             partitions.append(partition)
 
         return partitions
 
+    @classmethod
+    def _parse_sensor(cls, sensor_info, partition):
+        try:
+            return QolsysSensor.from_json(sensor_info, partition)
+        except UnknownQolsysSensorException:
+            LOGGER.warning(f"sensor of unknown type: {sensor_info}")
+            return None
+
+
+class QolsysEventInfoSummaryStreamParser(object):
+    """
+    Incremental parser for the INFO SUMMARY events, which can be several
+    megabytes long on a single line for big installations. The parser is
+    fed with the line while it is being received: the entries of the zone
+    lists, which make most of the event, are parsed and their sensors
+    built as they stream in, so that only what is left of the event needs
+    to be parsed once the line is complete.
+
+    Any line that was not fed to the parser, or that does not end up
+    looking like a summary, is parsed with QolsysEvent.from_json.
+    """
+
+    _ZONE_LIST_RE = re.compile(r'(?<!\\)"zone_list"\s*:\s*\[')
+    _WHITESPACE_RE = re.compile(r'\s*')
+
+    # Number of characters kept when looking for the start of a zone list,
+    # in case it is split between two chunks
+    _MARKER_TAIL = 256
+
+    # If that many characters are waiting to be parsed as a single zone,
+    # something is wrong with the data, and we stop trying
+    _MAX_PENDING = 1024 * 1024
+
+    def __init__(self) -> None:
+        # Only the stdlib decoder can decode an object in the middle of a
+        # string, and tell where it ends
+        self._decoder = json.JSONDecoder()
+        self.reset()
+
+    def reset(self):
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._text = ''
+        self._offset = 0
+
+        # Where we are in the line: outside of a zone list, or in a zone
+        # list expecting the first entry, the next entry, or an object
+        self._expect = None
+        self._span_start = None
+        self._spans = []
+        self._zone_sensors = []
+        self._current = None
+
+        self._fed = False
+        self._complete = False
+        self._failed = False
+
+    def feed(self, data: bytes, final: bool = False):
+        self._fed = True
+        if final:
+            self._complete = True
+
+        if self._failed:
+            return
+
+        try:
+            self._text += self._utf8.decode(data, final)
+            self._scan()
+        except (UnicodeDecodeError, json.JSONDecodeError,
+                UnknownQolsysSensorException, ValueError):
+            # We will let QolsysEvent.from_json report the issue when
+            # parsing the whole line
+            self._failed = True
+
+    def _consume(self, pos):
+        self._offset += pos
+        self._text = self._text[pos:]
+
+    def _scan(self):
+        text = self._text
+        pos = 0
+        while True:
+            if self._expect is None:
+                m = self._ZONE_LIST_RE.search(text, pos)
+                if m is None:
+                    pos = max(pos, len(text) - self._MARKER_TAIL)
+                    break
+
+                pos = m.end()
+                self._expect = 'first'
+                self._span_start = self._offset + pos
+                self._current = []
+                continue
+
+            pos = self._WHITESPACE_RE.match(text, pos).end()
+            if pos >= len(text):
+                break
+
+            char = text[pos]
+            if char == ']' and self._expect in ('first', 'next'):
+                self._spans.append((self._span_start, self._offset + pos))
+                self._zone_sensors.append(self._current)
+                self._expect = None
+                self._current = None
+                pos += 1
+            elif char == ',' and self._expect == 'next':
+                self._expect = 'object'
+                pos += 1
+            elif char == '{' and self._expect in ('first', 'object'):
+                try:
+                    sensor_info, end = self._decoder.raw_decode(text, pos)
+                except json.JSONDecodeError:
+                    # The object is most likely incomplete, wait for more
+                    if len(text) - pos > self._MAX_PENDING:
+                        raise
+                    break
+
+                sensor = QolsysEventInfoSummary._parse_sensor(
+                    sensor_info, None)
+                if sensor is not None:
+                    self._current.append(sensor)
+
+                self._expect = 'next'
+                pos = end
+            else:
+                raise ValueError(f"Unexpected '{char}' in zone list")
+
+        self._consume(pos)
+
+    def parse(self, line: str) -> QolsysEvent:
+        try:
+            if not self._complete or self._failed or \
+                    self._expect is not None or not self._spans:
+                return QolsysEvent.from_json(line)
+
+            # Parse what is left of the event, with empty zone lists
+            skeleton = []
+            last = 0
+            for start, end in self._spans:
+                skeleton.append(line[last:start])
+                last = end
+            skeleton.append(line[last:])
+            data = codec.loads(''.join(skeleton))
+
+            if not self._is_summary(data):
+                return QolsysEvent.from_json(line)
+
+            event = QolsysEventInfoSummary._from_data(
+                data, zone_sensors=self._zone_sensors)
+            event._raw_str = line
+            event._raw_event = None
+            return event
+        finally:
+            self.reset()
+
+    def _is_summary(self, data):
+        if not isinstance(data, dict) or data.get('event') != 'INFO' or \
+                data.get('info_type') != 'SUMMARY':
+            return False
+
+        partition_list = data.get('partition_list')
+        if not isinstance(partition_list, list) or \
+                len(partition_list) != len(self._spans):
+            return False
+
+        return all(isinstance(p, dict) and p.get('zone_list') == []
+                   for p in partition_list)
+
 
 class QolsysEventInfoSecureArm(QolsysEventInfo):
 
+    __slots__ = ('_partition_id', '_value', '_version')
+
+    _SUBTYPE = 'SECURE_ARM'
+
     def __init__(self, partition_id: int, value: bool, version: int,
                  *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -158,15 +380,7 @@ class QolsysEventInfoSecureArm(QolsysEventInfo):
                 f"partition_id={self.partition_id} value={self.value}>")
 
     @classmethod
-    def from_json(cls, data):
-        if isinstance(data, str):
-            data = json.loads(data)
-
-        info_type = data.get('info_type')
-        if info_type != 'SECURE_ARM':
-            raise UnableToParseEventException(
-                f"Cannot parse event with info type '{info_type}'")
-
+    def _from_data(cls, data):
         return QolsysEventInfoSecureArm(
             partition_id=data.get('partition_id'),
             value=data.get('value'),
@@ -178,7 +392,10 @@ class QolsysEventInfoSecureArm(QolsysEventInfo):
 
 class QolsysEventZoneEvent(QolsysEvent):
 
-    __ZONEEVENTCLASSES_CACHE = {}
+    __slots__ = ('_version',)
+
+    _EVENT_TYPE = 'ZONE_EVENT'
+    _SUBTYPE_KEY = 'zone_event_type'
 
     def __init__(self, version: int, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -194,26 +411,12 @@ class QolsysEventZoneEvent(QolsysEvent):
                 f"zone={self.zone} "
                 f"version={self._version}>")
 
-    @classmethod
-    def from_json(cls, data):
-        event_type = data.get('event')
-        if event_type != 'ZONE_EVENT':
-            raise UnableToParseEventException(f"Cannot parse event '{event_type}'")
 
-        zone_event_type = data.get('zone_event_type')
-        if zone_event_type.startswith('ZONE_'):
-            zone_event_type = zone_event_type[5:]
-        klass = find_subclass(cls, zone_event_type, cache=cls.__ZONEEVENTCLASSES_CACHE)
-        if not klass:
-            raise UnknownQolsysEventException(
-                f"Event ZONE_EVENT subtype '{zone_event_type}' unsupported "
-                f"for event {data}"
-            )
+class QolsysEventZoneEventActive(QolsysEventZoneEvent):
 
-        return klass.from_json(data)
+    __slots__ = ('_zone_id', '_zone_status')
 
-
-class QolsysEventZoneEventActive(QolsysEventZoneEvent):
+    _SUBTYPE = 'ZONE_ACTIVE'
 
     def __init__(self, zone_id: int, zone_status: str, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -229,12 +432,7 @@ class QolsysEventZoneEventActive(QolsysEventZoneEvent):
         )
 
     @classmethod
-    def from_json(cls, data):
-        zone_event_type = data.get('zone_event_type')
-        if zone_event_type != 'ZONE_ACTIVE':
-            raise UnableToParseEventException(
-                f"Cannot parse zone event '{zone_event_type}'")
-
+    def _from_data(cls, data):
         return QolsysEventZoneEventActive(
             request_id=data.get('requestID'),
             version=data.get('version'),
@@ -246,6 +444,8 @@ class QolsysEventZoneEventActive(QolsysEventZoneEvent):
 
 class _QolsysEventZoneEventFullZone(QolsysEventZoneEvent):
 
+    __slots__ = ('_zone',)
+
     def __init__(self, zone: QolsysSensor, *args, **kwargs) -> None:
         if self.__class__ == _QolsysEventZoneEventFullZone:
             raise RuntimeError('Should not instantiate this class directly')
@@ -259,12 +459,7 @@ class _QolsysEventZoneEventFullZone(QolsysEventZoneEvent):
         return self._zone
 
     @classmethod
-    def from_json(cls, data):
-        zone_event_type = data.get('zone_event_type')
-        if zone_event_type != cls._ZONE_EVENT_TYPE:
-            raise UnableToParseEventException(
-                f"Cannot parse zone event '{zone_event_type}'")
-
+    def _from_data(cls, data):
         zone = data.get('zone')
         try:
             sensor = QolsysSensor.from_json(zone, None)
@@ -281,15 +476,21 @@ class _QolsysEventZoneEventFullZone(QolsysEventZoneEvent):
 
 
 class QolsysEventZoneEventUpdate(_QolsysEventZoneEventFullZone):
-    _ZONE_EVENT_TYPE = 'ZONE_UPDATE'
+    __slots__ = ()
+    _SUBTYPE = 'ZONE_UPDATE'
 
 
 class QolsysEventZoneEventAdd(_QolsysEventZoneEventFullZone):
-    _ZONE_EVENT_TYPE = 'ZONE_ADD'
+    __slots__ = ()
+    _SUBTYPE = 'ZONE_ADD'
 
 
 class QolsysEventArming(QolsysEvent):
 
+    __slots__ = ('_partition_id', '_arming_type', '_version', '_delay')
+
+    _EVENT_TYPE = 'ARMING'
+
     def __init__(self, partition_id: int, arming_type: str, version: int,
                  delay: int = None, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -319,11 +520,7 @@ class QolsysEventArming(QolsysEvent):
                 f"version={self._version}>")
 
     @classmethod
-    def from_json(cls, data):
-        event_type = data.get('event')
-        if event_type != 'ARMING':
-            raise UnableToParseEventException(f"Cannot parse event '{event_type}'")
-
+    def _from_data(cls, data):
         return QolsysEventArming(
             request_id=data.get('requestID'),
             version=data.get('version'),
@@ -336,6 +533,10 @@ class QolsysEventArming(QolsysEvent):
 
 class QolsysEventAlarm(QolsysEvent):
 
+    __slots__ = ('_partition_id', '_alarm_type', '_version')
+
+    _EVENT_TYPE = 'ALARM'
+
     def __init__(self, partition_id: int, alarm_type: str, version: int,
                  *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -363,11 +564,7 @@ class QolsysEventAlarm(QolsysEvent):
                 f"version={self._version}>")
 
     @classmethod
-    def from_json(cls, data):
-        event_type = data.get('event')
-        if event_type != 'ALARM':
-            raise UnableToParseEventException(f"Cannot parse event '{event_type}'")
-
+    def _from_data(cls, data):
         return QolsysEventAlarm(
             request_id=data.get('requestID'),
             version=data.get('version'),
@@ -379,6 +576,10 @@ class QolsysEventAlarm(QolsysEvent):
 
 class QolsysEventError(QolsysEvent):
 
+    __slots__ = ('_partition_id', '_error_type', '_description', '_version')
+
+    _EVENT_TYPE = 'ERROR'
+
     def __init__(self, partition_id: int, error_type: str, description: str,
                  version: int, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -408,11 +609,7 @@ class QolsysEventError(QolsysEvent):
                 f"version={self._version}>")
 
     @classmethod
-    def from_json(cls, data):
-        event_type = data.get('event')
-        if event_type != 'ERROR':
-            raise UnableToParseEventException(f"Cannot parse event '{event_type}'")
-
+    def _from_data(cls, data):
         return QolsysEventError(
             request_id=data.get('requestID'),
             version=data.get('version'),
@@ -1,22 +1,42 @@
+import contextlib
+import contextvars
+
 from datetime import datetime, timezone
 
 
 class QolsysException(Exception):
-    STATE = None
+    # State of the panel being handled, on which the exceptions are
+    # recorded when raised; it is set for the tasks and callbacks of each
+    # panel with `recorded_on`, so that each panel reports its own errors
+    STATE = contextvars.ContextVar('STATE', default=None)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._at = datetime.now(timezone.utc).isoformat()
 
-        if self.STATE:
-            self.STATE.last_exception = self
+        state = self.STATE.get()
+        if state is not None:
+            state.last_exception = self
 
     @property
     def at(self):
         return self._at
 
 
+@contextlib.contextmanager
+def recorded_on(state):
+    """
+    Record the exceptions raised within the block on `state`, as well as
+    those raised by the tasks created within the block
+    """
+    token = QolsysException.STATE.set(state)
+    try:
+        yield
+    finally:
+        QolsysException.STATE.reset(token)
+
+
 class QolsysGwConfigIncomplete(QolsysException):
     pass
 
@@ -33,6 +53,14 @@ class UnableToParseSensorException(QolsysException):
     pass
 
 
+class QolsysLineTooLongException(QolsysException):
+    pass
+
+
+class QolsysIdleTimeoutException(QolsysException):
+    pass
+
+
 class UnknownQolsysControlException(QolsysException):
     pass
 
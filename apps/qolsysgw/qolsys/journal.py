@@ -0,0 +1,302 @@
+import bisect
+import collections
+import logging
+import mmap
+import os
+import struct
+import time
+
+from qolsys.events import QolsysEvent
+from qolsys.exceptions import UnableToParseEventException
+from qolsys.exceptions import UnknownQolsysEventException
+from qolsys.exceptions import UnknownQolsysSensorException
+from qolsys.exceptions import recorded_on
+from qolsys.metrics import QolsysMetrics
+from qolsys.state import QolsysState
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+QolsysJournalRecord = collections.namedtuple(
+    'QolsysJournalRecord', ['kind', 'timestamp', 'payload'])
+
+
+class QolsysJournal(object):
+    """
+    Append-only journal of what is exchanged with the panel: the raw lines
+    received from it, and the actions sent to it, redacted.
+
+    The journal is a directory of segments, rotated once they reach
+    `max_segment_size` bytes, of which only the last `max_segments` are
+    kept. Each segment is a sequence of records, each made of a header
+    (kind, timestamp, size of the payload) followed by the payload. Next to
+    each segment, a small index gives the offset of a record every
+    `index_interval` bytes with its timestamp, so that reading a time range
+    only needs to scan the records from the closest indexed one.
+
+    The records are written unbuffered, so that a record is in the file as
+    soon as it is appended, even if the gateway crashes; they are small and
+    rare enough to be written from the event loop.
+    """
+
+    KIND_RECEIVED = 0
+    KIND_SENT = 1
+
+    SEGMENT_SUFFIX = '.journal'
+    INDEX_SUFFIX = '.index'
+
+    _MAGIC = b'QGJ1'
+    _RECORD = struct.Struct('<BdI')
+    _INDEX = struct.Struct('<dQ')
+
+    def __init__(self, path: str, max_segment_size: int = None,
+                 max_segments: int = None, index_interval: int = None,
+                 metrics: QolsysMetrics = None, logger=None) -> None:
+        self._path = path
+        self._max_segment_size = max_segment_size or 16 * 1024 * 1024
+        self._max_segments = max_segments or 10
+        self._index_interval = index_interval or 64 * 1024
+        self._logger = logger or LOGGER
+
+        self._segment = None
+        self._index = None
+        self._size = 0
+        self._indexed_at = None
+        self._last_timestamp = 0
+        self._failing = False
+
+        metrics = metrics or QolsysMetrics()
+        self._metric_records = metrics.counter(
+            'journal_records', 'Records appended to the journal',
+            labelnames=('kind', ))
+        self._metric_bytes = metrics.counter(
+            'journal_bytes', 'Bytes appended to the journal')
+        self._metric_rotations = metrics.counter(
+            'journal_rotations', 'Segments of the journal rotated')
+        self._metric_errors = metrics.counter(
+            'journal_write_errors', 'Records that could not be appended to '
+            'the journal')
+
+    @property
+    def path(self):
+        return self._path
+
+    def received(self, line: str):
+        self.append(self.KIND_RECEIVED, line)
+
+    def sent(self, redacted: str):
+        self.append(self.KIND_SENT, redacted)
+
+    def append(self, kind: int, payload, timestamp: float = None):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+
+        # Keep the timestamps ordered, even if the clock goes back, as the
+        # index is searched by timestamp
+        timestamp = max(timestamp or time.time(), self._last_timestamp)
+
+        try:
+            self._append(kind, payload, timestamp)
+        except OSError:
+            self._metric_errors.inc()
+            if not self._failing:
+                self._logger.exception('Unable to write to the journal')
+            self._failing = True
+            self.close()
+            return
+
+        self._failing = False
+        self._last_timestamp = timestamp
+        self._metric_records.inc(kind='sent' if kind == self.KIND_SENT
+                                 else 'received')
+
+    def _append(self, kind, payload, timestamp):
+        record = self._RECORD.pack(kind, timestamp, len(payload)) + payload
+
+        if self._segment is not None and \
+                self._size + len(record) > self._max_segment_size:
+            self._metric_rotations.inc()
+            self.close()
+
+        if self._segment is None:
+            self._open(timestamp)
+
+        if self._indexed_at is None or \
+                self._size - self._indexed_at >= self._index_interval:
+            self._index.write(self._INDEX.pack(timestamp, self._size))
+            self._indexed_at = self._size
+
+        self._segment.write(record)
+        self._size += len(record)
+        self._metric_bytes.inc(len(record))
+
+    def _open(self, timestamp):
+        os.makedirs(self._path, exist_ok=True)
+
+        # Segments are named after their first timestamp, in microseconds,
+        # so that they sort in time order
+        name = f'{int(timestamp * 1e6):020d}'
+        segment_path = os.path.join(self._path, name + self.SEGMENT_SUFFIX)
+        index_path = os.path.join(self._path, name + self.INDEX_SUFFIX)
+
+        self._segment = open(segment_path, 'ab', buffering=0)
+        self._index = open(index_path, 'ab', buffering=0)
+        self._size = self._segment.tell()
+        if self._size == 0:
+            self._segment.write(self._MAGIC)
+            self._size = len(self._MAGIC)
+        self._indexed_at = None
+
+        for old in self.segments(self._path)[:-self._max_segments]:
+            self._logger.debug(f'Removing journal segment {old}')
+            for p in (old, old[:-len(self.SEGMENT_SUFFIX)] +
+                      self.INDEX_SUFFIX):
+                try:
+                    os.remove(p)
+                except FileNotFoundError:
+                    pass
+
+    def close(self):
+        for f in (self._segment, self._index):
+            if f is not None:
+                try:
+                    f.close()
+                except OSError:
+                    pass
+        self._segment = None
+        self._index = None
+
+    @classmethod
+    def segments(cls, path: str) -> list:
+        """
+        Return the paths of the segments of the journal in `path`, oldest
+        first
+        """
+        try:
+            names = os.listdir(path)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(path, name) for name in sorted(names)
+                if name.endswith(cls.SEGMENT_SUFFIX)]
+
+    @classmethod
+    def read(cls, path: str, start: float = None, end: float = None,
+             kinds: tuple = None):
+        """
+        Yield the records of the journal in `path` with a timestamp between
+        `start` and `end` included, oldest first; the segments are memory
+        mapped, and only those overlapping the time range are read
+        """
+        segments = cls.segments(path)
+        for i, segment in enumerate(segments):
+            if end is not None and cls._segment_start(segment) > end:
+                break
+            if start is not None and i + 1 < len(segments) and \
+                    cls._segment_start(segments[i + 1]) < start:
+                continue
+
+            for record in cls._read_segment(segment, start):
+                if end is not None and record.timestamp > end:
+                    return
+                if start is not None and record.timestamp < start:
+                    continue
+                if kinds is None or record.kind in kinds:
+                    yield record
+
+    @classmethod
+    def _segment_start(cls, segment):
+        name = os.path.basename(segment)[:-len(cls.SEGMENT_SUFFIX)]
+        return int(name) / 1e6
+
+    @classmethod
+    def _index_offset(cls, segment, start):
+        """
+        Return the offset of the last indexed record of `segment` that is
+        before `start`; records can share a timestamp, so those at `start`
+        might come before an indexed record at `start`
+        """
+        index_path = segment[:-len(cls.SEGMENT_SUFFIX)] + cls.INDEX_SUFFIX
+        try:
+            with open(index_path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return len(cls._MAGIC)
+
+        # Ignore a partially written entry at the end
+        entries = [cls._INDEX.unpack_from(data, i)
+                   for i in range(0, len(data) - cls._INDEX.size + 1,
+                                  cls._INDEX.size)]
+        i = bisect.bisect_left([timestamp for timestamp, _ in entries],
+                               start)
+        if i == 0:
+            return len(cls._MAGIC)
+        return entries[i - 1][1]
+
+    @classmethod
+    def _read_segment(cls, segment, start=None):
+        with open(segment, 'rb') as f:
+            try:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file, that cannot be mapped
+                return
+
+        with data:
+            if data[:len(cls._MAGIC)] != cls._MAGIC:
+                LOGGER.warning(f'Not a journal segment: {segment}')
+                return
+
+            offset = len(cls._MAGIC)
+            if start is not None:
+                offset = cls._index_offset(segment, start)
+
+            size = len(data)
+            while offset + cls._RECORD.size <= size:
+                kind, timestamp, length = cls._RECORD.unpack_from(data, offset)
+                offset += cls._RECORD.size
+                if offset + length > size:
+                    # Partially written record, e.g. after a crash
+                    LOGGER.warning(f'Truncated record at the end of the '
+                                   f'journal segment {segment}')
+                    return
+                yield QolsysJournalRecord(kind, timestamp,
+                                          data[offset:offset + length])
+                offset += length
+
+    @classmethod
+    def replay(cls, path: str, start: float = None, end: float = None,
+               state: QolsysState = None) -> QolsysState:
+        """
+        Apply the events received from the panel between `start` and `end`
+        to `state`, or to a new state, and return it; as the summary of the
+        panel resets the state, the replay usually starts at a summary.
+        The exceptions raised by the replay are recorded on that state.
+        """
+        if state is None:
+            state = QolsysState()
+
+        with recorded_on(state):
+            cls._replay(path, start, end, state)
+
+        return state
+
+    @classmethod
+    def _replay(cls, path, start, end, state):
+        for record in cls.read(path, start=start, end=end,
+                               kinds=(cls.KIND_RECEIVED, )):
+            if record.payload == b'ACK':
+                continue
+
+            try:
+                event = QolsysEvent.from_json(record.payload.decode('utf-8'))
+            except (ValueError, UnableToParseEventException,
+                    UnknownQolsysEventException,
+                    UnknownQolsysSensorException):
+                LOGGER.debug(f'Unable to parse journal record: {record}')
+                continue
+
+            try:
+                state.apply(event)
+            except:  # noqa: E722
+                LOGGER.exception(f'Error applying journal record: {record}')
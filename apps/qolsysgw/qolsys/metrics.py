@@ -0,0 +1,396 @@
+import asyncio
+import bisect
+import functools
+import logging
+import math
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    labels = ','.join(
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\')
+                                  .replace('"', '\\"')
+                                  .replace('\n', '\\n'))
+        for k, v in labels)
+    return f'{{{labels}}}'
+
+
+class QolsysMetric(object):
+    TYPE = None
+
+    def __init__(self, name: str, description: str,
+                 labelnames: tuple = ()) -> None:
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric '{self.name}' expects labels "
+                             f'{self.labelnames}, got {tuple(labels)}')
+        return tuple(labels[k] for k in self.labelnames)
+
+    def samples(self):
+        """
+        Return the samples of the metric, as (suffix, labels, value) tuples
+        with the labels as a tuple of (name, value) pairs
+        """
+        raise NotImplementedError
+
+    def as_dict(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.description}',
+            f'# TYPE {self.name} {self.TYPE}',
+        ]
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} '
+                         f'{_format_value(value)}')
+        return lines
+
+
+class QolsysMetricCounter(QolsysMetric):
+    TYPE = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        if not self.labelnames and not self._values:
+            return [('_total', (), 0)]
+        return [
+            ('_total', tuple(zip(self.labelnames, key)), value)
+            for key, value in sorted(self._values.items())
+        ]
+
+    def as_dict(self):
+        if not self.labelnames:
+            return self.value()
+        return {'/'.join(map(str, key)): value
+                for key, value in sorted(self._values.items())}
+
+
+class QolsysMetricGauge(QolsysMetric):
+    """
+    Gauge either set explicitly, or read from `function` when collected
+    """
+    TYPE = 'gauge'
+
+    def __init__(self, *args, function: callable = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values = {}
+        self._functions = {}
+        if function is not None:
+            self.set_function(function)
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: callable, **labels):
+        self._functions[self._key(labels)] = function
+
+    def get(self, **labels):
+        return self._get(self._key(labels))
+
+    def _get(self, key):
+        function = self._functions.get(key)
+        if function is not None:
+            return function()
+        return self._values.get(key, 0)
+
+    @property
+    def value(self):
+        return self.get()
+
+    def _items(self):
+        keys = set(self._values) | set(self._functions)
+        if not self.labelnames:
+            keys.add(())
+        for key in sorted(keys):
+            value = self._get(key)
+            if value is not None:
+                yield key, value
+
+    def samples(self):
+        return [('', tuple(zip(self.labelnames, key)), value)
+                for key, value in self._items()]
+
+    def as_dict(self):
+        if not self.labelnames:
+            return self.value
+        return {'/'.join(map(str, key)): value
+                for key, value in self._items()}
+
+
+class QolsysMetricHistogram(QolsysMetric):
+    TYPE = 'histogram'
+
+    DEFAULT_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25,
+                       .5, 1, 2.5, 5, 10)
+
+    def __init__(self, *args, buckets: tuple = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets or self.DEFAULT_BUCKETS))
+        # For each set of labels, the count of each bucket, with one more
+        # bucket for the values above the last bound (+Inf), the sum and
+        # the count of the values
+        self._values = {}
+
+    def _get(self, labels):
+        key = self._key(labels)
+        values = self._values.get(key)
+        if values is None:
+            values = self._values[key] = [[0] * (len(self.buckets) + 1), 0, 0]
+        return values
+
+    def observe(self, value: float, **labels):
+        values = self._get(labels)
+        values[0][bisect.bisect_left(self.buckets, value)] += 1
+        values[1] += value
+        values[2] += 1
+
+    def count(self, **labels):
+        values = self._values.get(self._key(labels))
+        return values[2] if values else 0
+
+    def sum(self, **labels):
+        values = self._values.get(self._key(labels))
+        return values[1] if values else 0
+
+    def samples(self):
+        items = sorted(self._values.items())
+        if not self.labelnames and not items:
+            items = [((), [[0] * (len(self.buckets) + 1), 0, 0])]
+
+        samples = []
+        for key, (counts, total, count) in items:
+            labels = tuple(zip(self.labelnames, key))
+
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf, ),
+                                           counts):
+                cumulative += bucket_count
+                samples.append(('_bucket',
+                                labels + (('le', _format_value(bound)), ),
+                                cumulative))
+            samples.append(('_sum', labels, total))
+            samples.append(('_count', labels, count))
+        return samples
+
+    def as_dict(self):
+        def summary(values):
+            _, total, count = values
+            return {
+                'count': count,
+                'sum': total,
+                'avg': total / count if count else None,
+            }
+
+        if not self.labelnames:
+            return summary(self._values.get((), [None, 0, 0]))
+        return {'/'.join(map(str, key)): summary(values)
+                for key, values in sorted(self._values.items())}
+
+
+class QolsysMetrics(object):
+    """
+    Registry of the metrics of the gateway, that can be rendered in the
+    Prometheus text exposition format, or as a dict to be published as JSON
+    """
+
+    def __init__(self, prefix: str = 'qolsysgw') -> None:
+        self._prefix = prefix
+        self._metrics = {}
+
+    def _register(self, cls, name, *args, **kwargs):
+        name = f'{self._prefix}_{name}' if self._prefix else name
+        metric = self._metrics.get(name)
+        if metric is None:
+            metric = self._metrics[name] = cls(name, *args, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric '{name}' already registered as a "
+                             f'{metric.TYPE}')
+        return metric
+
+    def counter(self, name: str, description: str,
+                labelnames: tuple = ()) -> QolsysMetricCounter:
+        return self._register(QolsysMetricCounter, name, description,
+                              labelnames=labelnames)
+
+    def gauge(self, name: str, description: str,
+              labelnames: tuple = (),
+              function: callable = None) -> QolsysMetricGauge:
+        return self._register(QolsysMetricGauge, name, description,
+                              labelnames=labelnames, function=function)
+
+    def histogram(self, name: str, description: str,
+                  labelnames: tuple = (),
+                  buckets: tuple = None) -> QolsysMetricHistogram:
+        return self._register(QolsysMetricHistogram, name, description,
+                              labelnames=labelnames, buckets=buckets)
+
+    def scoped(self, **labels) -> 'QolsysMetricsScope':
+        return QolsysMetricsScope(self, **labels)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def as_dict(self):
+        prefix = f'{self._prefix}_' if self._prefix else ''
+        return {
+            name[len(prefix):]: metric.as_dict()
+            for name, metric in self._metrics.items()
+        }
+
+
+class QolsysBoundMetric(object):
+    """
+    Metric with some of its labels already set, that are added to the
+    labels given to its methods
+    """
+
+    def __init__(self, metric: QolsysMetric, **labels) -> None:
+        self._metric = metric
+        self._labels = labels
+
+    def __getattr__(self, name):
+        attr = getattr(self._metric, name)
+        if not callable(attr):
+            return attr
+        return functools.partial(attr, **self._labels)
+
+
+class QolsysMetricsScope(object):
+    """
+    View of a registry that adds constant labels to the metrics created
+    through it, e.g. to tell apart the metrics of each panel; it offers the
+    same methods to create metrics as the registry
+    """
+
+    def __init__(self, metrics: QolsysMetrics, **labels) -> None:
+        self._metrics = metrics
+        self._labels = labels
+
+    def _labelnames(self, labelnames):
+        return tuple(self._labels) + tuple(labelnames)
+
+    def counter(self, name: str, description: str,
+                labelnames: tuple = ()) -> QolsysBoundMetric:
+        return QolsysBoundMetric(
+            self._metrics.counter(name, description,
+                                  labelnames=self._labelnames(labelnames)),
+            **self._labels)
+
+    def gauge(self, name: str, description: str, labelnames: tuple = (),
+              function: callable = None) -> QolsysBoundMetric:
+        gauge = self._metrics.gauge(name, description,
+                                    labelnames=self._labelnames(labelnames))
+        if function is not None:
+            gauge.set_function(function, **self._labels)
+        return QolsysBoundMetric(gauge, **self._labels)
+
+    def histogram(self, name: str, description: str,
+                  labelnames: tuple = (),
+                  buckets: tuple = None) -> QolsysBoundMetric:
+        return QolsysBoundMetric(
+            self._metrics.histogram(name, description,
+                                    labelnames=self._labelnames(labelnames),
+                                    buckets=buckets),
+            **self._labels)
+
+
+class QolsysMetricsServer(object):
+    """
+    Minimal HTTP server exposing the metrics in the Prometheus text
+    exposition format on GET /metrics
+    """
+
+    CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+    def __init__(self, metrics: QolsysMetrics, host: str = None,
+                 port: int = None, logger=None) -> None:
+        self._metrics = metrics
+        self._host = host or '127.0.0.1'
+        self._port = port or 0
+        self._logger = logger or LOGGER
+
+        self._server = None
+
+    @property
+    def port(self):
+        if self._server is None or not self._server.sockets:
+            return None
+        return self._server.sockets[0].getsockname()[1]
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, self._host, self._port)
+        self._logger.info(f'Serving metrics on http://{self._host}:'
+                          f'{self.port}/metrics')
+
+    async def stop(self):
+        if self._server is None:
+            return
+
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Read the headers until the empty line, we do not need them
+            while True:
+                line = await asyncio.wait_for(reader.readline(), timeout=5)
+                if not line or line in (b'\r\n', b'\n'):
+                    break
+
+            parts = request.decode('latin-1').split()
+            if len(parts) < 2 or parts[0] not in ('GET', 'HEAD'):
+                status, body = '405 Method Not Allowed', ''
+            elif parts[1].split('?')[0] not in ('/', '/metrics'):
+                status, body = '404 Not Found', ''
+            else:
+                status, body = '200 OK', self._metrics.render()
+
+            body = body.encode()
+            writer.write(
+                f'HTTP/1.1 {status}\r\n'
+                f'Content-Type: {self.CONTENT_TYPE}\r\n'
+                f'Content-Length: {len(body)}\r\n'
+                'Connection: close\r\n'
+                '\r\n'.encode())
+            if parts and parts[0] != 'HEAD':
+                writer.write(body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        except:  # noqa: E722
+            self._logger.exception('Error serving metrics')
+        finally:
+            writer.close()
@@ -1,23 +1,73 @@
 import logging
 
+from contextlib import contextmanager
+
 LOGGER = logging.getLogger(__name__)
 
 
 class QolsysObservable(object):
+    __slots__ = ('_observers', '_batched')
+
+    # Change notified when a batch of changes is done, with the list of
+    # the notifications of the batch, in order, as 'changes'
+    NOTIFY_BATCH = 'batch'
+
     def __init__(self):
-        self._observers = dict()
+        # Only allocated when the first observer registers, as most of the
+        # observable objects are sensors that might never be observed
+        self._observers = None
+        self._batched = None
 
     def register(self, observer, callback=None):
-        LOGGER.debug(f"Registering {repr(observer)} to {self} updates")
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(f"Registering {repr(observer)} to {self} updates")
         if callback is None:
             callback = getattr(observer, 'update')
+        if self._observers is None:
+            self._observers = dict()
         self._observers[observer] = callback
 
     def unregister(self, observer):
-        LOGGER.debug(f"Unregistering {repr(observer)} from {self} updates")
-        del self._observers[observer]
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(f"Unregistering {repr(observer)} from {self} updates")
+        if self._observers is not None:
+            self._observers.pop(observer, None)
+
+    @contextmanager
+    def batch(self):
+        """
+        Collect the notifications made in the context, and send them to the
+        observers in a single notification when leaving it; a batch with a
+        single notification is sent as that notification
+        """
+        if self._batched is not None:
+            # Nested batch, the outermost one will notify
+            yield
+            return
+
+        self._batched = []
+        try:
+            yield
+        finally:
+            batched, self._batched = self._batched, None
+
+            if len(batched) == 1:
+                self.notify(**batched[0])
+            elif batched:
+                self.notify(change=self.NOTIFY_BATCH, changes=batched)
 
     def notify(self, **payload):
-        LOGGER.debug(f"Notifying {self} observers with: {payload}")
+        if self._batched is not None:
+            self._batched.append(payload)
+            return
+
+        if not self._observers:
+            return
+
+        # Building the string representation can be expensive, only do it
+        # if it is going to be logged
+        if LOGGER.isEnabledFor(logging.DEBUG):
+            LOGGER.debug(f"Notifying {self} observers with: {payload}")
+
         for observer, callback in self._observers.items():
             callback(self, **payload)
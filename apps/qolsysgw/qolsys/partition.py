@@ -10,10 +10,25 @@ LOGGER = logging.getLogger(__name__)
 
 class QolsysPartition(QolsysObservable):
 
+    __slots__ = (
+        '_id',
+        '_name',
+        '_status',
+        '_secure_arm',
+        '_sensors',
+        '_sensors_by_id',
+        '_alarm_type',
+        '_last_error_type',
+        '_last_error_desc',
+        '_last_error_at',
+        '_disarm_failed',
+    )
+
     NOTIFY_ADD_SENSOR = 'add_sensor'
     NOTIFY_REMOVE_SENSOR = 'remove_sensor'
     NOTIFY_UPDATE_ALARM_TYPE = 'update_alarm_type'
     NOTIFY_UPDATE_ATTRIBUTES = 'update_attributes'
+    NOTIFY_UPDATE_NAME = 'update_name'
     NOTIFY_UPDATE_SECURE_ARM = 'update_secure_arm'
     NOTIFY_UPDATE_STATUS = 'update_status'
 
@@ -26,6 +41,9 @@ class QolsysPartition(QolsysObservable):
         self._status = status
         self._secure_arm = secure_arm
         self._sensors = {}
+        # Sensors by sensor id, in the order they were added, so we can find
+        # the first sensor using a given id
+        self._sensors_by_id = {}
         self._alarm_type = None
 
         self._last_error_type = None
@@ -73,11 +91,23 @@ class QolsysPartition(QolsysObservable):
     def disarm_failed(self):
         return self._disarm_failed
 
+    @name.setter
+    def name(self, value):
+        if self._name != value:
+            LOGGER.debug("Partition '%s' (%s) name updated to '%s'",
+                         self.id, self._name, value)
+            prev_value = self._name
+            self._name = value
+
+            self.notify(change=self.NOTIFY_UPDATE_NAME,
+                        prev_value=prev_value, new_value=value)
+
     @status.setter
     def status(self, value):
         new_value = value.upper()
         if self._status != new_value:
-            LOGGER.debug(f"Partition '{self.id}' ({self.name}) status updated to '{new_value}'")
+            LOGGER.debug("Partition '%s' (%s) status updated to '%s'",
+                         self.id, self.name, new_value)
             prev_value = self._status
 
             self._status = new_value
@@ -95,7 +125,8 @@ class QolsysPartition(QolsysObservable):
     def secure_arm(self, value):
         new_value = bool(value)
         if self._secure_arm != new_value:
-            LOGGER.debug(f"Partition '{self.id}' ({self.name}) secure arm updated to '{new_value}'")
+            LOGGER.debug("Partition '%s' (%s) secure arm updated to '%s'",
+                         self.id, self.name, new_value)
             prev_value = self._secure_arm
             self._secure_arm = new_value
 
@@ -108,7 +139,8 @@ class QolsysPartition(QolsysObservable):
             value = value.upper()
 
         if self._alarm_type != value:
-            LOGGER.debug(f"Partition '{self.id}' ({self.name}) alarm type updated to '{value}'")
+            LOGGER.debug("Partition '%s' (%s) alarm type updated to '%s'",
+                         self.id, self.name, value)
             prev_value = self._alarm_type
             self._alarm_type = value
 
@@ -120,7 +152,8 @@ class QolsysPartition(QolsysObservable):
         new_value = int(value)
 
         if self._disarm_failed != new_value:
-            LOGGER.debug(f"Partition '{self.id}' ({self.name}) disarm failed updated to '{value}'")
+            LOGGER.debug("Partition '%s' (%s) disarm failed updated to '%s'",
+                         self.id, self.name, value)
             self._disarm_failed = new_value
 
             self.notify(change=self.NOTIFY_UPDATE_ATTRIBUTES)
@@ -144,11 +177,23 @@ class QolsysPartition(QolsysObservable):
         return self._sensors.get(zone_id, default)
 
     def sensor(self, sensor_id, default=None):
-        for sensor in self._sensors.values():
-            if sensor.id == sensor_id:
-                return sensor
+        sensors = self._sensors_by_id.get(sensor_id)
+        if not sensors:
+            return default
+
+        return sensors[0]
 
-        return default
+    def _index_sensor(self, sensor):
+        self._sensors_by_id.setdefault(sensor.id, []).append(sensor)
+
+    def _unindex_sensor(self, sensor_id, sensor):
+        sensors = self._sensors_by_id.get(sensor_id)
+        if sensors is None or sensor not in sensors:
+            return
+
+        sensors.remove(sensor)
+        if not sensors:
+            del self._sensors_by_id[sensor_id]
 
     def add_sensor(self, sensor):
         psensor = self._sensors.get(sensor.zone_id)
@@ -160,6 +205,7 @@ class QolsysPartition(QolsysObservable):
             return
 
         self._sensors[sensor.zone_id] = sensor
+        self._index_sensor(sensor)
         self.notify(change=self.NOTIFY_ADD_SENSOR, new_value=sensor)
 
     def update_sensor(self, sensor):
@@ -167,7 +213,50 @@ class QolsysPartition(QolsysObservable):
         if psensor is None:
             return
 
-        psensor.update(sensor)
+        # The update can change the id of the sensor, in which case we need
+        # to index it under its new id
+        if psensor.id != sensor.id:
+            self._unindex_sensor(psensor.id, psensor)
+            psensor.update(sensor)
+            self._index_sensor(psensor)
+        else:
+            psensor.update(sensor)
+
+    def update(self, partition: 'QolsysPartition'):
+        if self.id != partition.id:
+            LOGGER.warning(f"Updating partition '{self.id}' ({self.name}) with "
+                           f"partition '{partition.id}' (different id)")
+
+        self.name = partition.name
+        self.secure_arm = partition.secure_arm
+        if partition.status is not None and \
+                self.status != partition.status.upper():
+            self.status = partition.status
+
+        self.remove_missing_sensors(partition)
+
+        for sensor in partition.sensors:
+            psensor = self._sensors.get(sensor.zone_id)
+
+            # If the zone is now used by a different device, we consider
+            # that the previous sensor was removed and the new one added,
+            # since those identify the entity
+            if psensor is not None and (type(psensor) is not type(sensor) or
+                                        psensor.id != sensor.id or
+                                        psensor.name != sensor.name):
+                self.remove_zone(sensor.zone_id)
+                psensor = None
+
+            if psensor is None:
+                sensor.partition = self
+                self.add_sensor(sensor)
+            else:
+                psensor.update(sensor)
+
+    def remove_missing_sensors(self, partition: 'QolsysPartition'):
+        for zone_id in list(self._sensors.keys()):
+            if partition.zone(zone_id) is None:
+                self.remove_zone(zone_id)
 
     def remove_sensor(self, sensor):
         self.remove_zone(sensor.zone_id)
@@ -176,10 +265,47 @@ class QolsysPartition(QolsysObservable):
         zone = self._sensors[zone_id]
 
         del self._sensors[zone_id]
+        self._unindex_sensor(zone.id, zone)
 
         self.notify(change=self.NOTIFY_REMOVE_SENSOR,
                     prev_value=zone)
 
+    def to_dict(self):
+        """
+        Return the partition as in the partition list of a summary of the
+        panel, with the attributes the panel does not send
+        """
+        return {
+            'partition_id': self._id,
+            'name': self._name,
+            'status': self._status,
+            'secure_arm': self._secure_arm,
+            'alarm_type': self._alarm_type,
+            'last_error_type': self._last_error_type,
+            'last_error_desc': self._last_error_desc,
+            'last_error_at': self._last_error_at,
+            'disarm_failed': self._disarm_failed,
+            'zone_list': [sensor.to_dict() for sensor in self.sensors],
+        }
+
+    def restore(self, data: dict):
+        """
+        Restore the attributes the panel does not send from the data
+        returned by to_dict
+        """
+        self.alarm_type = data.get('alarm_type')
+
+        self._last_error_type = data.get('last_error_type')
+        self._last_error_desc = data.get('last_error_desc')
+        self._last_error_at = data.get('last_error_at')
+        self._disarm_failed = int(data.get('disarm_failed') or 0)
+        self.notify(change=self.NOTIFY_UPDATE_ATTRIBUTES)
+
+        for sensor_data in data.get('zone_list', []):
+            sensor = self.zone(sensor_data.get('zone_id'))
+            if sensor is not None:
+                sensor.tampered = sensor_data.get('tampered', False)
+
     def __str__(self):
         return (f"<QolsysPartition id={self.id} name={self.name} "
                 f"status={self.status} secure_arm={self.secure_arm} "
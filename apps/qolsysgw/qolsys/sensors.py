@@ -1,23 +1,52 @@
-import json
 import logging
+import sys
 import time
 
+from qolsys import codec
+from qolsys.activity import QolsysSensorActivity
 from qolsys.exceptions import UnableToParseSensorException
 from qolsys.exceptions import UnknownQolsysSensorException
 from qolsys.observable import QolsysObservable
 from qolsys.partition import QolsysPartition
-from qolsys.utils import find_subclass
 
 
 LOGGER = logging.getLogger(__name__)
 
 
+def _intern(value):
+    # Those values are shared by a lot of sensors, so share the strings
+    # instead of keeping a copy for each sensor
+    return sys.intern(value) if isinstance(value, str) else value
+
+
 class QolsysSensor(QolsysObservable):
     NOTIFY_UPDATE_PATTERN = 'update_{attr}'
     NOTIFY_UPDATE_STATUS = 'update_status'
+    NOTIFY_UPDATE_TAMPERED = 'update_tampered'
     NOTIFY_UPDATE_ATTRIBUTES = 'update_attributes'
 
-    __SUBCLASSES_CACHE = {}
+    __slots__ = (
+        '_id',
+        '_name',
+        '_group',
+        '_status',
+        '_state',
+        '_zone_id',
+        '_zone_type',
+        '_zone_physical_type',
+        '_zone_alarm_type',
+        '_partition_id',
+        '_partition',
+        '_tampered',
+        '_last_open_tampered_at',
+        '_last_closed_tampered_at',
+        '_activity',
+    )
+
+    # The value of the 'type' key for this sensor class
+    _SENSOR_TYPE = None
+
+    __REGISTRY = {}
     _common_keys = [
         'name',
         'status',
@@ -33,6 +62,14 @@ class QolsysSensor(QolsysObservable):
         'tampered',
     ]
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+
+        # Only register classes that declare their own type, so that
+        # subclassing a sensor class does not override its registration
+        if '_SENSOR_TYPE' in cls.__dict__:
+            QolsysSensor.__REGISTRY[cls._SENSOR_TYPE] = cls
+
     def __init__(self, sensor_id: str, name: str, group: str, status: str,
                  state: str, zone_id: int, zone_type: int,
                  zone_physical_type: int, zone_alarm_type: int,
@@ -41,9 +78,9 @@ class QolsysSensor(QolsysObservable):
 
         self._id = sensor_id
         self._name = name
-        self._group = group
-        self._status = status
-        self._state = state
+        self._group = _intern(group)
+        self._status = _intern(status)
+        self._state = _intern(state)
         self._zone_id = zone_id
         self._zone_type = zone_type
         self._zone_physical_type = zone_physical_type
@@ -54,6 +91,8 @@ class QolsysSensor(QolsysObservable):
         self._tampered = False
         self._last_open_tampered_at = None
         self._last_closed_tampered_at = None
+        # Created on the first transition, as most sensors never change
+        self._activity = None
 
     @property
     def partition(self) -> QolsysPartition:
@@ -70,22 +109,25 @@ class QolsysSensor(QolsysObservable):
 
         # Because any of the attributes might have changed and we want to
         # be able to notify of all of those changes separately and only if they
-        # happened, we have to add a bit of smart in there
-        attributes_updated = False
-        for attr in ['id'] + self._common_keys + self.ATTRIBUTES:
-            local_attr = f'_{attr}'
-            prev_value = getattr(self, local_attr)
-            new_value = getattr(sensor, attr)
-            if prev_value != new_value:
-                setattr(self, local_attr, new_value)
-                self.notify(change=self.NOTIFY_UPDATE_PATTERN.format(attr=attr),
-                            prev_value=prev_value, new_value=new_value)
-
-                if attr in self.ATTRIBUTES:
-                    attributes_updated = True
-
-        if attributes_updated:
-            self.notify(change=self.NOTIFY_UPDATE_ATTRIBUTES)
+        # happened, we have to add a bit of smart in there; the observers
+        # receive all of those changes in a single batch notification
+        with self.batch():
+            attributes_updated = False
+            for attr in ['id'] + self._common_keys + self.ATTRIBUTES:
+                local_attr = f'_{attr}'
+                prev_value = getattr(self, local_attr)
+                new_value = getattr(sensor, attr)
+                if prev_value != new_value:
+                    setattr(self, local_attr, new_value)
+                    self._record_transition(attr, new_value)
+                    self.notify(change=self.NOTIFY_UPDATE_PATTERN.format(attr=attr),
+                                prev_value=prev_value, new_value=new_value)
+
+                    if attr in self.ATTRIBUTES:
+                        attributes_updated = True
+
+            if attributes_updated:
+                self.notify(change=self.NOTIFY_UPDATE_ATTRIBUTES)
 
     @property
     def id(self):
@@ -145,6 +187,23 @@ class QolsysSensor(QolsysObservable):
     def tampered(self):
         return self._tampered
 
+    @property
+    def activity(self) -> QolsysSensorActivity:
+        if self._activity is None:
+            self._activity = QolsysSensorActivity()
+        return self._activity
+
+    def _record_transition(self, attr, value):
+        if attr == 'status':
+            kind = QolsysSensorActivity.OPEN if value == 'Open' \
+                else QolsysSensorActivity.CLOSED
+        elif attr == 'tampered':
+            kind = QolsysSensorActivity.TAMPERED if value \
+                else QolsysSensorActivity.UNTAMPERED
+        else:
+            return
+        self.activity.record(kind)
+
     @property
     def is_open(self):
         return self._status == 'Open'
@@ -160,10 +219,12 @@ class QolsysSensor(QolsysObservable):
             raise AttributeError(f"Invalid value '{value}' for attribute 'status'")
 
         if self._status != new_value:
-            LOGGER.debug(f"Sensor '{self.id}' ({self.name}) status updated to '{new_value}'")
+            LOGGER.debug("Sensor '%s' (%s) status updated to '%s'",
+                         self.id, self.name, new_value)
             prev_value = self._status
 
-            self._status = new_value
+            self._status = sys.intern(new_value)
+            self._record_transition('status', new_value)
 
             self.notify(change=self.NOTIFY_UPDATE_STATUS,
                         prev_value=prev_value, new_value=new_value)
@@ -173,14 +234,17 @@ class QolsysSensor(QolsysObservable):
         new_value = bool(value)
 
         if self._tampered != new_value:
-            LOGGER.debug(f"Sensor '{self.id}' ({self.name}) tampered updated to '{new_value}'")
+            LOGGER.debug("Sensor '%s' (%s) tampered updated to '%s'",
+                         self.id, self.name, new_value)
             prev_value = self._tampered
 
             self._tampered = new_value
+            self._record_transition('tampered', new_value)
 
-            self.notify(change=self.NOTIFY_UPDATE_PATTERN.format(attr='tampered'),
-                        prev_value=prev_value, new_value=new_value)
-            self.notify(change=self.NOTIFY_UPDATE_ATTRIBUTES)
+            with self.batch():
+                self.notify(change=self.NOTIFY_UPDATE_TAMPERED,
+                            prev_value=prev_value, new_value=new_value)
+                self.notify(change=self.NOTIFY_UPDATE_ATTRIBUTES)
 
     def _next_status_update_is_status(self):
         # When we are back from a tamper setting, we get two updates
@@ -203,6 +267,16 @@ class QolsysSensor(QolsysObservable):
         else:
             self.status = 'Closed'
 
+    def to_dict(self):
+        """
+        Return the sensor as in the zone list of a summary of the panel,
+        with the attributes the panel does not send, like tampered
+        """
+        data = {'id': self._id, 'type': self._SENSOR_TYPE}
+        for attr in self._common_keys + self.ATTRIBUTES:
+            data[attr] = getattr(self, attr)
+        return data
+
     def __str__(self):
         return (f"<{type(self).__name__} id={self.id} name={self.name} "
                 f"group={self.group} status={self.status} "
@@ -215,7 +289,7 @@ class QolsysSensor(QolsysObservable):
     @classmethod
     def from_json(cls, data, partition):
         if isinstance(data, str):
-            data = json.loads(data)
+            data = codec.loads(data)
 
         sensor_type = data.get('type')
         if not sensor_type:
@@ -223,14 +297,17 @@ class QolsysSensor(QolsysObservable):
                 f'Sensor type not found for sensor {data}'
             )
 
-        klass = find_subclass(cls, sensor_type, cache=cls.__SUBCLASSES_CACHE,
-                              preserve_capitals=True)
+        klass = QolsysSensor.__REGISTRY.get(sensor_type)
         if not klass:
             raise UnknownQolsysSensorException(
                 f"Sensor type '{sensor_type}' unsupported for sensor {data}"
             )
 
-        return klass.from_json(data, partition, common=cls.from_json_common_data(data))
+        if cls is not QolsysSensor and not issubclass(klass, cls):
+            raise UnableToParseSensorException(
+                f"Cannot parse sensor '{sensor_type}' as {cls.__name__}")
+
+        return klass(partition=partition, **klass.from_json_common_data(data))
 
     @classmethod
     def from_json_common_data(cls, data):
@@ -239,144 +316,111 @@ class QolsysSensor(QolsysObservable):
         common_data['sensor_id'] = data['id']
         return common_data
 
-    @classmethod
-    def from_json_subclass(cls, subtype, data, partition, common=None):
-        sensor_type = data.get('type')
-        if sensor_type != subtype:
-            raise UnableToParseSensorException(
-                f"Cannot parse sensor '{sensor_type}'")
-
-        if common is None:
-            common = cls.from_json_common_data(data)
-
-        return cls(partition=partition, **common)
-
 
 class _QolsysSensorWithoutUpdates(object):
-    pass
+    __slots__ = ()
 
 
 class QolsysSensorDoorWindow(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Door_Window', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Door_Window'
 
 
 class QolsysSensorMotion(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Motion', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Motion'
 
 
 class QolsysSensorPanelMotion(QolsysSensorMotion):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Panel Motion', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Panel Motion'
 
 
 class QolsysSensorGlassBreak(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('GlassBreak', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'GlassBreak'
 
 
 class QolsysSensorPanelGlassBreak(QolsysSensorGlassBreak, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Panel Glass Break', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Panel Glass Break'
 
 
 class QolsysSensorBluetooth(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Bluetooth', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Bluetooth'
 
 
 class QolsysSensorSmokeDetector(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('SmokeDetector', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'SmokeDetector'
 
 
 class QolsysSensorCODetector(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('CODetector', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'CODetector'
 
 
 class QolsysSensorWater(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Water', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Water'
 
 
 class QolsysSensorFreeze(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Freeze', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Freeze'
 
 
 class QolsysSensorHeat(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Heat', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Heat'
 
 
 class QolsysSensorTilt(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Tilt', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Tilt'
 
 
 class QolsysSensorKeypad(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Keypad', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Keypad'
 
 
 class QolsysSensorAuxiliaryPendant(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Auxiliary Pendant', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Auxiliary Pendant'
 
 
 class QolsysSensorSiren(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Siren', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Siren'
 
 
 class QolsysSensorKeyFob(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('KeyFob', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'KeyFob'
 
 
 class QolsysSensorTemperature(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Temperature', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Temperature'
 
 
 class QolsysSensorTakeoverModule(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('TakeoverModule', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'TakeoverModule'
 
 
 class QolsysSensorTranslator(QolsysSensor, _QolsysSensorWithoutUpdates):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Translator', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Translator'
 
 
 class QolsysSensorDoorbell(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Doorbell', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Doorbell'
 
 
 class QolsysSensorShock(QolsysSensor):
-    @classmethod
-    def from_json(cls, data, partition, common=None):
-        return cls.from_json_subclass('Shock', data, partition, common)
+    __slots__ = ()
+    _SENSOR_TYPE = 'Shock'
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import os
+import time
+
+from qolsys import codec
+from qolsys.metrics import QolsysMetrics
+from qolsys.state import QolsysState
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class QolsysStateSnapshot(object):
+    """
+    Snapshot of the state of the panel in a local file, saved periodically
+    when it changed, so that the last known state can be restored right
+    away when the gateway starts, without waiting for the panel to send
+    its summary; the summary then reconciles the restored state.
+
+    The snapshot is written to a temporary file first, and then moved in
+    place, so that a crash while saving does not lose the previous one.
+    """
+
+    VERSION = 1
+
+    def __init__(self, path: str, state: QolsysState,
+                 interval: float = None, metrics: QolsysMetrics = None,
+                 logger=None) -> None:
+        self._path = path
+        self._state = state
+        self._interval = interval or 60
+        self._logger = logger or LOGGER
+
+        # Serialized state of the last snapshot saved or loaded, to only
+        # write the file when the state changed
+        self._last_saved = None
+
+        metrics = metrics or QolsysMetrics()
+        self._metric_saves = metrics.counter(
+            'state_snapshot_saves', 'Snapshots of the state saved to disk')
+        self._metric_save_errors = metrics.counter(
+            'state_snapshot_save_errors', 'Snapshots of the state that could '
+            'not be saved to disk')
+
+    @property
+    def path(self):
+        return self._path
+
+    def load(self) -> float:
+        """
+        Restore the state from the snapshot, and return the time at which
+        the snapshot was saved, or None if there was none to restore
+        """
+        try:
+            with open(self._path, 'rb') as f:
+                data = codec.loads(f.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError):
+            self._logger.exception('Unable to read the state snapshot '
+                                   f'{self._path}')
+            return None
+
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            self._logger.warning(f'Ignoring the state snapshot {self._path} '
+                                 'of an unsupported version')
+            return None
+
+        try:
+            # Restore into a separate state first, so that a corrupt
+            # snapshot does not leave part of a panel in the state, which
+            # would then be published; creating a state has no side effect,
+            # the exceptions stay recorded on the state of the panel
+            QolsysState().restore(data['state'])
+            self._state.restore(data['state'])
+        except:  # noqa: E722
+            self._logger.exception('Unable to restore the state snapshot '
+                                   f'{self._path}')
+            return None
+
+        self._last_saved = codec.dumps(data['state'])
+        return data.get('saved_at')
+
+    def save(self) -> bool:
+        """
+        Save the state if it changed since the last snapshot, and return
+        whether it was saved
+        """
+        state = self._state.to_dict()
+        if not state['partition_list']:
+            # Nothing known of the panel yet, keep the previous snapshot
+            return False
+
+        serialized = codec.dumps(state)
+        if serialized == self._last_saved:
+            return False
+
+        tmp_path = f'{self._path}.tmp'
+        try:
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            with open(tmp_path, 'wb') as f:
+                f.write(codec.dumps_bytes({
+                    'version': self.VERSION,
+                    'saved_at': time.time(),
+                    'state': state,
+                }))
+            os.replace(tmp_path, self._path)
+        except OSError:
+            self._metric_save_errors.inc()
+            self._logger.exception('Unable to save the state snapshot '
+                                   f'{self._path}')
+            return False
+
+        self._last_saved = serialized
+        self._metric_saves.inc()
+        return True
+
+    async def save_periodically(self):
+        while 'the gateway is running':
+            await asyncio.sleep(self._interval)
+            self.save()
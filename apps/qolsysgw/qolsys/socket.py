@@ -1,25 +1,169 @@
 import asyncio
+import itertools
 import json
 import logging
+import random
+import socket
 import ssl
+import time
 
 from qolsys.actions import QolsysAction
 from qolsys.actions import QolsysActionInfo
-from qolsys.events import QolsysEvent
+from qolsys.events import QolsysEventInfoSummary
+from qolsys.events import QolsysEventInfoSummaryStreamParser
+from qolsys.exceptions import QolsysIdleTimeoutException
+from qolsys.exceptions import QolsysLineTooLongException
 from qolsys.exceptions import UnknownQolsysEventException
 from qolsys.exceptions import UnknownQolsysSensorException
+from qolsys.metrics import QolsysMetrics
+from qolsys.tracker import QolsysActionTracker
+from qolsys.tracker import QolsysInflightAction
 from qolsys.utils import LoggerCallback
 
 
 LOGGER = logging.getLogger(__name__)
 
 
+class QolsysLineReader(object):
+    """
+    Read newline-delimited lines from an asyncio stream, without the size
+    limit of StreamReader.readline: lines can be up to `max_line_size`
+    bytes, and longer lines are skipped without closing the connection.
+
+    Lines longer than `stream_threshold` bytes are fed to `stream_parser`
+    while they are being received, so they can be parsed incrementally.
+
+    If nothing is received for `idle_timeout` seconds, readline raises
+    QolsysIdleTimeoutException.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader,
+                 max_line_size: int = None, chunk_size: int = None,
+                 stream_parser=None, stream_threshold: int = None,
+                 idle_timeout: float = None) -> None:
+        self._reader = reader
+        self._idle_timeout = idle_timeout or None
+        self._max_line_size = max_line_size or 16 * 1024 * 1024
+        self._chunk_size = chunk_size or 64 * 1024
+        self._stream_parser = stream_parser
+        self._stream_threshold = stream_threshold or self._chunk_size
+
+        self._buffer = bytearray()
+        # Where to start looking for the end of the line in the buffer,
+        # and how much of the line was fed to the stream parser
+        self._scanned = 0
+        self._fed = 0
+        self._discarding = 0
+
+        # time.monotonic() of the last bytes received
+        self.last_read_at = time.monotonic()
+
+    async def _read(self):
+        if self._idle_timeout is None:
+            return await self._reader.read(self._chunk_size)
+
+        try:
+            return await asyncio.wait_for(
+                self._reader.read(self._chunk_size),
+                timeout=self._idle_timeout)
+        except asyncio.TimeoutError:
+            raise QolsysIdleTimeoutException(
+                f'Nothing received for {self._idle_timeout} seconds')
+
+    async def readline(self) -> str:
+        """
+        Return the next line without its newline character, or None once
+        the stream reached its end
+        """
+        while True:
+            idx = self._buffer.find(b'\n', self._scanned)
+            if idx >= 0:
+                if self._discarding:
+                    size = self._discarding + idx
+                    self._reset_line(idx + 1)
+                    self._discarding = 0
+                    raise QolsysLineTooLongException(
+                        f'Skipped line of {size} bytes, longer than the '
+                        f'maximum of {self._max_line_size} bytes')
+
+                return self._pop_line(idx)
+
+            self._scanned = len(self._buffer)
+
+            if self._discarding or len(self._buffer) > self._max_line_size:
+                self._discarding += len(self._buffer)
+                self._reset_line(len(self._buffer))
+            elif self._stream_parser is not None and (
+                    self._fed or len(self._buffer) >= self._stream_threshold):
+                self._stream_parser.feed(self._buffer[self._fed:])
+                self._fed = len(self._buffer)
+
+            chunk = await self._read()
+            self.last_read_at = time.monotonic()
+            if not chunk:
+                if self._buffer and not self._discarding:
+                    # Return what we got of the last line, as readline does
+                    return self._pop_line(len(self._buffer))
+                return None
+
+            self._buffer += chunk
+
+    def _reset_line(self, size):
+        del self._buffer[:size]
+        self._scanned = 0
+        self._fed = 0
+        if self._stream_parser is not None:
+            self._stream_parser.reset()
+
+    def _pop_line(self, idx):
+        if self._stream_parser is not None:
+            if self._fed:
+                self._stream_parser.feed(self._buffer[self._fed:idx],
+                                         final=True)
+            else:
+                self._stream_parser.reset()
+
+        # Decode the line straight from the buffer, without copying it
+        with memoryview(self._buffer) as view:
+            line = str(view[:idx], 'utf-8')
+
+        del self._buffer[:idx + 1]
+        self._scanned = 0
+        self._fed = 0
+        self._discarding = 0
+        return line
+
+
+class QolsysSSLContext(ssl.SSLContext):
+    """
+    Client SSL context resuming `session` when connecting; asyncio does not
+    allow to give the session to resume, but creates the SSL objects of its
+    connections through wrap_bio
+    """
+
+    session = None
+
+    def wrap_bio(self, *args, session=None, **kwargs):
+        return super().wrap_bio(*args, session=session or self.session,
+                                **kwargs)
+
+
 class QolsysSocket(object):
     def __init__(self, hostname: str, port: int = None, token: str = None,
                  logger=None, callback: callable = None,
                  connected_callback: callable = None,
                  disconnected_callback: callable = None,
-                 keep_alive: int = None) -> None:
+                 keep_alive: int = None,
+                 metrics: QolsysMetrics = None,
+                 max_line_size: int = None,
+                 ack_timeout: float = None,
+                 event_timeout: float = None,
+                 action_retries: int = None,
+                 send_interval: float = None,
+                 idle_timeout: float = None,
+                 tcp_keepalive: int = None,
+                 dns_ttl: float = None,
+                 journal=None) -> None:
         self._hostname = hostname
         self._port = port or 12345
         self._token = token or ''
@@ -29,8 +173,109 @@ class QolsysSocket(object):
         self._connected_callback = connected_callback or LoggerCallback('Connected callback')
         self._disconnected_callback = disconnected_callback or LoggerCallback('Disconnected callback')
         self._keep_alive = keep_alive or 60 * 4  # 4mn, since the panel generally timeouts at 5mn
+        self._max_line_size = max_line_size
+        # Minimum delay between two actions written to the panel, which
+        # reads them one at a time
+        self._send_interval = 0.05 if send_interval is None else send_interval
+        # Reconnect if nothing is received for that long; off by default,
+        # as it relies on the panel answering the keep-alives, so that a
+        # connection staying silent after one can be considered dead
+        self._idle_timeout = idle_timeout or None
+        # Idle seconds before the OS starts sending TCP keepalive probes
+        self._tcp_keepalive = tcp_keepalive
+        # How long to reuse the resolved address of the panel
+        self._dns_ttl = 300 if dns_ttl is None else dns_ttl
+        # QolsysJournal recording the lines received and actions sent
+        self._journal = journal
+
+        # Kept across the connections, to resume the TLS session
+        self._ssl_context = QolsysSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+        self._ssl_context.check_hostname = False
+        self._ssl_context.verify_mode = ssl.CERT_NONE
+
+        self._address = None
+        self._resolved_at = None
+        self._reconnect_attempts = 0
+        # time.monotonic() of the disconnection, until the panel state is
+        # resynchronized with the summary on the next connection
+        self._disconnected_at = None
 
         self._writer = None
+        self._line_reader = None
+        self._last_sent_at = 0
+        self._send_queue = None
+        self._send_seq = itertools.count()
+
+        metrics = metrics or QolsysMetrics()
+        self._tracker = QolsysActionTracker(
+            write=self._write_action,
+            ack_timeout=ack_timeout,
+            event_timeout=event_timeout,
+            retries=action_retries,
+            metrics=metrics,
+            logger=self._logger,
+        )
+        self._metric_lines = metrics.counter(
+            'panel_lines_read', 'Lines read from the panel')
+        self._metric_acks = metrics.counter(
+            'panel_acks', 'ACK lines read from the panel')
+        self._metric_oversized_lines = metrics.counter(
+            'panel_oversized_lines', 'Lines read from the panel that were '
+            'skipped for being longer than the maximum line size')
+        self._metric_parse_failures = metrics.counter(
+            'panel_parse_failures', 'Lines read from the panel that could '
+            'not be parsed as an event', labelnames=('reason', ))
+        self._metric_events = metrics.counter(
+            'panel_events', 'Events received from the panel',
+            labelnames=('event', ))
+        self._metric_callback_errors = metrics.counter(
+            'panel_callback_errors', 'Errors raised by the event callback')
+        self._metric_callback_latency = metrics.histogram(
+            'panel_callback_latency_seconds', 'Time spent in the event '
+            'callback for each event received from the panel')
+        self._metric_connections = metrics.counter(
+            'panel_connections', 'Connections established to the panel')
+        self._metric_reconnects = metrics.counter(
+            'panel_reconnects', 'Reconnections to the panel after an error '
+            'or the connection being closed')
+        self._metric_connected = metrics.gauge(
+            'panel_connected', 'Whether the gateway is connected to the '
+            'panel', function=lambda: int(self._writer is not None))
+        self._metric_send_queue_depth = metrics.gauge(
+            'panel_send_queue_depth', 'Actions and keep-alives waiting to '
+            'be written to the panel', function=lambda: (
+                self._send_queue.qsize() if self._send_queue else 0))
+        self._metric_send_queue_wait = metrics.histogram(
+            'panel_send_queue_wait_seconds', 'Time spent by actions and '
+            'keep-alives in the queue before being written to the panel')
+        self._metric_keep_alives = metrics.counter(
+            'panel_keep_alives', 'Keep-alives sent to the panel after a '
+            'period without traffic')
+        self._metric_idle_timeouts = metrics.counter(
+            'panel_idle_timeouts', 'Connections to the panel reset after '
+            'receiving nothing for the idle timeout')
+        self._metric_last_received_age = metrics.gauge(
+            'panel_last_received_age_seconds', 'Time since the last bytes '
+            'were received from the panel', function=lambda: (
+                time.monotonic() - self._line_reader.last_read_at
+                if self._line_reader else None))
+        self._metric_dns_resolutions = metrics.counter(
+            'panel_dns_resolutions', 'Resolutions of the address of the '
+            'panel')
+        self._metric_tls_resumed = metrics.counter(
+            'panel_tls_sessions_resumed', 'Connections to the panel that '
+            'resumed the previous TLS session')
+        self._metric_connect_latency = metrics.histogram(
+            'panel_connect_seconds', 'Time to resolve, connect and complete '
+            'the TLS handshake with the panel')
+        self._metric_resync_latency = metrics.histogram(
+            'panel_resync_seconds', 'Time from the start of the gateway or '
+            'a disconnection to the summary of the panel being applied on '
+            'the next connection', buckets=(.1, .25, .5, 1, 2.5, 5, 10, 30,
+                                            60, 120, 300))
+        self._metric_backoff = metrics.gauge(
+            'panel_reconnect_backoff_seconds', 'Delay before the next '
+            'reconnection to the panel')
 
     def create_tasks(self, event_loop):
         return {
@@ -38,88 +283,312 @@ class QolsysSocket(object):
             'keep_alive': event_loop.create_task(self.keep_alive()),
         }
 
-    async def send(self, action: QolsysAction):
+    @property
+    def tracker(self):
+        return self._tracker
+
+    async def send(self, action: QolsysAction,
+                   received_at: float = None) -> QolsysInflightAction:
+        """
+        Send `action` to the panel, and return it as tracked until it is
+        acknowledged and the panel sent the resulting event; `received_at`
+        is the time.monotonic() at which the action was requested
+        """
         if self._writer is None:
             raise Exception('No writer')
 
-        self._logger.debug(f'Sending: {action.with_token(self._token)}')
-        self._writer.write(action.with_token(self._token).encode())
-        await self._writer.drain()
+        return await self._tracker.send(action, received_at=received_at)
+
+    async def _write_action(self, action: QolsysAction,
+                            on_written: callable = None):
+        if self._journal is not None:
+            on_written = self._journal_written(action, on_written)
+
+        # Encode the action once, the payload is also what gets logged
+        await self._enqueue(action.priority,
+                            action.with_token_bytes(self._token),
+                            on_written=on_written)
+
+    def _journal_written(self, action: QolsysAction, on_written: callable):
+        def written():
+            # Journal the action when actually written, so it is in the
+            # same order as on the connection
+            self._journal.sent(action.redacted)
+            if on_written is not None:
+                on_written()
+        return written
+
+    async def _enqueue(self, priority: int, payload: bytes,
+                       on_written: callable = None):
+        """
+        Queue `payload` to be written to the panel by the writer task, and
+        wait until it is written
+        """
+        if self._send_queue is None:
+            raise ConnectionError('Not connected to the panel')
+
+        future = asyncio.get_event_loop().create_future()
+        self._send_queue.put_nowait((priority, next(self._send_seq),
+                                     time.monotonic(), payload, on_written,
+                                     future))
+        await future
+
+    async def _write_queue(self, writer, queue):
+        """
+        Only task writing to the connection: write the queued payloads by
+        priority, and pause after each action so the panel does not get
+        several of them in a single read
+        """
+        while 'there is a connection to write to':
+            priority, _, queued_at, payload, on_written, future = \
+                await queue.get()
+            if future.done():
+                # The sender does not wait for it anymore
+                continue
+
+            self._metric_send_queue_wait.observe(time.monotonic() - queued_at)
+
+            if priority == QolsysAction.PRIORITY_KEEP_ALIVE:
+                self._logger.debug('Sending keep-alive')
+            elif self._logger.isEnabledFor(logging.DEBUG):
+                self._logger.debug(f'Sending: {payload.decode()}')
+
+            try:
+                writer.write(payload)
+                self._last_sent_at = time.monotonic()
+                if on_written is not None:
+                    on_written()
+                await writer.drain()
+            except asyncio.CancelledError:
+                if not future.done():
+                    future.set_exception(
+                        ConnectionError('Connection to the panel closed'))
+                raise
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+                continue
+
+            if not future.done():
+                future.set_result(None)
+
+            if priority < QolsysAction.PRIORITY_KEEP_ALIVE and \
+                    self._send_interval:
+                await asyncio.sleep(self._send_interval)
+
+    def _close_queue(self):
+        queue, self._send_queue = self._send_queue, None
+        while queue is not None and not queue.empty():
+            future = queue.get_nowait()[-1]
+            if not future.done():
+                future.set_exception(
+                    ConnectionError('Connection to the panel closed'))
+
+    def _idle_for(self):
+        last_traffic = self._last_sent_at
+        if self._line_reader is not None:
+            last_traffic = max(last_traffic, self._line_reader.last_read_at)
+        return time.monotonic() - last_traffic
 
     async def keep_alive(self):
+        """
+        Send a keep-alive once nothing was sent to or received from the
+        panel for the keep-alive interval
+        """
         while 'we need to keep the connection alive':
-            if self._writer is not None:
-                self._logger.debug('Sending keep-alive')
-                self._writer.write('\n'.encode())
-                await self._writer.drain()
-            await asyncio.sleep(self._keep_alive)
+            delay = self._keep_alive
+            if self._send_queue is not None:
+                idle = self._idle_for()
+                if idle < self._keep_alive:
+                    delay = self._keep_alive - idle
+                else:
+                    try:
+                        await self._enqueue(
+                            QolsysAction.PRIORITY_KEEP_ALIVE, b'\n',
+                            on_written=self._tracker.untracked_written)
+                        self._metric_keep_alives.inc()
+                    except ConnectionError:
+                        self._logger.debug('Connection closed while sending '
+                                           'keep-alive')
+            await asyncio.sleep(delay)
 
-    async def listen(self):
-        # Replace with https://docs.python.org/3/library/ssl.html#ssl.PROTOCOL_TLS_CLIENT ?
-        context = ssl.SSLContext(protocol=ssl.PROTOCOL_TLS_CLIENT)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_NONE
+    def _configure_socket(self, sock):
+        # asyncio already disables Nagle's algorithm on TCP connections,
+        # make sure our small writes are not delayed
+        options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)]
+
+        if self._tcp_keepalive:
+            options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+            # Those are not available on all platforms
+            for name, value in (('TCP_KEEPIDLE', self._tcp_keepalive),
+                                ('TCP_KEEPINTVL', 10),
+                                ('TCP_KEEPCNT', 3)):
+                if hasattr(socket, name):
+                    options.append((socket.IPPROTO_TCP,
+                                    getattr(socket, name), value))
+
+        for level, option, value in options:
+            try:
+                sock.setsockopt(level, option, value)
+            except OSError as e:
+                self._logger.debug(f'Unable to set socket option {option}: '
+                                   f'{e}')
 
-        server = (self._hostname, self._port)
+    async def _resolve(self):
+        now = time.monotonic()
+        if self._address is None or now - self._resolved_at > self._dns_ttl:
+            infos = await asyncio.get_event_loop().getaddrinfo(
+                self._hostname, self._port, type=socket.SOCK_STREAM)
+            self._metric_dns_resolutions.inc()
+            self._address = infos[0][4][:2]
+            self._resolved_at = now
+        return self._address
 
+    def _backoff(self):
+        # Capped exponential backoff, with jitter so that gateways do not
+        # all reconnect at the same time after the panel restarts
+        delay = min(2 ** (self._reconnect_attempts - 1), 60)
+        return random.uniform(delay / 2, delay)
+
+    async def listen(self):
         self._listen = True
-        delay_reconnect = 0
+        self._disconnected_at = time.monotonic()
+        connected_once = False
         while self._listen:
             writer = None
+            write_task = None
+            resynced = False
+            if connected_once:
+                self._metric_reconnects.inc()
             try:
                 self._logger.info('Establishing connection to '
-                                  f'{server[0]}:{server[1]}')
-                reader, writer = await asyncio.open_connection(
-                    *server, ssl=context, server_hostname='')
+                                  f'{self._hostname}:{self._port}')
+                start = time.monotonic()
+                try:
+                    address = await self._resolve()
+                    reader, writer = await asyncio.open_connection(
+                        *address, ssl=self._ssl_context, server_hostname='')
+                except:  # noqa: E722
+                    # Resolve again in case the panel changed address
+                    self._address = None
+                    raise
+                self._metric_connect_latency.observe(time.monotonic() - start)
+
                 self._writer = writer
+                connected_once = True
+
+                ssl_object = writer.get_extra_info('ssl_object')
+                if ssl_object is not None and ssl_object.session_reused:
+                    self._metric_tls_resumed.inc()
+
+                sock = writer.get_extra_info('socket')
+                if sock is not None:
+                    self._configure_socket(sock)
+
+                self._send_queue = asyncio.PriorityQueue()
+                write_task = asyncio.get_event_loop().create_task(
+                    self._write_queue(writer, self._send_queue))
+                self._metric_connections.inc()
+
+                stream_parser = QolsysEventInfoSummaryStreamParser()
+                line_reader = self._line_reader = QolsysLineReader(
+                    reader,
+                    max_line_size=self._max_line_size,
+                    stream_parser=stream_parser,
+                    idle_timeout=self._idle_timeout,
+                )
 
                 await self.send(QolsysActionInfo())
                 await self._connected_callback()
 
-                delay_reconnect = 0
                 while 'there is content to read':
-                    line = await reader.readline()
-                    if not line:
+                    try:
+                        line = await line_reader.readline()
+                    except QolsysLineTooLongException as e:
+                        self._metric_oversized_lines.inc()
+                        self._logger.error(str(e))
+                        continue
+                    except QolsysIdleTimeoutException as e:
+                        # The connection is most likely half-open
+                        self._metric_idle_timeouts.inc()
+                        self._logger.warning(f'{e}, exiting to reset the '
+                                             'connection')
+                        break
+
+                    if line is None:
                         self._logger.info('Connection closed by the panel, exiting to reset the connection')
                         break
 
-                    line = line.decode().rstrip('\n')
-                    self._logger.debug(f"Data received (len: {len(line)}): {line}")
+                    self._metric_lines.inc()
+                    if self._journal is not None:
+                        self._journal.received(line)
+                    self._logger.debug('Data received (len: %d): %s', len(line), line)
 
                     if line == 'ACK':
-                        # This is an ACK to a command we sent, we can ignore
-                        self._logger.debug('ACK - ignoring.')
+                        # This is an ACK to a command we sent
+                        self._metric_acks.inc()
+                        self._tracker.ack()
                         continue
 
                     try:
                         # We try to parse the event to one of our event classes
-                        event = QolsysEvent.from_json(line)
+                        event = stream_parser.parse(line)
                     except json.decoder.JSONDecodeError:
-                        self._logger.debug(f'Data is not JSON: {line}')
+                        self._metric_parse_failures.inc(reason='JSONDecodeError')
+                        self._logger.debug('Data is not JSON: %s', line)
                         continue
                     except UnknownQolsysEventException:
-                        self._logger.debug(f'Unknown Qolsys event: {line}')
+                        self._metric_parse_failures.inc(reason='UnknownQolsysEventException')
+                        self._logger.debug('Unknown Qolsys event: %s', line)
                         continue
                     except UnknownQolsysSensorException:
-                        self._logger.debug(f'Unknown sensor in Qolsys event: {line}')
+                        self._metric_parse_failures.inc(reason='UnknownQolsysSensorException')
+                        self._logger.debug('Unknown sensor in Qolsys event: %s', line)
                         continue
 
+                    self._metric_events.inc(event=type(event).__name__)
+                    self._tracker.event(event)
+
+                    start = time.perf_counter()
                     try:
                         await self._callback(event)
                     except:  # noqa: E722
+                        self._metric_callback_errors.inc()
                         self._logger.exception(f'Error calling callback for event: {line}')
+                    finally:
+                        self._metric_callback_latency.observe(
+                            time.perf_counter() - start)
+
+                    if not resynced and \
+                            isinstance(event, QolsysEventInfoSummary):
+                        resynced = True
+                        self._reconnect_attempts = 0
+                        self._metric_resync_latency.observe(
+                            time.monotonic() - self._disconnected_at)
             except asyncio.exceptions.CancelledError:
                 self._listen = False
                 self._logger.info('listening cancelled')
             except:  # noqa: E722
-                delay_reconnect = min(delay_reconnect * 2 or 1, 60)
                 self._logger.exception('error while listening')
             finally:
+                if resynced:
+                    self._disconnected_at = time.monotonic()
+                self._tracker.disconnected()
+                if write_task is not None:
+                    write_task.cancel()
+                self._close_queue()
                 await self._disconnected_callback()
 
                 self._writer = None
+                self._line_reader = None
 
                 if writer:
+                    # Keep the session, now that we received its tickets,
+                    # to resume it on the next connection
+                    ssl_object = writer.get_extra_info('ssl_object')
+                    if ssl_object is not None and ssl_object.session:
+                        self._ssl_context.session = ssl_object.session
+
                     writer.close()
                     try:
                         await writer.wait_closed()
@@ -129,6 +598,14 @@ class QolsysSocket(object):
                             'be fully closed; this might not be an issue if '
                             'the connection was closed on the other side')
 
+            # Reconnect right away if the connection was working, and back
+            # off if it failed before the panel state could be resynced
+            delay_reconnect = 0
+            if not resynced:
+                self._reconnect_attempts += 1
+                delay_reconnect = self._backoff()
+
+            self._metric_backoff.set(delay_reconnect)
             if self._listen and delay_reconnect:
-                self._logger.info(f'sleeping {delay_reconnect} second(s) before reconnecting')
+                self._logger.info(f'sleeping {delay_reconnect:.1f} second(s) before reconnecting')
                 await asyncio.sleep(delay_reconnect)
@@ -1,16 +1,24 @@
 import logging
 
-from mqtt.exceptions import MqttException
-
+from qolsys.events import QolsysEvent
+from qolsys.events import QolsysEventAlarm
+from qolsys.events import QolsysEventArming
+from qolsys.events import QolsysEventError
+from qolsys.events import QolsysEventInfoSecureArm
 from qolsys.events import QolsysEventInfoSummary
-from qolsys.exceptions import QolsysException
+from qolsys.events import QolsysEventZoneEventActive
+from qolsys.events import QolsysEventZoneEventAdd
+from qolsys.events import QolsysEventZoneEventUpdate
 from qolsys.observable import QolsysObservable
+from qolsys.partition import QolsysPartition
 
 
 LOGGER = logging.getLogger(__name__)
 
 
 class QolsysState(QolsysObservable):
+    NOTIFY_ADD_PARTITION = 'add_partition'
+    NOTIFY_REMOVE_PARTITION = 'remove_partition'
     NOTIFY_UPDATE_PARTITIONS = 'update_partitions'
     NOTIFY_UPDATE_ERROR = 'update_error'
 
@@ -20,12 +28,16 @@ class QolsysState(QolsysObservable):
         self._last_exception = None
 
         self._partitions = {}
+
+        # Indexes of the sensors of all the partitions, kept up to date by
+        # observing the partitions for sensors being added or removed
+        self._zones = {}
+        self._zone_partitions = {}
+        self._sensors_by_id = {}
+
         if event:
             self.update(event)
 
-        QolsysException.STATE = self
-        MqttException.STATE = self
-
     @property
     def last_exception(self):
         return self._last_exception
@@ -47,39 +59,109 @@ class QolsysState(QolsysObservable):
         return self._partitions.get(int(partition_id))
 
     def update(self, event: QolsysEventInfoSummary):
-        prev_partitions = self.partitions
+        # Reconcile the summary with the partitions and sensors we already
+        # know of, so that we only notify of what actually changed
+        new_partitions = {int(p.id): p for p in event.partitions}
 
-        self._partitions = {}
-        for partition in event.partitions:
-            self._partitions[int(partition.id)] = partition
+        # Start by removing what disappeared, so that zones moving from a
+        # partition to another are never seen in both at the same time
+        for partition_id, partition in list(self._partitions.items()):
+            new_partition = new_partitions.get(partition_id)
+            if new_partition is None:
+                self.remove_partition(partition_id)
+            else:
+                partition.remove_missing_sensors(new_partition)
+
+        for partition_id, new_partition in new_partitions.items():
+            partition = self._partitions.get(partition_id)
+            if partition is None:
+                self.add_partition(new_partition)
+            else:
+                partition.update(new_partition)
+
+    def add_partition(self, partition):
+        self._partitions[int(partition.id)] = partition
+
+        # Register before notifying, so that the indexes are up to date by
+        # the time other observers are notified of changes on the partition
+        partition.register(self, callback=self._partition_update)
+        for sensor in partition.sensors:
+            self._index_sensor(partition, sensor)
+
+        self.notify(change=self.NOTIFY_ADD_PARTITION,
+                    new_value=partition)
+
+    def remove_partition(self, partition_id):
+        partition = self._partitions.pop(int(partition_id))
+
+        partition.unregister(self)
+        for sensor in partition.sensors:
+            self._unindex_sensor(sensor)
+
+        self.notify(change=self.NOTIFY_REMOVE_PARTITION,
+                    prev_value=partition)
 
-        self.notify(change=self.NOTIFY_UPDATE_PARTITIONS,
-                    prev_value=prev_partitions,
-                    new_value=self.partitions)
+    def _partition_update(self, partition: QolsysPartition, change,
+                          prev_value=None, new_value=None):
+        if change == QolsysPartition.NOTIFY_ADD_SENSOR:
+            self._index_sensor(partition, new_value)
+        elif change == QolsysPartition.NOTIFY_REMOVE_SENSOR:
+            self._unindex_sensor(prev_value)
+
+    def _index_sensor(self, partition, sensor):
+        current = self._zones.get(sensor.zone_id)
+        if current is not None and current is not sensor:
+            LOGGER.warning(f"Zone ID '{sensor.zone_id}' of sensor "
+                           f"'{sensor.id}' ({sensor.name}) in partition "
+                           f"'{partition.id}' is already used by sensor "
+                           f"'{current.id}' ({current.name}) in partition "
+                           f"'{self._zone_partitions[sensor.zone_id].id}'")
+            self._unindex_sensor(current)
+
+        self._zones[sensor.zone_id] = sensor
+        self._zone_partitions[sensor.zone_id] = partition
+        self._sensors_by_id.setdefault(sensor.id, []).append(sensor)
+
+    def _unindex_sensor(self, sensor):
+        if self._zones.get(sensor.zone_id) is sensor:
+            del self._zones[sensor.zone_id]
+            del self._zone_partitions[sensor.zone_id]
+
+        sensors = self._sensors_by_id.get(sensor.id)
+        if sensors is not None and sensor in sensors:
+            sensors.remove(sensor)
+            if not sensors:
+                del self._sensors_by_id[sensor.id]
 
     def zone(self, zone_id):
-        for partition in self.partitions:
-            zone = partition.zone(zone_id)
-            if zone is not None:
-                return zone
+        return self._zones.get(zone_id)
+
+    def zone_partition(self, zone_id):
+        return self._zone_partitions.get(zone_id)
 
     def sensor(self, sensor_id):
-        for partition in self.partitions:
-            sensor = partition.sensor(sensor_id)
-            if sensor is not None:
-                return sensor
+        sensors = self._sensors_by_id.get(sensor_id)
+        if sensors:
+            return sensors[0]
 
     def zone_update(self, sensor):
         # Find where the zone is currently at
-        current_zone = self.zone(sensor.zone_id)
-        if current_zone is None:
+        current_partition = self.zone_partition(sensor.zone_id)
+        if current_partition is None:
             raise Exception(f'Zone not found for zone update: {sensor}, '
                             'we might not be sync-ed anymore')  # TODO: make it a better exception
 
-        if current_zone.partition_id == sensor.partition_id:
-            self._partitions[sensor.partition_id].update_sensor(sensor)
+        if current_partition.id == sensor.partition_id:
+            current_zone = self._zones[sensor.zone_id]
+            if current_zone.id != sensor.id:
+                # The sensor id changes, so reindex it under its new id
+                self._unindex_sensor(current_zone)
+                current_partition.update_sensor(sensor)
+                self._index_sensor(current_partition, current_zone)
+            else:
+                current_partition.update_sensor(sensor)
         else:
-            self._partitions[current_zone.partition_id].remove_zone(sensor.zone_id)
+            current_partition.remove_zone(sensor.zone_id)
             self._partitions[sensor.partition_id].add_sensor(sensor)
 
     def zone_add(self, sensor):
@@ -91,13 +173,131 @@ class QolsysState(QolsysObservable):
         self._partitions[sensor.partition_id].add_sensor(sensor)
 
     def zone_open(self, zone_id):
-        for partition in self.partitions:
-            zone = partition.zone(zone_id)
-            if zone is not None:
-                zone.open()
+        zone = self._zones.get(zone_id)
+        if zone is not None:
+            zone.open()
 
     def zone_closed(self, zone_id):
-        for partition in self.partitions:
-            zone = partition.zone(zone_id)
-            if zone is not None:
-                zone.closed()
+        zone = self._zones.get(zone_id)
+        if zone is not None:
+            zone.closed()
+
+    def apply(self, event: QolsysEvent):
+        """
+        Update the state with an event received from the panel
+        """
+        if isinstance(event, QolsysEventInfoSummary):
+            self.update(event)
+
+        elif isinstance(event, QolsysEventInfoSecureArm):
+            LOGGER.debug('INFO SecureArm partition_id=%s value=%s',
+                         event.partition_id, event.value)
+
+            partition = self.partition(event.partition_id)
+            if partition is None:
+                LOGGER.warning(f'Partition {event.partition_id} not found')
+                return
+
+            partition.secure_arm = event.value
+
+        elif isinstance(event, QolsysEventZoneEventActive):
+            LOGGER.debug('ACTIVE zone=%s', event.zone)
+
+            if event.zone.status.lower() == 'open':
+                self.zone_open(event.zone.id)
+            else:
+                self.zone_closed(event.zone.id)
+
+        elif isinstance(event, QolsysEventZoneEventUpdate):
+            LOGGER.debug('UPDATE zone=%s', event.zone)
+
+            # This event provides a full zone object, so we need to provide
+            # it our current partition object
+            partition = self.partition(event.zone.partition_id)
+            if partition is None:
+                LOGGER.warning(f'Partition {event.zone.partition_id} not found')
+                return
+            event.zone.partition = partition
+
+            self.zone_update(event.zone)
+
+        elif isinstance(event, QolsysEventZoneEventAdd):
+            LOGGER.debug('ADD zone=%s', event.zone)
+
+            # This event provides a full zone object, so we need to provide
+            # it our current partition object
+            partition = self.partition(event.zone.partition_id)
+            if partition is None:
+                LOGGER.warning(f'Partition {event.zone.partition_id} not found')
+                return
+            event.zone.partition = partition
+
+            self.zone_add(event.zone)
+
+        elif isinstance(event, QolsysEventArming):
+            LOGGER.debug('ARMING partition_id=%s status=%s',
+                         event.partition_id, event.arming_type)
+
+            partition = self.partition(event.partition_id)
+            if partition is None:
+                LOGGER.warning(f'Partition {event.partition_id} not found')
+                return
+
+            partition.status = event.arming_type
+
+        elif isinstance(event, QolsysEventAlarm):
+            LOGGER.debug('ALARM partition_id=%s', event.partition_id)
+
+            partition = self.partition(event.partition_id)
+            if partition is None:
+                LOGGER.warning(f'Partition {event.partition_id} not found')
+                return
+
+            partition.triggered(alarm_type=event.alarm_type)
+
+        elif isinstance(event, QolsysEventError):
+            LOGGER.debug('ERROR partition_id=%s', event.partition_id)
+
+            partition = self.partition(event.partition_id)
+            if partition is None:
+                LOGGER.warning(f'Partition {event.partition_id} not found')
+                return
+
+            partition.errored(error_type=event.error_type,
+                              error_description=event.description)
+
+        else:
+            LOGGER.info(f'UNCAUGHT event {event}; ignored')
+
+    def to_dict(self):
+        return {
+            'partition_list': [p.to_dict() for p in self.partitions],
+        }
+
+    def restore(self, data: dict):
+        """
+        Update the state from the data returned by to_dict, as if the panel
+        sent it as a summary
+        """
+        partition_list = []
+        for partition_data in data['partition_list']:
+            partition_list.append({
+                **partition_data,
+                # The tampered flag is not part of the sensors sent by the
+                # panel, it is restored once the sensors are created
+                'zone_list': [
+                    {k: v for k, v in sensor_data.items() if k != 'tampered'}
+                    for sensor_data in partition_data['zone_list']
+                ],
+            })
+
+        self.update(QolsysEvent.from_json({
+            'event': 'INFO',
+            'info_type': 'SUMMARY',
+            'partition_list': partition_list,
+        }))
+
+        for partition_data in data['partition_list']:
+            partition = self.partition(partition_data['partition_id'])
+            if partition is not None:
+                partition.restore(partition_data)
@@ -0,0 +1,269 @@
+import asyncio
+import collections
+import functools
+import itertools
+import logging
+import time
+
+from qolsys.actions import QolsysAction
+from qolsys.events import QolsysEvent
+from qolsys.events import QolsysEventError
+from qolsys.metrics import QolsysMetrics
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class QolsysInflightAction(object):
+    """
+    An action sent to the panel, waiting for its ACK and for the event
+    resulting from it
+    """
+
+    def __init__(self, seq: int, action: QolsysAction,
+                 received_at: float = None) -> None:
+        self.seq = seq
+        self.action = action
+        self.sent_at = time.monotonic()
+        self.written_at = None
+        # When the action was requested, e.g. when the control was received
+        # from MQTT, so the latencies include what happened before sending
+        self.received_at = received_at or self.sent_at
+        self.attempts = 0
+        self.acked_at = None
+        self.completed_at = None
+        self.event = None
+        self.result = None
+        self.done = asyncio.get_event_loop().create_future()
+
+        self._timer = None
+
+    @property
+    def ack_latency(self):
+        if self.acked_at is None:
+            return None
+        return self.acked_at - self.received_at
+
+    @property
+    def latency(self):
+        if self.completed_at is None:
+            return None
+        return self.completed_at - self.received_at
+
+    def __str__(self):
+        return (f'<{type(self).__name__} seq={self.seq} '
+                f'action={self.action.name} attempts={self.attempts} '
+                f'result={self.result}>')
+
+
+class QolsysActionTracker(object):
+    """
+    Track the actions sent to the panel until they are acknowledged and
+    the panel sent the resulting event (e.g. the ARMING event following an
+    ARMING action), with timeouts, and retries if the ACK does not come.
+
+    The panel's ACK does not say which action it is for, and the actions
+    all use the same nonce, so the ACKs are matched to the actions in the
+    order they were written to the connection; `write` is given the action
+    and a function to call as soon as the action is written.
+    """
+
+    RESULT_COMPLETED = 'completed'
+    RESULT_ERROR = 'error'
+    RESULT_ACK_TIMEOUT = 'ack_timeout'
+    RESULT_EVENT_TIMEOUT = 'event_timeout'
+    RESULT_DISCONNECTED = 'disconnected'
+
+    def __init__(self, write: callable, ack_timeout: float = None,
+                 event_timeout: float = None, retries: int = None,
+                 metrics: QolsysMetrics = None, logger=None) -> None:
+        self._write = write
+        self._ack_timeout = ack_timeout or 5
+        self._event_timeout = event_timeout or 30
+        self._retries = retries or 0
+        self._logger = logger or LOGGER
+
+        self._seq = itertools.count(1)
+        self._inflight = {}
+        # Actions written to the panel and waiting for their ACK, in the
+        # order they were written, which can differ from the order they
+        # were sent in as the writes are prioritized
+        self._unacked = collections.deque()
+
+        metrics = metrics or QolsysMetrics()
+        self._metric_actions = metrics.counter(
+            'panel_actions', 'Actions sent to the panel, by result',
+            labelnames=('action', 'result'))
+        self._metric_retries = metrics.counter(
+            'panel_action_retries', 'Actions sent again to the panel after '
+            'not receiving their ACK', labelnames=('action', ))
+        self._metric_ack_latency = metrics.histogram(
+            'panel_action_ack_latency_seconds', 'Time from the request of '
+            'an action to its ACK by the panel', labelnames=('action', ))
+        self._metric_latency = metrics.histogram(
+            'panel_action_latency_seconds', 'Time from the request of an '
+            'action to the event resulting from it', labelnames=('action', ))
+        metrics.gauge(
+            'panel_actions_inflight', 'Actions waiting for their ACK or '
+            'resulting event', function=lambda: len(self._inflight))
+
+    @property
+    def inflight(self):
+        return list(self._inflight.values())
+
+    async def send(self, action: QolsysAction,
+                   received_at: float = None) -> QolsysInflightAction:
+        inflight = QolsysInflightAction(next(self._seq), action,
+                                        received_at=received_at)
+        self._inflight[inflight.seq] = inflight
+
+        try:
+            await self._send(inflight)
+        except:  # noqa: E722
+            self._finish(inflight, self.RESULT_DISCONNECTED)
+            raise
+
+        return inflight
+
+    async def _send(self, inflight):
+        inflight.attempts += 1
+        await self._write(inflight.action,
+                          functools.partial(self._written, inflight))
+
+    def _written(self, inflight):
+        """
+        Called by the writer as soon as the action was written to the
+        connection, before any ACK for it can be read
+        """
+        if inflight.seq not in self._inflight:
+            return
+
+        inflight.written_at = time.monotonic()
+        self._unacked.append(inflight)
+        self._arm(inflight, self._ack_timeout, self._ack_timed_out)
+
+    def _arm(self, inflight, timeout, callback):
+        if inflight._timer is not None:
+            inflight._timer.cancel()
+        inflight._timer = asyncio.get_event_loop().call_later(
+            timeout, callback, inflight)
+
+    def untracked_written(self):
+        """
+        Called by the writer when something that is not tracked, like a
+        keep-alive, was written, as the panel will ACK it too
+        """
+        self._unacked.append(None)
+
+    def ack(self) -> QolsysInflightAction:
+        """
+        Match an ACK received from the panel to the oldest action waiting
+        for one, and return that action
+        """
+        if not self._unacked:
+            self._logger.debug('ACK received without any action in flight')
+            return None
+
+        inflight = self._unacked.popleft()
+        if inflight is None:
+            self._logger.debug('ACK received for an untracked write')
+            return None
+
+        inflight.acked_at = time.monotonic()
+        self._metric_ack_latency.observe(inflight.ack_latency,
+                                         action=inflight.action.name)
+        self._logger.debug('ACK received for %s after %.3fs',
+                           inflight, inflight.ack_latency)
+
+        if inflight.event is not None:
+            # The resulting event came before the ACK
+            self._finish(inflight, inflight.result)
+        else:
+            self._arm(inflight, self._event_timeout, self._event_timed_out)
+
+        return inflight
+
+    def event(self, event: QolsysEvent) -> QolsysInflightAction:
+        """
+        Match an event received from the panel to the oldest action it
+        results from, if any, and return that action
+        """
+        inflight = next((i for i in self._inflight.values()
+                         if i.event is None and i.action.matches(event)),
+                        None)
+        if inflight is None:
+            return None
+
+        inflight.event = event
+        result = self.RESULT_ERROR if isinstance(event, QolsysEventError) \
+            else self.RESULT_COMPLETED
+
+        if inflight.acked_at is None:
+            # Wait for the ACK, so it is not matched to another action
+            inflight.result = result
+        else:
+            self._finish(inflight, result)
+
+        return inflight
+
+    def disconnected(self):
+        """
+        Fail all the actions in flight, as the ACK and events of a
+        connection will not come on the next one
+        """
+        for inflight in list(self._inflight.values()):
+            self._finish(inflight, self.RESULT_DISCONNECTED)
+
+    def _ack_timed_out(self, inflight):
+        # Do not match a late ACK to this attempt, as the action will be
+        # written again or dropped
+        self._unacked.remove(inflight)
+
+        if inflight.attempts <= self._retries:
+            self._logger.warning(f'No ACK received for {inflight} after '
+                                 f'{self._ack_timeout}s, retrying')
+            self._metric_retries.inc(action=inflight.action.name)
+            asyncio.get_running_loop().create_task(self._retry(inflight))
+            return
+
+        self._logger.error(f'No ACK received for {inflight} after '
+                           f'{self._ack_timeout}s')
+        self._finish(inflight, self.RESULT_ACK_TIMEOUT)
+
+    async def _retry(self, inflight):
+        try:
+            await self._send(inflight)
+        except:  # noqa: E722
+            self._logger.exception(f'Error sending again {inflight}')
+            self._finish(inflight, self.RESULT_DISCONNECTED)
+
+    def _event_timed_out(self, inflight):
+        self._logger.warning(f'No event received for {inflight} '
+                             f'{self._event_timeout}s after its ACK')
+        self._finish(inflight, self.RESULT_EVENT_TIMEOUT)
+
+    def _finish(self, inflight, result):
+        if self._inflight.pop(inflight.seq, None) is None:
+            return
+
+        if inflight._timer is not None:
+            inflight._timer.cancel()
+            inflight._timer = None
+
+        inflight.result = result
+        inflight.completed_at = time.monotonic()
+
+        try:
+            self._unacked.remove(inflight)
+        except ValueError:
+            pass
+
+        self._metric_actions.inc(action=inflight.action.name, result=result)
+        if result in (self.RESULT_COMPLETED, self.RESULT_ERROR):
+            self._metric_latency.observe(inflight.latency,
+                                         action=inflight.action.name)
+
+        self._logger.debug('%s done after %.3fs', inflight, inflight.latency)
+
+        if not inflight.done.done():
+            inflight.done.set_result(inflight)
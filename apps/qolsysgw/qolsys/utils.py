@@ -1,6 +1,11 @@
+import asyncio
+import json
 import logging
+import os
 import re
+import socket
 import subprocess
+import time
 
 
 LOGGER = logging.getLogger(__name__)
@@ -21,44 +26,17 @@ async def defaultLoggerCallback(*args, **kwargs):
     callback(*args, **kwargs)
 
 
-def all_subclasses(cls):
-    return set(cls.__subclasses__()).union(
-        [s for c in cls.__subclasses__() for s in all_subclasses(c)])
-
-
-def find_subclass(cls, subtype: str, cache: dict = None, normalize=True,
-                  preserve_capitals=False):
-    if cache and subtype in cache:
-        return cache[subtype]
-
-    normalized_subtype = subtype
-    if normalize:
-        normalized_subtype = re.compile(r'[\W_]+').sub(' ', normalized_subtype)
-        if preserve_capitals:
-            normalized_subtype = re.compile(r'(?<=[^\s])([A-Z])').sub(
-                ' \\1', normalized_subtype)
-        normalized_subtype = normalized_subtype.title()
-        normalized_subtype = re.compile(r'\s').sub('', normalized_subtype)
-
-    search = f"{cls.__name__}{normalized_subtype}"
-
-    for klass in all_subclasses(cls):
-        if klass.__name__ == search:
-            if cache is not None:
-                cache[subtype] = klass
-            return klass
-
-    if cache is not None:
-        cache[subtype] = None
-    return None
-
-
 def get_mac_from_host(ip_or_host):
     try:
         # The arp command will automatically resolve the hostname to an
         # IP address for us if needed
-        process = subprocess.run(['arp', ip_or_host], capture_output=True)
-    except subprocess.SubprocessError:
+        process = subprocess.run(['arp', ip_or_host], capture_output=True,
+                                 timeout=5)
+    except FileNotFoundError:
+        LOGGER.warning(f"Unable to get the mac address for '{ip_or_host}': "
+                       "the arp command is not available")
+        return None
+    except (subprocess.SubprocessError, OSError):
         LOGGER.exception(f"Error trying to get the mac address for '{ip_or_host}'")
         return None
 
@@ -73,3 +51,110 @@ def get_mac_from_host(ip_or_host):
     mac = m[0]
     LOGGER.debug(f"Found mac address '{mac}' for '{ip_or_host}'")
     return mac
+
+
+class MacResolver(object):
+    """
+    Find the mac address of a host without blocking the event loop: from
+    the ARP table of the kernel in /proc/net/arp when available, or else
+    with get_mac_from_host run in an executor. The addresses found are
+    cached for `ttl` seconds, in the JSON file `cache_path` if given so
+    that they are known right away on the next start.
+    """
+
+    PROC_NET_ARP = '/proc/net/arp'
+
+    def __init__(self, cache_path: str = None, ttl: float = None,
+                 proc_net_arp: str = None, logger=None) -> None:
+        self._cache_path = cache_path
+        self._ttl = ttl or 24 * 60 * 60
+        self._proc_net_arp = proc_net_arp or self.PROC_NET_ARP
+        self._logger = logger or LOGGER
+
+        self._cache = None
+
+    async def resolve(self, host: str) -> str:
+        loop = asyncio.get_running_loop()
+
+        if self._cache is None:
+            self._cache = await loop.run_in_executor(None, self._load_cache)
+
+        entry = self._cache.get(host)
+        if entry is not None and time.time() - entry['at'] < self._ttl:
+            self._logger.debug(f"Using cached mac address '{entry['mac']}' "
+                               f"for '{host}'")
+            return entry['mac']
+
+        mac = None
+        addresses = await self._addresses(host)
+        if addresses:
+            mac = await loop.run_in_executor(None, self._from_proc_net_arp,
+                                             addresses)
+        if mac is None:
+            mac = await loop.run_in_executor(None, get_mac_from_host, host)
+        if mac is None:
+            return None
+
+        self._cache[host] = {'mac': mac, 'at': time.time()}
+        await loop.run_in_executor(None, self._save_cache, dict(self._cache))
+        return mac
+
+    async def _addresses(self, host):
+        try:
+            infos = await asyncio.get_running_loop().getaddrinfo(
+                host, None, family=socket.AF_INET)
+        except OSError as e:
+            self._logger.debug(f"Unable to resolve '{host}': {e}")
+            return set()
+        return {info[4][0] for info in infos}
+
+    def _from_proc_net_arp(self, addresses):
+        try:
+            with open(self._proc_net_arp) as f:
+                lines = f.readlines()[1:]
+        except OSError:
+            return None
+
+        # IP address, HW type, Flags, HW address, Mask, Device
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 4 or fields[0] not in addresses:
+                continue
+
+            # Incomplete entries have no flags and a null address
+            flags, mac = int(fields[2], 16), fields[3].lower()
+            if flags & 0x2 and mac != '00:00:00:00:00:00':
+                self._logger.debug(f"Found mac address '{mac}' for "
+                                   f"'{fields[0]}' in {self._proc_net_arp}")
+                return mac
+
+        return None
+
+    def _load_cache(self):
+        if not self._cache_path:
+            return {}
+
+        try:
+            with open(self._cache_path) as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self._logger.warning(f'Ignoring the mac address cache '
+                                 f'{self._cache_path}: {e}')
+            return {}
+
+        return cache if isinstance(cache, dict) else {}
+
+    def _save_cache(self, cache):
+        if not self._cache_path:
+            return
+
+        tmp_path = f'{self._cache_path}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self._cache_path)
+        except OSError as e:
+            self._logger.warning(f'Unable to save the mac address cache '
+                                 f'{self._cache_path}: {e}')
@@ -0,0 +1,225 @@
+import argparse
+import asyncio
+import json
+import logging
+import signal
+
+from gateway_base import QolsysGatewayBase
+from mqtt.client import MqttClient
+from mqtt.client import MqttMessage
+from mqtt.utils import topic_matches
+from qolsys.exceptions import QolsysGwConfigError
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class QolsysStandaloneGateway(QolsysGatewayBase):
+    """
+    The gateway running on a bare asyncio loop, with its own MQTT client
+    instead of AppDaemon's MQTT plugin; the messages received by the client
+    are given to the listeners as they are received, without going through
+    an event bus.
+
+    `args` are the arguments of the AppDaemon app, and `mqtt_args` the keys
+    of the configuration of AppDaemon's MQTT plugin that apply to the client:
+    client_host, client_port, client_user, client_password, client_id,
+    birth_topic, birth_payload, will_topic and will_payload.
+    """
+
+    _DEFAULT_MQTT_CONFIG = {
+        'client_host': '127.0.0.1',
+        'client_port': 1883,
+        'client_user': None,
+        'client_password': None,
+        'client_id': 'qolsysgw',
+        'birth_topic': None,
+        'birth_payload': 'online',
+        'will_topic': None,
+        'will_payload': 'offline',
+    }
+
+    def __init__(self, args: dict, mqtt_args: dict = None) -> None:
+        super().__init__()
+
+        self.args = args
+        self._client = None
+        self._listeners = []
+        self._tasks = set()
+
+        cfg = dict(self._DEFAULT_MQTT_CONFIG)
+        for k, v in (mqtt_args or {}).items():
+            if k not in cfg:
+                raise QolsysGwConfigError(
+                    f"Unknown MQTT configuration key '{k}'")
+            if v is not None:
+                cfg[k] = v
+
+        # As AppDaemon, use the status topic of the client for both the
+        # birth and will messages by default
+        status_topic = f"{cfg['client_id']}/status"
+        cfg['birth_topic'] = cfg['birth_topic'] or status_topic
+        cfg['will_topic'] = cfg['will_topic'] or status_topic
+        self._mqtt_cfg = cfg
+
+    async def _mqtt_plugin_config(self, namespace: str) -> dict:
+        return dict(self._mqtt_cfg)
+
+    def _init_metrics(self):
+        super()._init_metrics()
+
+        # The client is created with the metrics of the gateway, so its
+        # own metrics are part of the stats and of the metrics endpoint
+        cfg = self._mqtt_cfg
+        self._client = MqttClient(
+            host=cfg['client_host'],
+            port=cfg['client_port'],
+            client_id=cfg['client_id'],
+            username=cfg['client_user'],
+            password=cfg['client_password'],
+            will=MqttMessage(cfg['will_topic'], cfg['will_payload'],
+                             retain=True),
+            birth=MqttMessage(cfg['birth_topic'], cfg['birth_payload'],
+                              retain=True),
+            on_message=self._on_message,
+            metrics=self._metrics,
+        )
+        self._client.start()
+
+    @property
+    def mqtt_client(self):
+        return self._client
+
+    def create_task(self, coro):
+        task = asyncio.get_event_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def mqtt_publish(self, topic: str, payload=None, retain: bool = False,
+                     qos: int = 0, namespace: str = None, **kwargs):
+        return self._client.publish(topic, payload, qos=qos, retain=retain)
+
+    def mqtt_subscribe(self, topic: str, namespace: str = None, **kwargs):
+        self._client.subscribe(topic)
+
+    def listen_event(self, callback: callable, event: str = None,
+                     topic: str = None, wildcard: str = None,
+                     namespace: str = None, **kwargs):
+        self._listeners.append((wildcard or topic, callback))
+
+    def _on_message(self, message: MqttMessage):
+        data = {
+            'topic': message.topic,
+            'payload': message.payload.decode(errors='replace'),
+        }
+
+        # Each message is handled in its own task, as with AppDaemon, so
+        # that waiting on the panel does not block the client; the tasks
+        # are started in the order of the messages
+        for topic_filter, callback in self._listeners:
+            if topic_matches(topic_filter, message.topic):
+                self.create_task(callback('MQTT_MESSAGE', data, {}))
+
+    async def terminate(self):
+        await super().terminate()
+
+        if self._client is not None:
+            await self._client.stop()
+
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def load_config(path: str, app: str = None):
+    """
+    Return the arguments of the app and the configuration of the MQTT client
+    from a YAML or JSON file, which contains either the arguments of the
+    app, with the configuration of the MQTT client in an `mqtt` section, or
+    an AppDaemon apps.yaml, in which case `app` is the name of the app to
+    run if there are several
+    """
+    with open(path) as f:
+        content = f.read()
+
+    if path.endswith('.json'):
+        data = json.loads(content)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            raise QolsysGwConfigError(
+                f"Reading '{path}' requires PyYAML; install it, or use a "
+                "JSON configuration file")
+        data = yaml.safe_load(content)
+
+    if not isinstance(data, dict):
+        raise QolsysGwConfigError(f"Invalid configuration in '{path}'")
+
+    apps = {
+        name: value for name, value in data.items()
+        if isinstance(value, dict) and value.get('class') == 'QolsysGateway'
+    }
+    if app is not None:
+        if app not in apps:
+            raise QolsysGwConfigError(f"No app '{app}' in '{path}'")
+        data = apps[app]
+    elif apps:
+        if len(apps) > 1:
+            raise QolsysGwConfigError(
+                f"Several apps in '{path}', choose one of "
+                f"{', '.join(sorted(apps))}")
+        data = next(iter(apps.values()))
+
+    args = {k: v for k, v in data.items() if k not in ('module', 'class')}
+    mqtt_args = args.pop('mqtt', None) or {}
+    return args, mqtt_args
+
+
+async def run(gateway: QolsysStandaloneGateway):
+    stop = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            # Signal handlers are not available on all platforms
+            pass
+
+    await gateway.initialize()
+    try:
+        await stop.wait()
+    finally:
+        await gateway.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m qolsysgw',
+        description='Run the Qolsys gateway without AppDaemon')
+    parser.add_argument(
+        'config',
+        help='YAML or JSON file with the arguments of the app, and the '
+             'configuration of the MQTT client in an mqtt section; can also '
+             'be an AppDaemon apps.yaml')
+    parser.add_argument(
+        '--app',
+        help='name of the app to run, if the configuration file has several')
+    parser.add_argument(
+        '--log-level', default='INFO',
+        choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'],
+        help='level of the logs written to the standard error')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        level=args.log_level,
+        format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    app_args, mqtt_args = load_config(args.config, app=args.app)
+    try:
+        asyncio.run(run(QolsysStandaloneGateway(app_args, mqtt_args)))
+    except KeyboardInterrupt:
+        pass
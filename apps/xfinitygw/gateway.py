@@ -10,6 +10,7 @@ from mqtt.listener import MqttXfinityEventListener
 from mqtt.updater import MqttUpdater
 from mqtt.updater import MqttWrapperFactory
 
+from xfinity import codec
 from xfinity.config import XfinityGatewayConfig
 from xfinity.control import XfinityControl
 from xfinity.events import XfinityEvent
@@ -101,6 +102,7 @@ class XfinityGateway(Mqtt):
         self._is_terminated = False
 
         cfg = self._cfg = XfinityGatewayConfig(self.args)
+        codec.use(cfg.json_codec)
 
         # Handle the change in the function becoming sync vs. async
         ad_version = versiontuple(self.get_ad_version())
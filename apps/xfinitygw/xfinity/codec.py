@@ -0,0 +1,66 @@
+import importlib.util
+import json
+import logging
+from typing import Any, Optional, Union
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _StdlibCodec:
+    """JSON codec using the standard library, with cached encoder/decoder"""
+    NAME = 'json'
+
+    def __init__(self):
+        self._encoder = json.JSONEncoder()
+        self._decoder = json.JSONDecoder()
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        if not isinstance(data, str):
+            data = str(data, 'utf-8')
+        return self._decoder.decode(data)
+
+    def dumps(self, obj: Any) -> str:
+        return self._encoder.encode(obj)
+
+
+class _OrjsonCodec:
+    """JSON codec using orjson, which raises a subclass of json.JSONDecodeError"""
+    NAME = 'orjson'
+
+    def __init__(self):
+        import orjson
+        self._orjson = orjson
+
+    def loads(self, data: Union[str, bytes]) -> Any:
+        return self._orjson.loads(data)
+
+    def dumps(self, obj: Any) -> str:
+        return self._orjson.dumps(obj).decode()
+
+
+_CODECS = {codec.NAME: codec for codec in (_StdlibCodec, _OrjsonCodec)}
+_codec = _StdlibCodec()
+
+
+def use(name: Optional[str] = None):
+    """Select the JSON codec by name, or 'auto' to use orjson if installed"""
+    global _codec
+
+    if name is None or name == 'auto':
+        name = 'orjson' if importlib.util.find_spec('orjson') else 'json'
+
+    codec_class = _CODECS.get(name)
+    if not codec_class:
+        raise ValueError(f'Unknown JSON codec: {name}')
+
+    _codec = codec_class()
+    LOGGER.debug(f'Using JSON codec {name}')
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    return _codec.loads(data)
+
+
+def dumps(obj: Any) -> str:
+    return _codec.dumps(obj)
@@ -40,6 +40,9 @@ class XfinityGatewayConfig:
         # Box settings
         self._box_parental_code = args.get('box_parental_code')
 
+        # JSON codec: 'json' (standard library), 'orjson', or 'auto'
+        self.json_codec = args.get('json_codec', 'json')
+
     @property
     def box_parental_code(self) -> Optional[str]:
         return self._box_parental_code
\ No newline at end of file
@@ -1,7 +1,7 @@
-import json
 import logging
 from typing import Dict, Optional
 
+from . import codec
 from .config import XfinityGatewayConfig
 from .state import XfinityState
 
@@ -35,7 +35,7 @@ class XfinityControl:
 
     @classmethod
     def from_json(cls, json_str: str) -> 'XfinityControl':
-        data = json.loads(json_str)
+        data = codec.loads(json_str)
         control_type = data.get('control_type')
         
         if not control_type:
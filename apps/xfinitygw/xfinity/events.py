@@ -1,7 +1,8 @@
-import json
 import logging
 from typing import Dict, Optional, Type
 
+from . import codec
+
 
 LOGGER = logging.getLogger(__name__)
 
@@ -14,7 +15,7 @@ class XfinityEvent:
 
     @classmethod
     def from_json(cls, json_str: str) -> 'XfinityEvent':
-        data = json.loads(json_str)
+        data = codec.loads(json_str)
         event_type = data.get('event_type')
         
         if not event_type:
@@ -1,10 +1,10 @@
 import asyncio
-import json
 import logging
 import ssl
 import websockets
 from typing import Dict, Optional, Callable
 
+from . import codec
 from .events import XfinityEvent
 
 
@@ -94,7 +94,7 @@ class XfinitySocket:
             await self._connect()
 
         try:
-            await self._websocket.send(json.dumps(message))
+            await self._websocket.send(codec.dumps(message))
         except Exception as e:
             LOGGER.error(f"Failed to send message: {e}")
             self._connected = False
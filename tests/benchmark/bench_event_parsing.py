@@ -0,0 +1,47 @@
+"""
+Microbenchmark of the per-event parse cost of QolsysEvent.from_json over
+a recorded panel stream.
+
+Usage: python tests/benchmark/bench_event_parsing.py [--repeat N] [--number N]
+"""
+import json
+
+import testenv  # noqa: F401
+from benchbase import argument_parser
+from benchbase import load_panel_stream
+from benchbase import report
+from benchbase import timeit
+
+from qolsys.events import QolsysEvent
+
+
+def main():
+    parser = argument_parser(__doc__)
+    args = parser.parse_args()
+
+    lines = load_panel_stream()
+    decoded = [json.loads(line) for line in lines]
+
+    print(f'{len(lines)} events in recorded stream')
+
+    report('from_json(str)',
+           timeit(lambda: [QolsysEvent.from_json(line) for line in lines],
+                  args.repeat, args.number),
+           len(lines) * args.number)
+
+    report('from_json(dict)',
+           timeit(lambda: [QolsysEvent.from_json(data) for data in decoded],
+                  args.repeat, args.number),
+           len(decoded) * args.number)
+
+    # The summary dominates the cost of the stream, so also report the
+    # cost of the dispatch for the small, frequent events only
+    small = [data for data in decoded if data.get('info_type') != 'SUMMARY']
+    report('from_json(dict) without summary',
+           timeit(lambda: [QolsysEvent.from_json(data) for data in small],
+                  args.repeat, args.number),
+           len(small) * args.number)
+
+
+if __name__ == '__main__':
+    main()
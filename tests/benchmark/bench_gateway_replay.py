@@ -0,0 +1,259 @@
+"""
+Throughput benchmark of the whole gateway pipeline: events are replayed
+by a mock panel (testutils.mock_panel.PanelServer) to a gateway running
+on the mock AppDaemon MQTT API, and go through QolsysSocket.listen,
+QolsysEvent.from_json, QolsysGateway.mqtt_event_callback and the
+MqttUpdater down to mqtt_publish.
+
+The events are either the recorded panel stream, or a synthetic stream
+of ZONE_ACTIVE events on a synthetic panel. They are sent at a given rate
+(or as fast as possible with --rate 0), and the benchmark reports:
+- the throughput, from the first event sent to the last entity publish;
+- the end-to-end latency of each event, from the moment it is written by
+  the panel to the last entity publish before the next event is written
+  (only meaningful if the rate lets each event be handled before the
+  next one, events without publish in their slot are not accounted for);
+- the CPU time per event, which includes the mock panel and MQTT API as
+  they run in the same process;
+- the memory allocated during the replay, traced in a separate run as
+  tracing the allocations slows the pipeline down.
+
+Usage: python tests/benchmark/bench_gateway_replay.py [--source SOURCE]
+           [--zones N] [--partitions N] [--events N] [--rate N]
+           [--event-mode MODE]
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import tracemalloc
+
+import testenv  # noqa: F401
+from benchbase import load_panel_stream
+from benchbase import synthetic_summary
+from testutils.mock_panel import PanelServer
+
+from gateway import QolsysGateway
+
+
+def synthetic_zone_events(zones, count, seed=0):
+    rng = random.Random(seed)
+    status = {}
+
+    lines = []
+    for _ in range(count):
+        zone_id = 10000 + rng.randrange(zones)
+        # Alternate the status of each zone, so every event is a change
+        status[zone_id] = 'Open' if status.get(zone_id) != 'Open' else 'Closed'
+        lines.append(json.dumps({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'version': 1,
+            'zone': {
+                'status': status[zone_id],
+                'zone_id': zone_id,
+            },
+            'requestID': '<request_id>',
+        }))
+
+    return lines
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+class _PublishRecorder(object):
+    """
+    Records the time of the publishes of the entities, ignoring the events
+    forwarded to the event topic by the gateway
+    """
+
+    def __init__(self, event_topic):
+        self._event_topic = event_topic
+        self.published_at = []
+
+    def __call__(self, topic, payload, **kwargs):
+        if topic != self._event_topic:
+            self.published_at.append(time.perf_counter())
+
+
+async def _wait_until_idle(gw, recorder, quiet=.2, timeout=60):
+    """
+    Wait until the gateway did not publish anything for `quiet` seconds
+    """
+    start = time.perf_counter()
+    count = -1
+    while count != len(recorder.published_at) or gw._publish_queue.depth:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError('Timeout waiting for the gateway to be idle')
+        count = len(recorder.published_at)
+        await asyncio.sleep(quiet)
+
+
+async def _start(summary, event_mode):
+    panel = PanelServer()
+    await panel.start()
+
+    gw = QolsysGateway()
+    gw.args = {
+        'panel_host': 'localhost',
+        'panel_port': panel.port,
+        'panel_token': '<panel_token>',
+        'panel_mac': '00:00:00:00:00:00',
+        'event_mode': event_mode,
+    }
+    await gw.initialize()
+
+    # Wait for the INFO request of the gateway, and answer it
+    await panel.wait_for_next_message(timeout=5, raise_on_timeout=True)
+
+    recorder = _PublishRecorder(gw._cfg.event_topic)
+    gw.mqtt_publish_func = recorder
+
+    await panel.writeline(summary)
+    await _wait_until_idle(gw, recorder)
+    if not gw._state.partitions:
+        raise RuntimeError('The gateway did not load the summary of the panel')
+
+    return panel, gw, recorder
+
+
+def _clear_mock_storage(panel, gw):
+    # The mocks store every message and log, which we do not want to
+    # account for in the allocations
+    gw.PUBLISHED.MESSAGES.clear()
+    gw.PUBLISHED.SAVED_MESSAGES_POS = 0
+    gw.CAPTURED_LOGS.MESSAGES.clear()
+    gw.CAPTURED_LOGS.SAVED_MESSAGES_POS = 0
+    panel.MESSAGES.MESSAGES.clear()
+    panel.MESSAGES.SAVED_MESSAGES_POS = 0
+
+
+async def _replay(panel, gw, recorder, lines, rate):
+    interval = 1 / rate if rate else 0
+
+    recorder.published_at.clear()
+    written_at = []
+
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    for i, line in enumerate(lines):
+        if interval:
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        written_at.append(time.perf_counter())
+        await panel.writeline(line)
+
+        if not interval:
+            # Let the gateway read what we wrote
+            await asyncio.sleep(0)
+
+    await _wait_until_idle(gw, recorder, quiet=.05)
+    cpu = time.process_time() - cpu_start
+
+    published_at = recorder.published_at
+    end = published_at[-1] if published_at else time.perf_counter()
+
+    # For each event, the last publish before the next event was written
+    latencies = []
+    j = 0
+    for i, t in enumerate(written_at):
+        next_t = written_at[i + 1] if i + 1 < len(written_at) else float('inf')
+        last = None
+        while j < len(published_at) and published_at[j] < next_t:
+            if published_at[j] >= t:
+                last = published_at[j]
+            j += 1
+        if last is not None:
+            latencies.append(last - t)
+
+    return {
+        'duration': end - start,
+        'cpu': cpu,
+        'latencies': latencies,
+        'published': len(published_at),
+    }
+
+
+async def run(args):
+    if args.source == 'recorded':
+        stream = load_panel_stream()
+        summary, lines = stream[0], stream[1:]
+        lines = (lines * (args.events // len(lines) + 1))[:args.events]
+    else:
+        summary = json.dumps(synthetic_summary(args.zones, args.partitions))
+        lines = synthetic_zone_events(args.zones, args.events)
+
+    panel, gw, recorder = await _start(summary, args.event_mode)
+    try:
+        _clear_mock_storage(panel, gw)
+
+        # Warm up the pipeline
+        await _replay(panel, gw, recorder, lines[:100], 0)
+        _clear_mock_storage(panel, gw)
+
+        result = await _replay(panel, gw, recorder, lines, args.rate)
+        _clear_mock_storage(panel, gw)
+
+        tracemalloc.start()
+        try:
+            before, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            await _replay(panel, gw, recorder, lines, args.rate)
+            _, peak = tracemalloc.get_traced_memory()
+            _clear_mock_storage(panel, gw)
+            after, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    finally:
+        await gw.terminate()
+        panel.stop()
+
+    n = len(lines)
+    latencies = result['latencies']
+
+    print(f'{n} {args.source} events, rate={args.rate or "max"}/s, '
+          f'event_mode={args.event_mode}')
+    print(f'{"throughput":<20} {n / result["duration"]:10.1f} events/s '
+          f'({result["published"]} publishes)')
+    if latencies:
+        print(f'{"latency":<20} '
+              f'p50={statistics.median(latencies) * 1e3:8.3f}ms '
+              f'p99={percentile(latencies, 99) * 1e3:8.3f}ms '
+              f'max={max(latencies) * 1e3:8.3f}ms '
+              f'({len(latencies)} events measured)')
+    print(f'{"cpu":<20} {result["cpu"] / n * 1e6:10.1f} us/event')
+    print(f'{"memory":<20} peak={(peak - before) / n:10.1f} bytes/event '
+          f'retained={(after - before) / n:10.1f} bytes/event')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--source', choices=['synthetic', 'recorded'],
+                        default='synthetic',
+                        help='replay a synthetic or the recorded stream')
+    parser.add_argument('--zones', type=int, default=100,
+                        help='number of zones of the synthetic panel')
+    parser.add_argument('--partitions', type=int, default=1,
+                        help='number of partitions of the synthetic panel')
+    parser.add_argument('--events', type=int, default=2000,
+                        help='number of events to replay')
+    parser.add_argument('--rate', type=float, default=500,
+                        help='events per second, 0 to send as fast as possible')
+    parser.add_argument('--event-mode', choices=['mqtt', 'direct'],
+                        default='mqtt',
+                        help='event mode of the gateway')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
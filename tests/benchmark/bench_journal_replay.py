@@ -0,0 +1,69 @@
+"""
+Benchmark of the event journal: the recorded panel stream is appended to
+a journal in a temporary directory, then read back and replayed through
+QolsysEvent.from_json and QolsysState at full speed, for the whole journal
+and for a time range found through the index.
+
+Usage: python tests/benchmark/bench_journal_replay.py [--events N]
+           [--repeat N] [--number N]
+"""
+import os
+import tempfile
+
+import testenv  # noqa: F401
+from benchbase import argument_parser
+from benchbase import load_panel_stream
+from benchbase import report
+from benchbase import timeit
+
+from qolsys.journal import QolsysJournal
+
+
+def main():
+    parser = argument_parser(__doc__, number=1)
+    parser.add_argument('--events', type=int, default=100000,
+                        help='number of lines appended to the journal')
+    args = parser.parse_args()
+
+    stream = load_panel_stream(skip_ack=False)
+    summary, lines = stream[0], stream[1:]
+    lines = (lines * (args.events // len(lines) + 1))[:args.events - 1]
+    lines = [summary] + lines
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'journal')
+
+        def append():
+            journal = QolsysJournal(path, max_segments=1000)
+            for i, line in enumerate(lines):
+                journal.append(QolsysJournal.KIND_RECEIVED, line,
+                               timestamp=1000 + i / 100)
+            journal.close()
+
+        report('append', timeit(append, 1, 1), len(lines))
+
+        size = sum(os.path.getsize(p) for p in QolsysJournal.segments(path))
+        print(f'{len(lines)} lines, {size} bytes in '
+              f'{len(QolsysJournal.segments(path))} segments')
+
+        report('read',
+               timeit(lambda: sum(1 for _ in QolsysJournal.read(path)),
+                      args.repeat, args.number),
+               len(lines) * args.number)
+
+        report('replay',
+               timeit(lambda: QolsysJournal.replay(path),
+                      args.repeat, args.number),
+               len(lines) * args.number)
+
+        # The last tenth of the journal, found through the index
+        start = 1000 + len(lines) * 0.9 / 100
+        count = sum(1 for _ in QolsysJournal.read(path, start=start))
+        report('read last 10%',
+               timeit(lambda: sum(1 for _ in QolsysJournal.read(
+                   path, start=start)), args.repeat, args.number),
+               count * args.number)
+
+
+if __name__ == '__main__':
+    main()
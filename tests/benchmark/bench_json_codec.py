@@ -0,0 +1,73 @@
+"""
+Benchmark of the JSON codecs (qolsys.codec) over the recorded panel
+traffic: decoding the lines as str and as bytes, encoding the decoded
+events back, and the whole QolsysEvent.from_json, for each available
+backend.
+
+Usage: python tests/benchmark/bench_json_codec.py [--repeat N] [--number N]
+"""
+import testenv  # noqa: F401
+from benchbase import argument_parser
+from benchbase import load_panel_stream
+from benchbase import report
+from benchbase import timeit
+
+from qolsys import codec
+from qolsys.codec import QolsysJsonCodec
+from qolsys.events import QolsysEvent
+
+
+def main():
+    parser = argument_parser(__doc__)
+    args = parser.parse_args()
+
+    lines = load_panel_stream()
+    lines_bytes = [line.encode() for line in lines]
+    data = [codec.loads(line) for line in lines]
+
+    print(f'{len(lines)} lines, {sum(map(len, lines_bytes))} bytes')
+
+    best = {}
+    for name in QolsysJsonCodec.names():
+        try:
+            # Switching backends on purpose, without the warning
+            codec.reset()
+            c = codec.use(name)
+        except ValueError as e:
+            print(f'{name}: {e}')
+            continue
+
+        best[name] = report(
+            f'{name}: loads(str)',
+            timeit(lambda: [c.loads(line) for line in lines],
+                   args.repeat, args.number),
+            len(lines) * args.number)
+        report(f'{name}: loads(bytes)',
+               timeit(lambda: [c.loads(line) for line in lines_bytes],
+                      args.repeat, args.number),
+               len(lines) * args.number)
+        report(f'{name}: dumps',
+               timeit(lambda: [c.dumps(d) for d in data],
+                      args.repeat, args.number),
+               len(lines) * args.number)
+        report(f'{name}: dumps_bytes',
+               timeit(lambda: [c.dumps_bytes(d) for d in data],
+                      args.repeat, args.number),
+               len(lines) * args.number)
+        report(f'{name}: QolsysEvent.from_json',
+               timeit(lambda: [QolsysEvent.from_json(line) for line in lines],
+                      args.repeat, args.number),
+               len(lines) * args.number)
+
+    codec.reset()
+
+    if len(best) > 1:
+        baseline = best['json']
+        for name, value in best.items():
+            if name != 'json':
+                print(f'{name} loads(str) is {baseline / value:.1f}x the '
+                      'speed of json')
+
+
+if __name__ == '__main__':
+    main()
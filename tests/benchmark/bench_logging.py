@@ -0,0 +1,137 @@
+"""
+Throughput benchmark of the gateway pipeline depending on the log level
+AppDaemon is configured with for the app: a synthetic stream of ZONE_ACTIVE
+events is replayed as fast as possible by a mock panel
+(testutils.mock_panel.PanelServer), once with DEBUG disabled and once with
+DEBUG enabled, and the benchmark reports the events per second and the CPU
+time per event of each run.
+
+With DEBUG disabled, the debug messages of the hot paths are not even
+formatted; with DEBUG enabled, they are formatted on the event loop and
+handed to AppDaemon from a background thread.
+
+Usage: python tests/benchmark/bench_logging.py [--zones N] [--events N]
+           [--repeat N]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+import testenv  # noqa: F401
+from bench_gateway_replay import synthetic_zone_events
+from benchbase import synthetic_summary
+from testutils.mock_panel import PanelServer
+
+from gateway import QolsysGateway
+
+
+class _LastPublish(object):
+
+    def __init__(self):
+        self.count = 0
+        self.published_at = None
+
+    def __call__(self, topic, payload, **kwargs):
+        self.count += 1
+        self.published_at = time.perf_counter()
+
+
+async def _wait_until_idle(gw, last_publish, quiet=.05, timeout=60):
+    start = time.perf_counter()
+    count = -1
+    while count != last_publish.count or gw._publish_queue.depth:
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError('Timeout waiting for the gateway to be idle')
+        count = last_publish.count
+        await asyncio.sleep(quiet)
+
+
+async def _run(summary, lines, level):
+    panel = PanelServer()
+    await panel.start()
+
+    gw = QolsysGateway()
+    gw.args = {
+        'panel_host': 'localhost',
+        'panel_port': panel.port,
+        'panel_token': '<panel_token>',
+        'panel_mac': '00:00:00:00:00:00',
+        'event_mode': 'direct',
+    }
+
+    # The logger AppDaemon gives to the app, with the level of the app
+    gw.logger = logging.getLogger('AppDaemon.qolsys_panel')
+    gw.logger.setLevel(level)
+    gw._redirect_logging()
+
+    try:
+        await gw.initialize()
+        await panel.wait_for_next_message(timeout=5, raise_on_timeout=True)
+        await panel.writeline(summary)
+        last_publish = _LastPublish()
+        gw.mqtt_publish_func = last_publish
+        await _wait_until_idle(gw, last_publish, quiet=.2)
+        if not gw._state.partitions:
+            raise RuntimeError('The gateway did not load the summary')
+
+        gw.PUBLISHED.MESSAGES.clear()
+        gw.CAPTURED_LOGS.MESSAGES.clear()
+
+        cpu_start = time.process_time()
+        start = time.perf_counter()
+        for line in lines:
+            await panel.writeline(line)
+            await asyncio.sleep(0)
+
+        await _wait_until_idle(gw, last_publish)
+        duration = last_publish.published_at - start
+        cpu = time.process_time() - cpu_start
+        logs = len(gw.CAPTURED_LOGS.MESSAGES)
+    finally:
+        await gw.terminate()
+        panel.stop()
+
+    return duration, cpu, logs
+
+
+async def run(args):
+    summary = json.dumps(synthetic_summary(args.zones, 1))
+    lines = synthetic_zone_events(args.zones, args.events)
+
+    print(f'{len(lines)} synthetic events on {args.zones} zones')
+    results = {}
+    for name, level in (('DEBUG off', logging.INFO),
+                        ('DEBUG on', logging.DEBUG)):
+        runs = [await _run(summary, lines, level) for _ in range(args.repeat)]
+        rates = [len(lines) / duration for duration, _, _ in runs]
+        cpus = [cpu / len(lines) for _, cpu, _ in runs]
+        results[name] = statistics.median(rates)
+
+        print(f'{name:<12} '
+              f'throughput={statistics.median(rates):9.1f} events/s '
+              f'cpu={statistics.median(cpus) * 1e6:8.1f} us/event '
+              f'logs={runs[-1][2]}')
+
+    print(f'DEBUG on costs '
+          f'{(1 - results["DEBUG on"] / results["DEBUG off"]) * 100:.0f}% '
+          'of the throughput')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--zones', type=int, default=100,
+                        help='number of zones of the synthetic panel')
+    parser.add_argument('--events', type=int, default=5000,
+                        help='number of events to replay')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs for each log level')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Memory benchmark of the model: bytes retained per zone by the state of a
+synthetic panel, and per event object retained during a burst of events
+from the recorded panel stream.
+
+Usage: python tests/benchmark/bench_memory.py [--zones N] [--partitions N]
+           [--burst N]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+
+import testenv  # noqa: F401
+from benchbase import load_panel_stream
+from benchbase import synthetic_summary
+
+from qolsys.events import QolsysEvent
+from qolsys.state import QolsysState
+
+
+def retained(build):
+    """
+    Return the object built by `build`, and the number of bytes that were
+    allocated to build it and are still allocated afterwards
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        obj = build()
+        gc.collect()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    size = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    return obj, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--zones', type=int, default=500,
+                        help='number of zones of the synthetic panel')
+    parser.add_argument('--partitions', type=int, default=4,
+                        help='number of partitions of the synthetic panel')
+    parser.add_argument('--burst', type=int, default=1000,
+                        help='number of events retained in the burst')
+    args = parser.parse_args()
+
+    summary = json.dumps(synthetic_summary(args.zones, args.partitions))
+
+    def build_state():
+        # The event is dropped once the state is built, as it would be
+        # in the gateway, so only the state is accounted for
+        return QolsysState(QolsysEvent.from_json(summary))
+
+    state, size = retained(build_state)
+    print(f'{args.zones} zones in {args.partitions} partitions')
+    print(f'{"state":<40} {size:>10} bytes '
+          f'{size / args.zones:10.1f} bytes/zone')
+
+    lines = [line for line in load_panel_stream()
+             if '"SUMMARY"' not in line]
+    lines = (lines * (args.burst // len(lines) + 1))[:args.burst]
+    # Make sure every line is a distinct string, as they would be when
+    # read from the socket, so they are accounted for in the burst
+    lines = [''.join(line) for line in lines]
+    strings_size = sum(len(line) + 49 for line in lines)
+
+    events, size = retained(
+        lambda: [QolsysEvent.from_json(line) for line in lines])
+    print(f'{"burst of events":<40} {size:>10} bytes '
+          f'{size / len(events):10.1f} bytes/event '
+          f'(of which ~{strings_size / len(events):.1f} of raw strings)')
+
+
+if __name__ == '__main__':
+    main()
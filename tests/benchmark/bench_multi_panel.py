@@ -0,0 +1,183 @@
+"""
+Cost of each additional panel served by the gateway: N mock panels
+(testutils.mock_panel.PanelServer) are served either by a single gateway
+configured with a list of 'panels', or by one gateway per panel as with
+one AppDaemon app per panel, and the benchmark reports:
+- the memory retained per panel once every panel loaded its summary,
+  which includes the sockets, states, listeners and metrics of the panels
+  and, with one gateway per panel, their publish queues and log handlers;
+- the CPU time per event, for a synthetic stream of ZONE_ACTIVE events
+  spread over the panels, which includes the mock panels and MQTT API as
+  they run in the same process.
+
+Usage: python tests/benchmark/bench_multi_panel.py [--panels N [N ...]]
+           [--zones N] [--events N]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+import testenv  # noqa: F401
+from benchbase import synthetic_summary
+from testutils.mock_panel import PanelServer
+
+from gateway import QolsysGateway
+
+
+def _panel_args(unique_id, panel):
+    return {
+        'panel_host': 'localhost',
+        'panel_port': panel.port,
+        'panel_mac': '00:00:00:00:00:00',
+        'panel_unique_id': unique_id,
+    }
+
+
+async def _start_gateways(panels, shared):
+    if shared:
+        gw = QolsysGateway()
+        gw.args = {
+            'panel_token': '<panel_token>',
+            'panels': [_panel_args(unique_id, panel)
+                       for unique_id, panel in panels.items()],
+        }
+        gateways = [gw]
+    else:
+        gateways = []
+        for unique_id, panel in panels.items():
+            gw = QolsysGateway()
+            gw.args = {
+                'panel_token': '<panel_token>',
+                **_panel_args(unique_id, panel),
+            }
+            gateways.append(gw)
+
+    for gw in gateways:
+        await gw.initialize()
+
+    return gateways
+
+
+def _clear_mock_storage(panels, gateways):
+    # The mocks store every message and log, which we do not want to
+    # account for in the allocations
+    for gw in gateways:
+        gw.PUBLISHED.MESSAGES.clear()
+        gw.PUBLISHED.SAVED_MESSAGES_POS = 0
+        gw.CAPTURED_LOGS.MESSAGES.clear()
+        gw.CAPTURED_LOGS.SAVED_MESSAGES_POS = 0
+    for panel in panels.values():
+        panel.MESSAGES.MESSAGES.clear()
+        panel.MESSAGES.SAVED_MESSAGES_POS = 0
+
+
+async def _wait_until_idle(gateways, quiet=.2, timeout=60):
+    """
+    Wait until none of the gateways published anything for `quiet` seconds
+    """
+    start = time.perf_counter()
+    count = -1
+    while count != sum(len(gw.PUBLISHED.MESSAGES) for gw in gateways) or \
+            any(gw._publish_queue.depth for gw in gateways):
+        if time.perf_counter() - start > timeout:
+            raise RuntimeError('Timeout waiting for the gateways to be idle')
+        count = sum(len(gw.PUBLISHED.MESSAGES) for gw in gateways)
+        await asyncio.sleep(quiet)
+
+
+def _zone_events(panel_ids, zones, count):
+    status = {}
+    for i in range(count):
+        unique_id = panel_ids[i % len(panel_ids)]
+        zone_id = 10000 + (i // len(panel_ids)) % zones
+        key = (unique_id, zone_id)
+        # Alternate the status of each zone, so every event is a change
+        status[key] = 'Open' if status.get(key) != 'Open' else 'Closed'
+        yield unique_id, json.dumps({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'version': 1,
+            'zone': {
+                'status': status[key],
+                'zone_id': zone_id,
+            },
+            'requestID': '<request_id>',
+        })
+
+
+async def run_one(count, shared, zones, events):
+    panels = {}
+    for i in range(count):
+        panels[f'panel{i}'] = PanelServer()
+        await panels[f'panel{i}'].start()
+
+    summary = json.dumps(synthetic_summary(zones, 1))
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+
+        gateways = await _start_gateways(panels, shared)
+        await asyncio.gather(*(
+            panel.wait_for_next_message(timeout=5, raise_on_timeout=True)
+            for panel in panels.values()
+        ))
+        for panel in panels.values():
+            await panel.writeline(summary)
+        await _wait_until_idle(gateways)
+
+        _clear_mock_storage(panels, gateways)
+        gc.collect()
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    try:
+        lines = list(_zone_events(list(panels), zones, events))
+
+        cpu_start = time.process_time()
+        for unique_id, line in lines:
+            await panels[unique_id].writeline(line)
+            await asyncio.sleep(0)
+        await _wait_until_idle(gateways, quiet=.05)
+        cpu = time.process_time() - cpu_start
+    finally:
+        for gw in gateways:
+            await gw.terminate()
+        for panel in panels.values():
+            panel.stop()
+
+    return (after - before) / count, cpu / events
+
+
+async def run(args):
+    print(f'{args.zones} zones per panel, {args.events} events')
+    for shared in (True, False):
+        mode = 'one gateway' if shared else 'one gateway per panel'
+        for count in args.panels:
+            memory, cpu = await run_one(count, shared, args.zones,
+                                        args.events)
+            print(f'{mode:<24} {count:>3} panels '
+                  f'memory={memory / 1024:9.1f} KiB/panel '
+                  f'cpu={cpu * 1e6:9.1f} us/event')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--panels', type=int, nargs='+', default=[1, 2, 4, 8],
+                        help='numbers of panels to benchmark')
+    parser.add_argument('--zones', type=int, default=20,
+                        help='number of zones of each synthetic panel')
+    parser.add_argument('--events', type=int, default=2000,
+                        help='number of events to replay over all panels')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
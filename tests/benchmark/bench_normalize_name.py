@@ -0,0 +1,92 @@
+"""
+Microbenchmark of normalize_name_to_id on a few thousand realistic zone
+names, accented ones included: the previous implementation, looking up
+the name of every character and running a regex, against the translation
+table, uncached and behind the LRU cache as used by the MQTT wrappers.
+
+Usage: python tests/benchmark/bench_normalize_name.py [--names N]
+           [--repeat N] [--number N]
+"""
+import itertools
+import re
+
+import testenv  # noqa: F401
+from benchbase import argument_parser
+from benchbase import report
+from benchbase import timeit
+
+from mqtt.utils import normalize_name_to_id
+from mqtt.utils import rmdiacritics
+
+
+ROOMS = [
+    'Front', 'Back', 'Garage', 'Kitchen', 'Living Room', 'Master Bedroom',
+    'Basement', 'Office', 'Entrée', 'Salle à manger', 'Chambre d\'amis',
+    'Küche', 'Schlafzimmer', 'Dormitório', 'Salón', 'Cuisine', 'Garçonnière',
+    'Bureau n°2', 'Sótano', 'Étage',
+]
+DEVICES = [
+    'Door', 'Window', 'Motion', 'Glass Break', 'Smoke Detector',
+    'CO Detector', 'Water Sensor', 'Porte', 'Fenêtre', 'Détecteur',
+    'Tür', 'Fenster', 'Puerta', 'Ventana', 'Janela',
+]
+
+
+def reference_normalize_name_to_id(name):
+    ascii_name = ''.join([rmdiacritics(c) for c in name])
+    clean_name = re.sub(r'[^a-zA-Z0-9_]', '_', ascii_name)
+    return clean_name.lower()
+
+
+def zone_names(count):
+    names = []
+    for i, (room, device) in enumerate(itertools.cycle(
+            itertools.product(ROOMS, DEVICES))):
+        if i >= count:
+            break
+        names.append(f'{room} {device} {i // (len(ROOMS) * len(DEVICES))}')
+    return names
+
+
+def main():
+    parser = argument_parser(__doc__, number=10)
+    parser.add_argument('--names', type=int, default=3000,
+                        help='number of distinct zone names')
+    args = parser.parse_args()
+
+    names = zone_names(args.names)
+    accented = sum(1 for name in names if not name.isascii())
+    print(f'{len(names)} zone names, {accented} with non-ASCII characters')
+
+    table_normalize = normalize_name_to_id.__wrapped__
+    for name in names:
+        if table_normalize(name) != reference_normalize_name_to_id(name):
+            raise RuntimeError(f'Different results for {name!r}')
+
+    operations = len(names) * args.number
+    reference = report(
+        'reference (unicodedata + regex)',
+        timeit(lambda: [reference_normalize_name_to_id(n) for n in names],
+               args.repeat, args.number),
+        operations)
+    table = report(
+        'translation table',
+        timeit(lambda: [table_normalize(n) for n in names],
+               args.repeat, args.number),
+        operations)
+
+    # Each entity normalizes the same name for each of its topics, so the
+    # cache is hit most of the time
+    normalize_name_to_id.cache_clear()
+    cached = report(
+        'translation table + LRU cache',
+        timeit(lambda: [normalize_name_to_id(n) for n in names],
+               args.repeat, args.number),
+        operations)
+
+    print(f'speedup: table x{reference / table:.1f}, '
+          f'table + cache x{reference / cached:.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Microbenchmark of the zone and sensor lookups of QolsysState on a
+synthetic panel, for the ZONE_ACTIVE handling and the discovery of all
+the sensors.
+
+Usage: python tests/benchmark/bench_state_lookups.py [--zones N]
+           [--partitions N] [--repeat N] [--number N]
+"""
+import testenv  # noqa: F401
+from benchbase import argument_parser
+from benchbase import report
+from benchbase import synthetic_summary
+from benchbase import timeit
+
+from mqtt.updater import MqttWrapperFactory
+from qolsys.config import QolsysGatewayConfig
+from qolsys.events import QolsysEvent
+from qolsys.sensors import QolsysSensor
+from qolsys.state import QolsysState
+
+
+def main():
+    parser = argument_parser(__doc__, number=10)
+    parser.add_argument('--zones', type=int, default=500,
+                        help='number of zones of the synthetic panel')
+    parser.add_argument('--partitions', type=int, default=4,
+                        help='number of partitions of the synthetic panel')
+    args = parser.parse_args()
+
+    state = QolsysState(QolsysEvent.from_json(
+        synthetic_summary(args.zones, args.partitions)))
+    zone_ids = [10000 + i for i in range(args.zones)]
+    sensors = [state.zone(zone_id) for zone_id in zone_ids]
+
+    print(f'{args.zones} zones in {args.partitions} partitions')
+
+    report('state.zone(zone_id)',
+           timeit(lambda: [state.zone(zone_id) for zone_id in zone_ids],
+                  args.repeat, args.number),
+           len(zone_ids) * args.number)
+
+    def zone_active():
+        for zone_id in zone_ids:
+            state.zone_open(zone_id)
+            state.zone_closed(zone_id)
+
+    report('state.zone_open + zone_closed',
+           timeit(zone_active, args.repeat, args.number),
+           len(zone_ids) * 2 * args.number)
+
+    report('sensor.unique_id',
+           timeit(lambda: [sensor.unique_id for sensor in sensors],
+                  args.repeat, args.number),
+           len(sensors) * args.number)
+
+    # Observe everything, as the MQTT updater does, and alternate the
+    # zones between two versions that differ in status and attributes
+    for partition in state.partitions:
+        partition.register(state, callback=lambda *args, **kwargs: None)
+        for sensor in partition.sensors:
+            sensor.register(state, callback=lambda *args, **kwargs: None)
+
+    summary = synthetic_summary(args.zones, args.partitions)
+    zones = [zone for p in summary['partition_list'] for zone in p['zone_list']]
+    updates = [
+        [QolsysSensor.from_json(zone, None) for zone in zones],
+        [QolsysSensor.from_json({**zone, 'status': 'Open', 'group': 'other'},
+                                None)
+         for zone in zones],
+    ]
+
+    def zone_update():
+        for version in updates:
+            for sensor in version:
+                state.zone_update(sensor)
+
+    report('state.zone_update (observed)',
+           timeit(zone_update, args.repeat, args.number),
+           len(zones) * 2 * args.number)
+
+    cfg = QolsysGatewayConfig(args={
+        'panel_host': 'localhost',
+        'panel_mac': '00:00:00:00:00:00',
+        'panel_token': '<panel_token>',
+    })
+    factory = MqttWrapperFactory(
+        mqtt_publish=lambda **kwargs: None,
+        cfg=cfg,
+        mqtt_plugin_cfg={},
+        session_token='<session_token>',
+        configure_cache=None,
+    )
+
+    def configure_all():
+        for partition in state.partitions:
+            for sensor in partition.sensors:
+                factory.wrap(sensor).configure(partition=partition)
+
+    report('configure all sensors',
+           timeit(configure_all, args.repeat, args.number),
+           args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Startup-to-first-state benchmark: time from the initialization of the
+gateway to the first publish of the state of a partition, on a cold start
+where the state comes from the summary of the panel, and on a warm start
+where the last known state is restored from a snapshot.
+
+The mock panel (testutils.mock_panel.PanelServer) answers the INFO request
+with the summary after --panel-delay seconds, to account for the time a
+real panel takes to accept the connection and send its summary.
+
+Usage: python tests/benchmark/bench_warm_start.py [--zones N]
+           [--partitions N] [--panel-delay SECONDS] [--repeat N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+import testenv  # noqa: F401
+from benchbase import synthetic_summary
+from testutils.mock_panel import PanelServer
+
+from gateway import QolsysGateway
+
+
+class _FirstStateRecorder(object):
+
+    def __init__(self):
+        self.published_at = None
+
+    def __call__(self, topic, payload, **kwargs):
+        if self.published_at is None and \
+                topic.startswith('homeassistant/alarm_control_panel/') and \
+                topic.endswith('/state'):
+            self.published_at = time.perf_counter()
+
+
+async def _first_state(summary, snapshot_path, panel_delay):
+    panel = PanelServer()
+    await panel.start()
+
+    gw = QolsysGateway()
+    gw.args = {
+        'panel_host': 'localhost',
+        'panel_port': panel.port,
+        'panel_token': '<panel_token>',
+        'panel_mac': '00:00:00:00:00:00',
+        'state_snapshot_path': snapshot_path,
+    }
+    recorder = _FirstStateRecorder()
+    gw.mqtt_publish_func = recorder
+
+    try:
+        start = time.perf_counter()
+        await gw.initialize()
+
+        await panel.wait_for_next_message(timeout=5, raise_on_timeout=True)
+        await asyncio.sleep(panel_delay)
+        await panel.writeline(summary)
+
+        while recorder.published_at is None or \
+                not gw._state.partitions or gw._publish_queue.depth:
+            if time.perf_counter() - start > 30:
+                raise RuntimeError('Timeout waiting for the state')
+            await asyncio.sleep(.01)
+    finally:
+        await gw.terminate()
+        panel.stop()
+
+    return recorder.published_at - start
+
+
+async def run(args):
+    summary = json.dumps(synthetic_summary(args.zones, args.partitions))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'state.json')
+
+        for name, warm in (('cold start', False), ('warm start', True)):
+            durations = []
+            for _ in range(args.repeat):
+                if not warm and os.path.exists(path):
+                    os.remove(path)
+                durations.append(await _first_state(summary, path,
+                                                    args.panel_delay))
+
+            print(f'{name:<20} '
+                  f'best={min(durations) * 1e3:9.2f}ms '
+                  f'median={statistics.median(durations) * 1e3:9.2f}ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--zones', type=int, default=100,
+                        help='number of zones of the synthetic panel')
+    parser.add_argument('--partitions', type=int, default=1,
+                        help='number of partitions of the synthetic panel')
+    parser.add_argument('--panel-delay', type=float, default=1,
+                        help='seconds before the panel sends its summary')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of runs of each kind of start')
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import argparse
+import os
+import statistics
+import time
+
+from testenv import FIXTURES_DIR
+
+
+PANEL_STREAM = os.path.join(FIXTURES_DIR, 'panel_stream.jsonl')
+
+
+def load_panel_stream(path=None, skip_ack=True):
+    with open(path or PANEL_STREAM) as f:
+        lines = [line.rstrip('\n') for line in f]
+
+    if skip_ack:
+        lines = [line for line in lines if line and line != 'ACK']
+
+    return lines
+
+
+def synthetic_summary(zones, partitions):
+    """
+    Return the data of an INFO SUMMARY event for a synthetic panel with
+    `zones` door/window zones spread over `partitions` partitions
+    """
+    partition_list = [
+        {
+            'partition_id': partition_id,
+            'name': f'partition{partition_id}',
+            'status': 'DISARM',
+            'secure_arm': False,
+            'zone_list': [],
+        }
+        for partition_id in range(partitions)
+    ]
+
+    for i in range(zones):
+        partition_id = i % partitions
+        partition_list[partition_id]['zone_list'].append({
+            'id': f'{partition_id + 1:03d}-{i:04d}',
+            'type': 'Door_Window',
+            'name': f'Zone {i}',
+            'group': 'entryexitdelay',
+            'status': 'Closed',
+            'state': '0',
+            'zone_id': 10000 + i,
+            'zone_physical_type': 1,
+            'zone_alarm_type': 3,
+            'zone_type': 1,
+            'partition_id': partition_id,
+        })
+
+    return {
+        'event': 'INFO',
+        'info_type': 'SUMMARY',
+        'partition_list': partition_list,
+        'nonce': 'qolsys',
+        'requestID': '<request_id>',
+    }
+
+
+def argument_parser(description, **defaults):
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--repeat', type=int,
+                        default=defaults.get('repeat', 5),
+                        help='number of timed runs')
+    parser.add_argument('--number', type=int,
+                        default=defaults.get('number', 20),
+                        help='number of iterations per timed run')
+    return parser
+
+
+def timeit(func, repeat, number):
+    """
+    Run `func` `number` times per run, for `repeat` runs, and return
+    the duration of each run in seconds
+    """
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def report(name, durations, operations):
+    """
+    Print the best and median cost per operation of a timed function
+    """
+    best = min(durations) / operations
+    median = statistics.median(durations) / operations
+    print(f'{name:<40} best={best * 1e6:9.2f}us/op '
+          f'median={median * 1e6:9.2f}us/op')
+    return best
@@ -1,11 +1,30 @@
 import asyncio
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from unittest import mock
 
 import testenv  # noqa: F401
 from testbase import TestQolsysGatewayBase
+from testutils.fixtures_data import get_summary
+from testutils.mock_panel import PanelServer
 from testutils.mock_types import ISODATE
+from testutils.mock_types import ISODATE_S
+from testutils.utils import MessageStorage
 
+from gateway import AppDaemonLoggingHandler
 from gateway import QolsysGateway
 from mqtt.exceptions import MqttPluginUnavailableException
+from qolsys.events import QolsysEvent
+from qolsys.exceptions import UnknownQolsysEventException
+from qolsys.journal import QolsysJournal
+from qolsys.snapshot import QolsysStateSnapshot
+from qolsys.state import QolsysState
+from qolsys.utils import MacResolver
 
 
 class TestIntegrationQolsysGateway(TestQolsysGatewayBase):
@@ -24,6 +43,92 @@ class TestIntegrationQolsysGateway(TestQolsysGatewayBase):
         with self.assertRaises(MqttPluginUnavailableException):
             await gw.initialize()
 
+    async def test_integration_gateway_logging_follows_appdaemon_log_level(self):
+        rlogger = logging.getLogger()
+        rlogger_level = rlogger.level
+
+        gw = QolsysGateway()
+        # Gateways of other tests might still be logging, for other apps
+        gw.CAPTURED_LOGS = MessageStorage(name='log',
+                                          match_check_key='message')
+
+        # The logger given by AppDaemon to the app, with its log_level
+        gw.logger = logging.getLogger('AppDaemon.qolsys_logging_test')
+        gw.logger.setLevel(logging.INFO)
+        self.addCleanup(gw.logger.setLevel, logging.NOTSET)
+
+        gw._redirect_logging()
+        self.addCleanup(gw._restore_logging)
+
+        # The debug messages are not forwarded, even if the loggers of the
+        # modules log them for other apps
+        self.assertEqual(logging.INFO, gw._log_handler.level)
+
+        logger = logging.getLogger('qolsys.socket')
+
+        startpos = len(gw.CAPTURED_LOGS.MESSAGES)
+        logger.debug('Logging test: debug')
+        logger.info('Logging test: info')
+        try:
+            raise ValueError('logging test')
+        except ValueError:
+            logger.exception('Logging test: exception')
+
+        # The messages are forwarded to AppDaemon from a background thread
+        info = await gw.wait_for_next_log(
+            timeout=self._TIMEOUT,
+            match='^Logging test: ',
+            startpos=startpos,
+            raise_on_timeout=True,
+        )
+        self.assertEqual({'message': 'Logging test: info', 'level': 'INFO'},
+                         info)
+
+        error = await gw.wait_for_next_log(
+            timeout=self._TIMEOUT,
+            filters={'level': 'ERROR'},
+            match='^Logging test: ',
+            startpos=startpos,
+            raise_on_timeout=True,
+        )
+        self.assertEqual('Logging test: exception', error['message'].split('\n')[0])
+        self.assertIn('\nTraceback (most recent call last):\n',
+                      error['message'])
+        self.assertTrue(error['message'].endswith('ValueError: logging test'))
+
+        # The level of the root logger is left to the other apps
+        self.assertEqual(rlogger_level, rlogger.level)
+
+    async def test_integration_gateway_logging_levels_of_several_apps(self):
+        qolsys_logger = logging.getLogger('qolsys')
+        # Gateways of other tests might still be logging
+        others = [h.level for h in AppDaemonLoggingHandler._handlers]
+        qolsys_level = min(others) if others else qolsys_logger.level
+
+        gws = []
+        for name, level in (('first', logging.INFO),
+                            ('second', logging.WARNING)):
+            gw = QolsysGateway()
+            gw.name = f'qolsys_logging_{name}'
+            gw.logger = logging.getLogger(f'AppDaemon.qolsys_logging_{name}')
+            gw.logger.setLevel(level)
+            self.addCleanup(gw.logger.setLevel, logging.NOTSET)
+            gw._redirect_logging()
+            self.addCleanup(gw._restore_logging)
+            gws.append(gw)
+
+        # The modules log what at least one of the apps logs, and each app
+        # only gets what it logs
+        self.assertEqual(min([logging.INFO] + others), qolsys_logger.level)
+        self.assertEqual([logging.INFO, logging.WARNING],
+                         [gw._log_handler.level for gw in gws])
+
+        gws[0]._restore_logging()
+        self.assertEqual(min([logging.WARNING] + others), qolsys_logger.level)
+
+        gws[1]._restore_logging()
+        self.assertEqual(qolsys_level, qolsys_logger.level)
+
     async def test_integration_gateway_sends_info_message_on_connection(self):
         panel, gw, info = await self._init_panel_and_gw_and_wait(
             return_info=True,
@@ -117,3 +222,723 @@ class TestIntegrationQolsysGateway(TestQolsysGatewayBase):
             },
             attributes['payload'],
         )
+
+    async def test_integration_gateway_mqtt_event_mode_listens_to_event_topic(self):
+        panel, gw = await self._init_panel_and_gw_and_wait()
+
+        self.assertIn('qolsys/qolsys_panel/event',
+                      [s['topic'] for s in gw.SUBSCRIBED_TO])
+
+    async def test_integration_gateway_direct_event_mode_does_not_listen_to_event_topic(self):
+        panel, gw = await self._init_panel_and_gw_and_wait(
+            event_mode='direct',
+        )
+
+        self.assertNotIn('qolsys/qolsys_panel/event',
+                         [s['topic'] for s in gw.SUBSCRIBED_TO])
+
+    async def test_integration_gateway_direct_event_mode_processes_and_mirrors_events(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            event_mode='direct',
+        )
+
+        event = {
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'version': 1,
+            'zone': {
+                'status': 'Open',
+                'zone_id': 10000,
+            },
+            'requestID': '<request_id>',
+        }
+        await panel.writeline(event)
+
+        state = await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/binary_sensor/my_door/state'},
+            raise_on_timeout=True,
+        )
+        self.assertEqual('Open', state['payload'])
+
+        mirrored = await gw.find_last_mqtt_publish(
+            filters={'topic': 'qolsys/qolsys_panel/event'},
+            raise_if_not_found=True,
+        )
+        self.assertJsonDictEqual(event, mirrored['payload'])
+
+        self.assertEqual('Open', gw._state.partition(0).zone(10000).status)
+
+    async def test_integration_gateway_sensor_debounce(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            event_mode='direct',
+            sensor_debounce={'Door_Window': 0.5},
+        )
+
+        state_topic = 'homeassistant/binary_sensor/my_door/state'
+        startpos = len(gw.PUBLISHED.MESSAGES)
+
+        for status in ('Open', 'Closed', 'Open', 'Closed'):
+            await panel.writeline({
+                'event': 'ZONE_EVENT',
+                'zone_event_type': 'ZONE_ACTIVE',
+                'version': 1,
+                'zone': {
+                    'status': status,
+                    'zone_id': 10000,
+                },
+                'requestID': '<request_id>',
+            })
+            await asyncio.sleep(.05)
+
+        # The first change is published right away, and the last one at the
+        # end of the debounce delay
+        states = [m['payload'] for m in gw.PUBLISHED.MESSAGES[startpos:]
+                  if m['topic'] == state_topic]
+        self.assertEqual(['Open'], states)
+
+        await asyncio.sleep(.5)
+
+        states = [m['payload'] for m in gw.PUBLISHED.MESSAGES[startpos:]
+                  if m['topic'] == state_topic]
+        self.assertEqual(['Open', 'Closed'], states)
+
+        metrics = gw._metrics.as_dict()
+        self.assertEqual(2, metrics['sensor_publishes_suppressed'])
+        self.assertEqual(0, metrics['sensor_publishes_pending'])
+
+    async def test_integration_gateway_sensor_activity_attributes(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            event_mode='direct',
+            sensor_activity_attributes=True,
+        )
+
+        attributes_topic = 'homeassistant/binary_sensor/my_door/attributes'
+        startpos = len(gw.PUBLISHED.MESSAGES)
+
+        for status in ('Open', 'Closed'):
+            await panel.writeline({
+                'event': 'ZONE_EVENT',
+                'zone_event_type': 'ZONE_ACTIVE',
+                'version': 1,
+                'zone': {
+                    'status': status,
+                    'zone_id': 10000,
+                },
+                'requestID': '<request_id>',
+            })
+            await asyncio.sleep(.05)
+
+        # The attributes are published again with each change of status
+        attributes = [json.loads(m['payload'])
+                      for m in gw.PUBLISHED.MESSAGES[startpos:]
+                      if m['topic'] == attributes_topic]
+        self.assertEqual(2, len(attributes))
+
+        self.assertEqual(1, attributes[-1]['opens_per_hour'])
+        self.assertLess(attributes[-1]['average_open_seconds'], 1)
+        self.assertEqual(ISODATE_S, attributes[-1]['last_changed'])
+        self.assertEqual('entryexitdelay', attributes[-1]['group'])
+
+    async def _zone_active_latencies(self, event_mode, count=20):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            event_mode=event_mode,
+        )
+
+        published = asyncio.Event()
+        published_at = []
+
+        def record_state(topic, payload, **kwargs):
+            if topic == 'homeassistant/binary_sensor/my_door/state':
+                published_at.append(time.perf_counter())
+                published.set()
+
+        gw.mqtt_publish_func.side_effect = record_state
+
+        latencies = []
+        for i in range(count):
+            published.clear()
+
+            start = time.perf_counter()
+            await panel.writeline({
+                'event': 'ZONE_EVENT',
+                'zone_event_type': 'ZONE_ACTIVE',
+                'version': 1,
+                'zone': {
+                    'status': 'Open' if i % 2 == 0 else 'Closed',
+                    'zone_id': 10000,
+                },
+                'requestID': '<request_id>',
+            })
+            await asyncio.wait_for(published.wait(), timeout=self._TIMEOUT)
+
+            latencies.append(published_at[-1] - start)
+
+        return latencies
+
+    async def test_integration_gateway_direct_event_mode_latency(self):
+        mqtt_latencies = await self._zone_active_latencies('mqtt')
+        direct_latencies = await self._zone_active_latencies('direct')
+
+        mqtt_median = statistics.median(mqtt_latencies)
+        direct_median = statistics.median(direct_latencies)
+
+        # The direct mode skips a JSON encode/decode and the broker round
+        # trip (not present with our mock), so it should never be slower
+        # than the MQTT mode; leave some margin for the loopback jitter
+        self.assertLessEqual(
+            direct_median, mqtt_median * 2,
+            f'direct mode median latency {direct_median * 1e3:.3f}ms '
+            f'vs. mqtt mode {mqtt_median * 1e3:.3f}ms')
+
+    async def _scrape_metrics(self, gw):
+        reader, writer = await asyncio.open_connection(
+            '127.0.0.1', gw._metrics_server.port)
+        writer.write(b'GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n')
+        await writer.drain()
+
+        response = await reader.read()
+        writer.close()
+
+        head, body = response.decode().split('\r\n\r\n', 1)
+        self.assertTrue(head.startswith('HTTP/1.1 200 OK'))
+        return body.splitlines()
+
+    async def test_integration_gateway_metrics_endpoint(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            event_mode='direct',
+            metrics_port=0,
+        )
+
+        await panel.writeline('blah')
+        await panel.writeline({'event': 'unknown'})
+        await panel.writeline({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'version': 1,
+            'zone': {
+                'status': 'Open',
+                'zone_id': 10000,
+            },
+            'requestID': '<request_id>',
+        })
+        await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/binary_sensor/my_door/state'},
+            raise_on_timeout=True,
+        )
+
+        metrics = await self._scrape_metrics(gw)
+        await gw.terminate()
+
+        # The summary, the ACK of the INFO request, and the 3 lines above
+        self.assertIn('qolsysgw_panel_lines_read_total 5', metrics)
+        self.assertIn('qolsysgw_panel_acks_total 1', metrics)
+        self.assertIn('qolsysgw_panel_parse_failures_total'
+                      '{reason="JSONDecodeError"} 1', metrics)
+        self.assertIn('qolsysgw_panel_parse_failures_total'
+                      '{reason="UnknownQolsysEventException"} 1', metrics)
+        self.assertIn('qolsysgw_panel_events_total'
+                      '{event="QolsysEventInfoSummary"} 1', metrics)
+        self.assertIn('qolsysgw_panel_events_total'
+                      '{event="QolsysEventZoneEventActive"} 1', metrics)
+        self.assertIn('qolsysgw_panel_callback_latency_seconds_count 2',
+                      metrics)
+        self.assertIn('qolsysgw_panel_connections_total 1', metrics)
+        self.assertIn('qolsysgw_panel_reconnects_total 0', metrics)
+        self.assertIn('qolsysgw_panel_connected 1', metrics)
+        self.assertIn('qolsysgw_mqtt_publishes_total'
+                      '{topic_class="event"} 2', metrics)
+        self.assertIn('qolsysgw_mqtt_publish_queue_depth 0', metrics)
+
+        config_publishes = [
+            m for m in gw.PUBLISHED.MESSAGES if m['topic'].endswith('/config')
+        ]
+        self.assertIn('qolsysgw_mqtt_publishes_total'
+                      f'{{topic_class="config"}} {len(config_publishes)}',
+                      metrics)
+
+    async def test_integration_gateway_idle_timeout_resets_connection(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            panel_keep_alive=0.1,
+            panel_idle_timeout=0.5,
+            panel_tcp_keepalive=60,
+        )
+
+        # The panel ACKs the keep-alives sent while there is no other
+        # traffic, so the connection stays up past the idle timeout
+        await asyncio.sleep(1)
+
+        metrics = gw._metrics.as_dict()
+        self.assertGreater(metrics['panel_keep_alives'], 0)
+        self.assertEqual(0, metrics['panel_idle_timeouts'])
+        self.assertEqual(1, metrics['panel_connected'])
+        self.assertLess(metrics['panel_last_received_age_seconds'], 0.5)
+
+        # The panel stops responding, without closing the connection
+        panel.stop_responding()
+
+        unavailable = await gw.wait_for_next_mqtt_publish(
+            timeout=2,
+            filters={
+                'topic': 'homeassistant/alarm_control_panel/qolsys_panel/'
+                         'availability',
+                'payload': 'offline',
+            },
+        )
+        self.assertIsNotNone(unavailable)
+
+        metrics = gw._metrics.as_dict()
+        await gw.terminate()
+
+        self.assertEqual(1, metrics['panel_idle_timeouts'])
+
+    async def test_integration_gateway_publish_stats(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+        )
+
+        await gw.publish_stats()
+
+        stats = await gw.find_last_mqtt_publish(
+            filters={'topic': 'qolsys/qolsys_panel/stats'},
+            raise_if_not_found=True,
+        )
+        self.assertJsonSubDictEqual(
+            {
+                'panel_lines_read': 2,
+                'panel_acks': 1,
+                'panel_events': {'QolsysEventInfoSummary': 1},
+                'panel_connected': 1,
+                'mqtt_publish_queue_depth': 0,
+            },
+            stats['payload'],
+        )
+
+    async def test_integration_gateway_journal(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, '{panel_unique_id}')
+
+            panel, gw, _, _ = await self._ready_panel_and_gw(
+                partition_ids=[0],
+                zone_ids=[10000],
+                panel_user_code='1234',
+                journal_path=path,
+            )
+
+            gw.mqtt_publish(
+                'homeassistant/alarm_control_panel/qolsys_panel/set',
+                json.dumps({
+                    'action': 'DISARM',
+                    'partition_id': 0,
+                    'session_token': gw._session_token,
+                }),
+                namespace='mqtt',
+            )
+
+            action = await panel.wait_for_next_message(
+                timeout=self._TIMEOUT,
+                filters={'action': 'ARMING'},
+            )
+            self.assertIsNotNone(action)
+
+            await panel.writeline({
+                'event': 'ARMING',
+                'arming_type': 'ARM_STAY',
+                'partition_id': 0,
+                'version': 1,
+                'requestID': '<request_id>',
+            })
+            await gw.wait_for_next_mqtt_publish(
+                timeout=self._TIMEOUT,
+                filters={'topic': 'homeassistant/alarm_control_panel/'
+                                  'qolsys_panel/partition0/state'},
+                raise_on_timeout=True,
+            )
+
+            await gw.terminate()
+
+            path = os.path.join(tmpdir, 'qolsys_panel')
+            sent = [json.loads(r.payload) for r in QolsysJournal.read(
+                path, kinds=(QolsysJournal.KIND_SENT, ))]
+            self.assertEqual(['INFO', 'ARMING'],
+                             [a['action'] for a in sent])
+            self.assertEqual('<redacted>', sent[1]['usercode'])
+            self.assertNotIn('<panel_token>', json.dumps(sent))
+
+            received = [r.payload for r in QolsysJournal.read(
+                path, kinds=(QolsysJournal.KIND_RECEIVED, ))]
+            self.assertEqual(2, received.count(b'ACK'))
+            self.assertEqual(2, len(received) - received.count(b'ACK'))
+
+            # The journal can rebuild the state of the panel
+            state = QolsysJournal.replay(path)
+            self.assertEqual('ARM_STAY', state.partition(0).status)
+
+    async def test_integration_gateway_warm_start_from_snapshot(self):
+        state_topic = 'homeassistant/alarm_control_panel/qolsys_panel/' \
+            'partition0/state'
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'state.json')
+            QolsysStateSnapshot(path, QolsysState(QolsysEvent.from_json(
+                get_summary(partition_ids=[0], zone_ids=[10000],
+                            partition_status={0: 'ARM_AWAY'}).event,
+            ))).save()
+
+            start = time.monotonic()
+            panel, gw = await self._init_panel_and_gw(
+                state_snapshot_path=path,
+            )
+
+            # The last known state is published without waiting for the
+            # summary of the panel
+            published = await gw.wait_for_next_mqtt_publish(
+                timeout=self._TIMEOUT,
+                startpos=0,
+                filters={'topic': state_topic},
+                raise_on_timeout=True,
+            )
+            self.assertLess(time.monotonic() - start, 1)
+            self.assertEqual('armed_away', published['payload'])
+
+            availability = await gw.find_last_mqtt_publish(
+                filters={'topic': 'homeassistant/alarm_control_panel/'
+                                  'qolsys_panel/availability'},
+                raise_if_not_found=True,
+            )
+            self.assertEqual('online', availability['payload'])
+
+            # The summary of the panel then reconciles the state
+            info = await panel.wait_for_next_message(
+                timeout=self._SUMMARY_TIMEOUT,
+                startpos=0,
+                filters={'action': 'INFO'},
+            )
+            self.assertIsNotNone(info)
+
+            await panel.writeline(get_summary(partition_ids=[0],
+                                              zone_ids=[10000]).event)
+            published = await gw.wait_for_next_mqtt_publish(
+                timeout=self._SUMMARY_TIMEOUT,
+                filters={'topic': state_topic},
+                raise_on_timeout=True,
+            )
+            self.assertEqual('disarmed', published['payload'])
+
+            await gw.terminate()
+
+            # The snapshot is saved when terminating
+            state = QolsysState()
+            QolsysStateSnapshot(path, state).load()
+            self.assertEqual('DISARM', state.partition(0).status)
+
+    async def test_integration_gateway_terminate_cancels_mac_discovery(self):
+        resolving = asyncio.Event()
+
+        async def resolve(self, host):
+            resolving.set()
+            await asyncio.sleep(60)
+
+        with mock.patch.object(MacResolver, 'resolve', new=resolve):
+            panel, gw, _, _ = await self._ready_panel_and_gw(
+                partition_ids=[0],
+                zone_ids=[10000],
+            )
+            await asyncio.wait_for(resolving.wait(), timeout=self._TIMEOUT)
+
+            mac_task = gw._panels[0]._mac_task
+            await gw.terminate()
+
+            with self.assertRaises(asyncio.CancelledError):
+                await mac_task
+
+    async def test_integration_gateway_mac_found_after_startup(self):
+        config_topic = 'homeassistant/alarm_control_panel/qolsys_panel/' \
+            'partition0/config'
+
+        with mock.patch.object(MacResolver, 'resolve',
+                               new=mock.AsyncMock(return_value=None)):
+            panel, gw, _, _ = await self._ready_panel_and_gw(
+                partition_ids=[0],
+                zone_ids=[10000],
+            )
+
+        config = await gw.find_last_mqtt_publish(
+            filters={'topic': config_topic},
+            raise_if_not_found=True,
+        )
+        self.assertNotIn('connections', json.loads(config['payload'])['device'])
+
+        # Once found, the mac address is added to the device of the entities
+        with mock.patch.object(
+                MacResolver, 'resolve',
+                new=mock.AsyncMock(return_value='01:12:76:ef:11:02')):
+            await gw._panels[0].qolsys_connected_callback()
+            await gw._panels[0]._mac_task
+
+        config = await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': config_topic},
+            raise_on_timeout=True,
+        )
+        self.assertEqual([['mac', '01:12:76:ef:11:02']],
+                         json.loads(config['payload'])['device']['connections'])
+
+        sensor_config = await gw.find_last_mqtt_publish(
+            filters={'topic': 'homeassistant/binary_sensor/my_door/config'},
+            raise_if_not_found=True,
+        )
+        self.assertIn('connections',
+                      json.loads(sensor_config['payload'])['device'])
+
+    async def test_integration_gateway_action_tracking(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            panel_user_code='1234',
+            metrics_port=0,
+        )
+
+        # Send the control as rendered by the command template of the
+        # partition, with the partition id as a string
+        gw.mqtt_publish(
+            'homeassistant/alarm_control_panel/qolsys_panel/set',
+            json.dumps({
+                'action': 'DISARM',
+                'partition_id': '0',
+                'session_token': gw._session_token,
+            }),
+            namespace='mqtt',
+        )
+
+        action = await panel.wait_for_next_message(
+            timeout=self._TIMEOUT,
+            filters={'action': 'ARMING'},
+        )
+        self.assertIsNotNone(action)
+
+        await panel.writeline({
+            'event': 'ARMING',
+            'arming_type': 'DISARM',
+            'partition_id': 0,
+            'version': 1,
+            'requestID': '<request_id>',
+        })
+
+        async def wait_for_completed():
+            while not gw._metrics.as_dict()['panel_actions'].get(
+                    'DISARM/completed'):
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(wait_for_completed(), timeout=self._TIMEOUT)
+
+        metrics = await self._scrape_metrics(gw)
+        await gw.terminate()
+
+        # The INFO request sent on connection is tracked too, and completed
+        # by the summary
+        self.assertIn('qolsysgw_panel_actions_total'
+                      '{action="INFO",result="completed"} 1', metrics)
+        self.assertIn('qolsysgw_panel_actions_total'
+                      '{action="DISARM",result="completed"} 1', metrics)
+        self.assertIn('qolsysgw_panel_action_ack_latency_seconds_count'
+                      '{action="DISARM"} 1', metrics)
+        self.assertIn('qolsysgw_panel_action_latency_seconds_count'
+                      '{action="DISARM"} 1', metrics)
+        self.assertIn('qolsysgw_panel_actions_inflight 0', metrics)
+
+    async def test_integration_gateway_disarm_not_delayed_by_flood(self):
+        panel, gw, _, _ = await self._ready_panel_and_gw(
+            partition_ids=[0],
+            zone_ids=[10000],
+            panel_user_code='1234',
+            panel_send_interval=0.05,
+            metrics_port=0,
+        )
+
+        def control(action):
+            gw.mqtt_publish(
+                'homeassistant/alarm_control_panel/qolsys_panel/set',
+                json.dumps({
+                    'action': action,
+                    'partition_id': 0,
+                    'session_token': gw._session_token,
+                }),
+                namespace='mqtt',
+            )
+
+        flood = 30
+        start = time.monotonic()
+        for _ in range(flood):
+            control('ARM_AWAY')
+        control('DISARM')
+
+        action = await panel.wait_for_next_message(
+            timeout=self._TIMEOUT,
+            filters={'action': 'ARMING', 'arming_type': 'DISARM'},
+        )
+        self.assertIsNotNone(action)
+        disarm_latency = time.monotonic() - start
+
+        arming = [m['arming_type'] for m in panel.MESSAGES.MESSAGES
+                  if m['action'] == 'ARMING']
+        await gw.terminate()
+
+        # The disarm jumps ahead of the queued arm actions, that are paced
+        # by the send interval
+        self.assertLessEqual(arming.index('DISARM'), 2)
+        self.assertLess(disarm_latency, flood * 0.05 / 2)
+
+    async def _init_panels_and_gw(self, unique_ids):
+        panels = {}
+        for unique_id in unique_ids:
+            panels[unique_id] = PanelServer()
+            await panels[unique_id].start()
+
+        gw = QolsysGateway()
+        gw.args = {
+            'panel_token': '<panel_token>',
+            'panels': [
+                {
+                    'panel_host': 'localhost',
+                    'panel_port': panel.port,
+                    'panel_unique_id': unique_id,
+                    'panel_device_name': f'Panel {unique_id}',
+                }
+                for unique_id, panel in panels.items()
+            ],
+        }
+        await gw.initialize()
+
+        return panels, gw
+
+    async def test_integration_gateway_multiple_panels(self):
+        panels, gw = await self._init_panels_and_gw(('site1', 'site2'))
+
+        # A single set of subscriptions covers the topics of all the panels
+        self.assertEqual(
+            ['homeassistant/alarm_control_panel/+/set', 'qolsys/+/event'],
+            sorted(s['topic'] for s in gw.SUBSCRIBED_TO),
+        )
+
+        infos = await asyncio.gather(*(
+            panel.wait_for_next_message(
+                timeout=self._SUMMARY_TIMEOUT,
+                filters={'action': 'INFO'},
+            )
+            for panel in panels.values()
+        ))
+        self.assertNotIn(None, infos)
+
+        for unique_id, panel in panels.items():
+            # Both panels have a zone with the same name
+            summary = get_summary(zone_ids=[10000]).event
+            await panel.writeline(summary)
+
+            # The summary goes through the event topic of the panel, and is
+            # routed back to the state of that panel only
+            await gw.wait_for_next_mqtt_publish(
+                timeout=self._SUMMARY_TIMEOUT,
+                filters={'topic': f'homeassistant/binary_sensor/'
+                                  f'{unique_id}/my_door/state'},
+                raise_on_timeout=True,
+            )
+
+        # The zones of each panel have their own topics and entity ids
+        for unique_id in panels:
+            sensor_config = await gw.find_last_mqtt_publish(
+                filters={'topic': f'homeassistant/binary_sensor/'
+                                  f'{unique_id}/my_door/config'},
+                raise_if_not_found=True,
+            )
+            self.assertJsonSubDictEqual(
+                {
+                    'name': 'My Door',
+                    'object_id': f'{unique_id}_my_door',
+                    'state_topic': f'homeassistant/binary_sensor/'
+                                   f'{unique_id}/my_door/state',
+                },
+                sensor_config['payload'],
+            )
+        self.assertIsNone(await gw.find_last_mqtt_publish(
+            filters={'topic': 'homeassistant/binary_sensor/my_door/config'},
+        ))
+
+        partition_config = await gw.find_last_mqtt_publish(
+            filters={'topic': 'homeassistant/alarm_control_panel/site2/'
+                              'partition0/config'},
+            raise_if_not_found=True,
+        )
+        self.assertJsonSubDictEqual(
+            {'unique_id': 'site2_p0'},
+            partition_config['payload'],
+        )
+
+        gw.mqtt_publish(
+            'homeassistant/alarm_control_panel/site2/set',
+            json.dumps({
+                'action': 'ARM_AWAY',
+                'partition_id': 0,
+                'session_token': gw._session_token,
+            }),
+            namespace='mqtt',
+        )
+
+        action = await panels['site2'].wait_for_next_message(
+            timeout=self._SUMMARY_TIMEOUT,
+            filters={'action': 'ARMING'},
+        )
+        self.assertIsNotNone(action)
+
+        metrics = gw._metrics.as_dict()
+        await gw.terminate()
+
+        self.assertFalse([m for m in panels['site1'].MESSAGES.MESSAGES
+                          if m['action'] == 'ARMING'])
+        self.assertDictEqual({'site1': 1, 'site2': 1},
+                             metrics['panel_connections'])
+        self.assertDictEqual(
+            {'site1/QolsysEventInfoSummary': 1,
+             'site2/QolsysEventInfoSummary': 1},
+            metrics['panel_events'],
+        )
+
+    async def test_integration_gateway_multiple_panels_record_their_own_errors(self):
+        panels, gw = await self._init_panels_and_gw(('site1', 'site2'))
+
+        infos = await asyncio.gather(*(
+            panel.wait_for_next_message(
+                timeout=self._SUMMARY_TIMEOUT,
+                filters={'action': 'INFO'},
+            )
+            for panel in panels.values()
+        ))
+        self.assertNotIn(None, infos)
+
+        await panels['site1'].writeline({'event': 'unknown'})
+
+        await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/sensor/site1_last_error/state'},
+            raise_on_timeout=True,
+        )
+        await gw.terminate()
+
+        site1, site2 = gw._panels
+        self.assertIsInstance(site1.state.last_exception,
+                              UnknownQolsysEventException)
+        self.assertIsNone(site2.state.last_exception)
@@ -1,3 +1,7 @@
+import asyncio
+import json
+import time
+
 from copy import deepcopy
 from types import SimpleNamespace
 
@@ -6,6 +10,7 @@ from unittest import mock
 import testenv  # noqa: F401
 from testbase import TestQolsysGatewayBase
 
+from testutils.fixtures_data import get_summary
 from testutils.mock_types import ISODATE
 
 from qolsys.sensors import QolsysSensorAuxiliaryPendant
@@ -829,6 +834,169 @@ class TestIntegrationQolsysEvents(TestQolsysGatewayBase):
                 expected_enabled_by_default=True,
             )
 
+    async def test_integration_event_info_summary_unchanged_does_not_republish(self):
+        panel, gw, entity_ids, topics = await self._ready_panel_and_gw()
+
+        sensor = gw._state.partition(0).zone(10000)
+        gw.mqtt_publish_func.reset_mock()
+
+        await panel.writeline(get_summary().event)
+
+        publish = await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/alarm_control_panel/'
+                              'qolsys_panel/partition0/config'},
+        )
+        self.assertIsNone(publish)
+
+        # Only the event itself has been forwarded to MQTT
+        gw.mqtt_publish_func.assert_called_once_with(
+            'qolsys/qolsys_panel/event',
+            mock.ANY,
+            namespace=mock.ANY,
+        )
+
+        # The state kept the same objects
+        self.assertIs(sensor, gw._state.partition(0).zone(10000))
+
+        self.assertTrue(panel.is_client_connected)
+
+    async def test_integration_event_info_summary_reconciles_changes(self):
+        panel, gw, entity_ids, topics = await self._ready_panel_and_gw()
+
+        gw.mqtt_publish_func.reset_mock()
+
+        summary = deepcopy(get_summary().event)
+        zone_list = summary['partition_list'][0]['zone_list']
+        # Remove 'My Door', and close 'My Window'
+        del zone_list[0]
+        zone_list[0]['status'] = 'Closed'
+
+        await panel.writeline(summary)
+
+        availability = await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/binary_sensor/'
+                              'my_door/availability'},
+        )
+        self.assertIsNotNone(availability)
+        self.assertEqual('offline', availability['payload'])
+
+        state = await gw.find_last_mqtt_publish(
+            filters={'topic': 'homeassistant/binary_sensor/'
+                              'my_window/state'},
+        )
+        self.assertIsNotNone(state)
+        self.assertEqual('Closed', state['payload'])
+
+        self.assertIsNone(gw._state.partition(0).zone(10000))
+        self.assertEqual('Closed', gw._state.partition(0).zone(10001).status)
+
+        # No entity has been reconfigured
+        for call in gw.mqtt_publish_func.call_args_list:
+            self.assertFalse(call.args[0].endswith('/config'),
+                             f'unexpected config publish: {call}')
+
+        self.assertTrue(panel.is_client_connected)
+
+    def _large_summary(self, zones, partitions=4):
+        partition_list = [
+            {
+                'partition_id': partition_id,
+                'name': f'partition{partition_id}',
+                'status': 'DISARM',
+                'secure_arm': False,
+                'zone_list': [],
+            }
+            for partition_id in range(partitions)
+        ]
+
+        for i in range(zones):
+            partition_id = i % partitions
+            partition_list[partition_id]['zone_list'].append({
+                'id': f'{partition_id + 1:03d}-{i:04d}',
+                'type': 'Door_Window',
+                'name': f'Zone {i}',
+                'group': 'entryexitdelay',
+                'status': 'Closed',
+                'state': '0',
+                'zone_id': 100000 + i,
+                'zone_physical_type': 1,
+                'zone_alarm_type': 3,
+                'zone_type': 1,
+                'partition_id': partition_id,
+            })
+
+        return json.dumps({
+            'event': 'INFO',
+            'info_type': 'SUMMARY',
+            'partition_list': partition_list,
+            'nonce': 'qolsys',
+            'requestID': '<request_id>',
+        })
+
+    async def _wait_for_zones(self, gw, zones, timeout):
+        start = time.monotonic()
+        while time.monotonic() - start < timeout:
+            count = sum(len(p.sensors) for p in gw._state.partitions)
+            if count == zones:
+                return
+            await asyncio.sleep(.05)
+
+        self.fail(f'Timeout waiting for the {zones} zones to be loaded')
+
+    async def test_integration_event_info_summary_multi_megabyte(self):
+        # In direct mode, the summary is parsed while it is streamed
+        panel, gw = await self._init_panel_and_gw_and_wait(
+            event_mode='direct',
+        )
+
+        zones = 10000
+        summary = self._large_summary(zones)
+        self.assertGreater(len(summary), 2 * 1024 * 1024)
+
+        await panel.writeline(summary)
+        await self._wait_for_zones(gw, zones, timeout=30)
+
+        self.assertEqual(4, len(gw._state.partitions))
+        for partition in gw._state.partitions:
+            self.assertEqual(zones // 4, len(partition.sensors))
+            for sensor in partition.sensors:
+                self.assertIs(partition, sensor.partition)
+
+        sensor = gw._state.zone(100000 + zones - 1)
+        self.assertEqual(f'Zone {zones - 1}', sensor.name)
+        self.assertEqual(3, sensor.partition_id)
+
+        self.assertTrue(panel.is_client_connected)
+
+    async def test_integration_event_info_summary_over_max_line_size(self):
+        panel, gw = await self._init_panel_and_gw_and_wait(
+            panel_max_line_size=64 * 1024,
+        )
+
+        await panel.writeline(self._large_summary(1000))
+
+        error = await gw.wait_for_next_mqtt_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/sensor/'
+                              'qolsys_panel_last_error/attributes'},
+            raise_on_timeout=True,
+        )
+        self.assertJsonSubDictEqual(
+            {'type': 'QolsysLineTooLongException'},
+            error['payload'],
+        )
+
+        # The connection is kept, and the next lines are processed
+        self.assertTrue(panel.is_client_connected)
+
+        await panel.writeline(get_summary().event)
+        await self._wait_for_zones(
+            gw, len(get_summary().event['partition_list'][0]['zone_list']) +
+            len(get_summary().event['partition_list'][1]['zone_list']),
+            timeout=self._SUMMARY_TIMEOUT)
+
     async def _test_integration_event_info_secure_arm(self, from_secure_arm,
                                                       to_secure_arm):
         panel, gw, _, _ = await self._ready_panel_and_gw(
@@ -0,0 +1,253 @@
+import json
+import os
+import tempfile
+import unittest
+
+import testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+from testutils.mock_broker import MqttBroker
+from testutils.mock_panel import PanelServer
+
+from qolsys.exceptions import QolsysGwConfigError
+from standalone import QolsysStandaloneGateway
+from standalone import load_config
+
+
+class TestIntegrationQolsysStandaloneGateway(unittest.IsolatedAsyncioTestCase):
+
+    # Messages go through the broker, and the storages are polled every .1s
+    _TIMEOUT = 1
+    _RECONNECT_TIMEOUT = 5
+
+    async def _start(self, **kwargs):
+        broker = MqttBroker()
+        await broker.start()
+        self.addCleanup(broker.stop)
+
+        panel = PanelServer()
+        await panel.start()
+        self.addCleanup(panel.stop)
+
+        gw = QolsysStandaloneGateway(
+            args={
+                'panel_host': 'localhost',
+                'panel_port': panel.port,
+                'panel_token': '<panel_token>',
+                'panel_mac': '00:00:00:00:00:00',
+                **kwargs,
+            },
+            mqtt_args={
+                'client_host': 'localhost',
+                'client_port': broker.port,
+            },
+        )
+        await gw.initialize()
+        self.addAsyncCleanup(gw.terminate)
+
+        await panel.wait_for_next_message(
+            timeout=self._TIMEOUT,
+            filters={'action': 'INFO'},
+            raise_on_timeout=True,
+        )
+
+        summary = get_summary(partition_ids=[0], zone_ids=[10000])
+        await panel.writeline(summary.event)
+        await broker.wait_for_next_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': summary.last_topic},
+            startpos=0,
+            raise_on_timeout=True,
+        )
+
+        return broker, panel, gw
+
+    async def _control(self, broker, panel, gw):
+        broker.publish(
+            'homeassistant/alarm_control_panel/qolsys_panel/set',
+            json.dumps({
+                'action': 'DISARM',
+                'partition_id': 0,
+                'session_token': gw._session_token,
+                'code': '4242',
+            }),
+        )
+
+        return await panel.wait_for_next_message(
+            timeout=self._TIMEOUT,
+            filters={'action': 'ARMING'},
+            raise_on_timeout=True,
+        )
+
+    async def test_integration_standalone_publishes_entities(self):
+        broker, panel, gw = await self._start()
+
+        birth = await broker.find_last_publish(
+            filters={'topic': 'qolsysgw/status'},
+            raise_if_not_found=True,
+        )
+        self.assertEqual('online', birth['payload'])
+        self.assertTrue(birth['retain'])
+
+        config = await broker.find_last_publish(
+            filters={'topic': 'homeassistant/alarm_control_panel/'
+                              'qolsys_panel/partition0/config'},
+            raise_if_not_found=True,
+        )
+        self.assertTrue(config['retain'])
+        # The availability of the entities follows the birth and will of
+        # the client of the gateway
+        self.assertIn({
+            'topic': 'qolsysgw/status',
+            'payload_available': 'online',
+            'payload_not_available': 'offline',
+        }, json.loads(config['payload'])['availability'])
+
+        state = await broker.find_last_publish(
+            filters={'topic': 'homeassistant/alarm_control_panel/'
+                              'qolsys_panel/partition0/state'},
+            raise_if_not_found=True,
+        )
+        self.assertEqual('disarmed', state['payload'])
+
+    async def test_integration_standalone_control_reaches_panel(self):
+        broker, panel, gw = await self._start()
+
+        action = await self._control(broker, panel, gw)
+        self.assertEqual('DISARM', action['arming_type'])
+        self.assertEqual('4242', action['usercode'])
+
+    async def test_integration_standalone_events_round_trip_through_mqtt(self):
+        broker, panel, gw = await self._start(event_mode='mqtt')
+
+        event = {
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'version': 1,
+            'zone': {
+                'status': 'Open',
+                'zone_id': 10000,
+            },
+            'requestID': '<request_id>',
+        }
+        startpos = len(broker.PUBLISHED.MESSAGES)
+        await panel.writeline(event)
+
+        mirrored = await broker.wait_for_next_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'qolsys/qolsys_panel/event'},
+            startpos=startpos,
+            raise_on_timeout=True,
+        )
+        self.assertEqual(event, json.loads(mirrored['payload']))
+
+        # The event is processed once received back from the broker
+        state = await broker.wait_for_next_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'homeassistant/binary_sensor/my_door/state'},
+            continued=True,
+            raise_on_timeout=True,
+        )
+        self.assertEqual('Open', state['payload'])
+        self.assertTrue(gw._state.zone(10000).is_open)
+
+    async def test_integration_standalone_reconnects_to_broker(self):
+        broker, panel, gw = await self._start()
+        await broker.wait_for_client()
+
+        startpos = len(broker.CONNECTIONS.MESSAGES)
+        broker.disconnect_clients()
+
+        await broker.CONNECTIONS.wait_for_next(
+            timeout=self._RECONNECT_TIMEOUT,
+            startpos=startpos,
+            raise_on_timeout=True,
+        )
+        await gw.mqtt_client.wait_connected(timeout=self._TIMEOUT)
+
+        # The client subscribed again to the control topic
+        action = await self._control(broker, panel, gw)
+        self.assertEqual('DISARM', action['arming_type'])
+
+        # The birth message is published again after the will
+        messages = [m['payload'] for m in broker.PUBLISHED.MESSAGES
+                    if m['topic'] == 'qolsysgw/status']
+        self.assertEqual(['online', 'offline', 'online'], messages)
+
+    async def test_integration_standalone_terminate_publishes_will(self):
+        broker, panel, gw = await self._start()
+
+        await gw.terminate()
+
+        will = await broker.find_last_publish(
+            filters={'topic': 'qolsysgw/status'},
+            raise_if_not_found=True,
+        )
+        self.assertEqual('offline', will['payload'])
+        self.assertTrue(will['retain'])
+        self.assertEqual([], broker.clients)
+
+        availability = await broker.find_last_publish(
+            filters={'topic': 'homeassistant/alarm_control_panel/'
+                              'qolsys_panel/partition0/availability'},
+            raise_if_not_found=True,
+        )
+        self.assertEqual('offline', availability['payload'])
+
+
+class TestIntegrationStandaloneConfig(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self._tmpdir.cleanup)
+
+    def _write(self, name, content):
+        path = os.path.join(self._tmpdir.name, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def test_integration_load_config_from_json(self):
+        path = self._write('qolsysgw.json', json.dumps({
+            'panel_host': '192.168.1.10',
+            'panel_token': '<panel_token>',
+            'mqtt': {'client_host': 'broker', 'client_user': 'user'},
+        }))
+
+        args, mqtt_args = load_config(path)
+        self.assertEqual({'panel_host': '192.168.1.10',
+                          'panel_token': '<panel_token>'}, args)
+        self.assertEqual({'client_host': 'broker', 'client_user': 'user'},
+                         mqtt_args)
+
+    def test_integration_load_config_from_apps_yaml(self):
+        path = self._write('apps.yaml', '\n'.join([
+            'qolsys_panel:',
+            '  module: gateway',
+            '  class: QolsysGateway',
+            '  panel_host: 192.168.1.10',
+            '  panel_token: <panel_token>',
+            'other_panel:',
+            '  module: gateway',
+            '  class: QolsysGateway',
+            '  panel_host: 192.168.1.11',
+            '  panel_token: <panel_token>',
+            'other_app:',
+            '  module: other',
+            '  class: Other',
+        ]))
+
+        with self.assertRaises(QolsysGwConfigError):
+            load_config(path)
+
+        args, mqtt_args = load_config(path, app='other_panel')
+        self.assertEqual({'panel_host': '192.168.1.11',
+                          'panel_token': '<panel_token>'}, args)
+        self.assertEqual({}, mqtt_args)
+
+    def test_integration_unknown_mqtt_config_key(self):
+        with self.assertRaises(QolsysGwConfigError):
+            QolsysStandaloneGateway(args={}, mqtt_args={'client_hots': 'x'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -12,6 +12,7 @@ from qolsys.config import QolsysGatewayConfig
 class TestQolsysGatewayBase(unittest.IsolatedAsyncioTestCase):
 
     _TIMEOUT = .1
+    _SUMMARY_TIMEOUT = 2
 
     def assertJsonDictEqual(self, expected, actual):
         if not isinstance(actual, dict):
@@ -93,8 +94,9 @@ class TestQolsysGatewayBase(unittest.IsolatedAsyncioTestCase):
         # before we can check the final result; we check that by waiting
         # for the last entity's last topic to be published
         await gw.wait_for_next_mqtt_publish(
-            timeout=self._TIMEOUT,
+            timeout=self._SUMMARY_TIMEOUT,
             filters={'topic': summary.last_topic},
+            raise_on_timeout=True,
         )
 
         # Strip 'qolsys_panel_' prefix from all entity ids
@@ -12,6 +12,21 @@ from appdaemon.utils import sync_wrapper
 LOGGER = logging.getLogger(__name__)
 
 
+def _topic_matches(topic_filter, topic):
+    filter_levels = topic_filter.split('/')
+    topic_levels = topic.split('/')
+
+    for i, level in enumerate(filter_levels):
+        if level == '#':
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != '+' and level != topic_levels[i]:
+            return False
+
+    return len(filter_levels) == len(topic_levels)
+
+
 class ADBase(object):
     def __init__(self, *args, **kwargs):
         self.name = uuid.uuid4()
@@ -113,13 +128,20 @@ class Mqtt(ADBase, ADAPI):
         # any LISTEN_EVENT with MQTT_MESSAGE as event, for the same topic,
         # and in which case we can call the callback
         for listener in self.LISTEN_EVENT:
-            if listener['event'] != 'MQTT_MESSAGE' or listener['topic'] != topic:
+            if listener['event'] != 'MQTT_MESSAGE':
+                continue
+            if 'wildcard' in listener:
+                if not _topic_matches(listener['wildcard'], topic):
+                    continue
+            elif listener.get('topic') != topic:
                 continue
 
-            # This is not at all complete, as we only put the payload in the
-            # data and give nothing for the kwargs, but that's sufficient for
-            # out mock here
-            await listener['callback']('MQTT_MESSAGE', {'payload': payload}, {})
+            # This is not at all complete, as we only put the topic and the
+            # payload in the data and give nothing for the kwargs, but that's
+            # sufficient for out mock here
+            await listener['callback']('MQTT_MESSAGE',
+                                       {'topic': topic, 'payload': payload},
+                                       {})
 
     def mqtt_subscribe(self, topic, **kwargs):
         subscribe = deepcopy(kwargs)
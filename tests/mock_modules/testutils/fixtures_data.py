@@ -370,8 +370,10 @@ def get_summary(secure_arm=False, partition_ids=None,
         'attributes',
     ]
 
+    # The topics use the entity id without the device prefix
     last_topic = (f'homeassistant/binary_sensor/'
-                  f'{entity_ids[-1]}/{topics[-1]}')
+                  f'{entity_ids[-1].removeprefix("qolsys_panel_")}/'
+                  f'{topics[-1]}')
 
     return SimpleNamespace(
         event=event,
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import struct
+
+from testutils.utils import MessageStorage
+
+from mqtt import client as mqtt
+from mqtt.utils import topic_matches
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class _BrokerClient(object):
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.client_id = None
+        self.will = None
+        self.subscriptions = {}
+
+    def send(self, packet):
+        self.writer.write(packet)
+
+
+class MqttBroker(object):
+    """
+    In-process stand-in for an MQTT 3.1.1 broker: it routes the messages
+    between its clients with QoS 0 and 1, keeps the retained messages, and
+    publishes the will of the clients that disconnect uncleanly; every
+    message published to it is stored, as well as the connections
+    """
+
+    def __init__(self):
+        self.PUBLISHED = MessageStorage(name='publish')
+        self.CONNECTIONS = MessageStorage(name='connection')
+        self.retained = {}
+        self.pings = 0
+        self._clients = set()
+        self._server = None
+        self._port = None
+        self._refuse = None
+
+    async def start(self, port=0):
+        self._server = await asyncio.start_server(
+            self._serve_client, 'localhost', port)
+        self._port = self._server.sockets[0].getsockname()[1]
+
+    def stop(self):
+        self.disconnect_clients()
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+
+    @property
+    def port(self):
+        return self._port
+
+    @property
+    def clients(self):
+        return [client.client_id for client in self._clients]
+
+    def refuse_connections(self, return_code=5):
+        # Answer the next connections with the given CONNACK return code
+        self._refuse = return_code
+
+    def disconnect_clients(self):
+        # Close the connections abruptly, as when the network goes down
+        for client in list(self._clients):
+            client.writer.close()
+
+    def publish(self, topic, payload, retain=False):
+        """
+        Publish a message from outside of the clients, as Home Assistant
+        would
+        """
+        self._route(topic, mqtt.encode_payload(payload), 0, retain,
+                    client_id=None)
+
+    async def wait_for_next_publish(self, *args, **kwargs):
+        return await self.PUBLISHED.wait_for_next(*args, **kwargs)
+
+    async def find_last_publish(self, *args, **kwargs):
+        return await self.PUBLISHED.find_last(*args, **kwargs)
+
+    async def wait_for_client(self, timeout=5):
+        return await self.CONNECTIONS.wait_for_next(
+            timeout=timeout, startpos=0, raise_on_timeout=True)
+
+    def _route(self, topic, payload, qos, retain, client_id):
+        self.PUBLISHED.append({
+            'topic': topic,
+            'payload': payload.decode(),
+            'qos': qos,
+            'retain': retain,
+            'client_id': client_id,
+        })
+
+        if retain:
+            if payload:
+                self.retained[topic] = payload
+            else:
+                self.retained.pop(topic, None)
+
+        for client in self._clients:
+            granted = [q for f, q in client.subscriptions.items()
+                       if topic_matches(f, topic)]
+            if granted:
+                self._deliver(client, topic, payload, min(qos, max(granted)),
+                              retain=False)
+
+    def _deliver(self, client, topic, payload, qos, retain):
+        packet_id = 1 if qos else None
+        client.send(mqtt.encode_publish(topic, payload, qos, retain,
+                                        packet_id))
+
+    async def _serve_client(self, reader, writer):
+        client = _BrokerClient(writer)
+        clean = False
+        try:
+            packet_type, _, body = await mqtt.read_packet(reader)
+            if packet_type != mqtt.CONNECT:
+                return
+            self._connect(client, body)
+
+            if self._refuse is not None:
+                client.send(mqtt.encode_packet(
+                    mqtt.CONNACK, bytes((0, self._refuse))))
+                await writer.drain()
+                return
+
+            client.send(mqtt.encode_packet(mqtt.CONNACK, b'\x00\x00'))
+            self._clients.add(client)
+            self.CONNECTIONS.append({'client_id': client.client_id})
+
+            while True:
+                packet_type, flags, body = await mqtt.read_packet(reader)
+                if packet_type == mqtt.DISCONNECT:
+                    clean = True
+                    break
+                self._handle(client, packet_type, flags, body)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(client)
+            writer.close()
+
+            if not clean and client.will is not None:
+                self._route(*client.will, client_id=client.client_id)
+
+    def _connect(self, client, body):
+        _, pos = mqtt.decode_string(body)
+        _, flags = body[pos], body[pos + 1]
+        pos += 4
+
+        client.client_id, pos = mqtt.decode_string(body, pos)
+        if flags & 0x4:
+            topic, pos = mqtt.decode_string(body, pos)
+            length, = struct.unpack_from('!H', body, pos)
+            payload = body[pos + 2:pos + 2 + length]
+            client.will = (topic, payload, (flags >> 3) & 0x3,
+                           bool(flags & 0x20))
+
+    def _handle(self, client, packet_type, flags, body):
+        if packet_type == mqtt.PUBLISH:
+            topic, payload, qos, retain, packet_id = \
+                mqtt.decode_publish(flags, body)
+            if qos:
+                client.send(mqtt.encode_packet(
+                    mqtt.PUBACK, struct.pack('!H', packet_id)))
+            self._route(topic, payload, qos, retain,
+                        client_id=client.client_id)
+        elif packet_type == mqtt.SUBSCRIBE:
+            packet_id, = struct.unpack_from('!H', body)
+            pos = 2
+            granted = []
+            filters = []
+            while pos < len(body):
+                topic_filter, pos = mqtt.decode_string(body, pos)
+                qos = min(body[pos], 1)
+                pos += 1
+                client.subscriptions[topic_filter] = qos
+                granted.append(qos)
+                filters.append(topic_filter)
+            client.send(mqtt.encode_packet(
+                mqtt.SUBACK, struct.pack('!H', packet_id) + bytes(granted)))
+
+            for topic, payload in self.retained.items():
+                if any(topic_matches(f, topic) for f in filters):
+                    self._deliver(client, topic, payload, 0, retain=True)
+        elif packet_type == mqtt.UNSUBSCRIBE:
+            packet_id, = struct.unpack_from('!H', body)
+            pos = 2
+            while pos < len(body):
+                topic_filter, pos = mqtt.decode_string(body, pos)
+                client.subscriptions.pop(topic_filter, None)
+            client.send(mqtt.encode_packet(
+                mqtt.UNSUBACK, struct.pack('!H', packet_id)))
+        elif packet_type == mqtt.PINGREQ:
+            self.pings += 1
+            client.send(mqtt.encode_packet(mqtt.PINGRESP))
+        elif packet_type == mqtt.PUBACK:
+            pass
+        else:
+            LOGGER.warning(f'Unexpected packet type {packet_type}')
@@ -75,8 +75,14 @@ class PanelServer(object):
 
         return self._client_connected
 
+    def stop_responding(self):
+        # Keep the connection open, but stop acknowledging and handling
+        # the messages, as a panel behind a half-open connection
+        self._responding = False
+
     def stop(self):
         self._keep_listening = False
+        self._responding = True
         self._port = None
         self._writer = None
         self._client_connected = False
@@ -104,6 +110,11 @@ class PanelServer(object):
                 # We can't use readline() as there's no guarantee
                 # we're getting a \n at the end of the message
                 line = await reader.read(4096)
+                if not line:
+                    break
+
+                if not self._responding:
+                    continue
 
                 # Acknowledge that the message was received, as the panel does
                 writer.write('ACK\n'.encode())
@@ -113,6 +124,10 @@ class PanelServer(object):
                 line = line.decode().rstrip('\n')
                 LOGGER.info(f"Data received (len: {len(line)}): {line}")
 
+                # Keep-alive
+                if not line:
+                    continue
+
                 # Convert to JSON
                 line_as_json = json.loads(line)
                 self.MESSAGES.append(line_as_json)
@@ -0,0 +1,183 @@
+import asyncio
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.mqtt.testenv  # noqa: F401
+from testutils.mock_broker import MqttBroker
+
+from mqtt.client import MqttClient
+from mqtt.client import MqttMessage
+from mqtt.client import decode_publish
+from mqtt.client import encode_length
+from mqtt.client import encode_publish
+from qolsys.metrics import QolsysMetrics
+
+
+class TestUnitMqttClientEncoding(unittest.TestCase):
+
+    def test_unit_encode_length(self):
+        self.assertEqual(b'\x00', encode_length(0))
+        self.assertEqual(b'\x7f', encode_length(127))
+        self.assertEqual(b'\x80\x01', encode_length(128))
+        self.assertEqual(b'\xff\x7f', encode_length(16383))
+        self.assertEqual(b'\x80\x80\x01', encode_length(16384))
+
+    def test_unit_publish_round_trip(self):
+        packet = encode_publish('a/b', b'payload', qos=1, retain=True,
+                                packet_id=42)
+
+        # Fixed header of one byte, and remaining length of one byte
+        self.assertEqual(0x33, packet[0])
+        self.assertEqual(len(packet) - 2, packet[1])
+
+        self.assertEqual(('a/b', b'payload', 1, True, 42),
+                         decode_publish(packet[0] & 0xf, packet[2:]))
+
+    def test_unit_publish_round_trip_qos0(self):
+        packet = encode_publish('a/b', b'payload')
+
+        self.assertEqual(('a/b', b'payload', 0, False, None),
+                         decode_publish(packet[0] & 0xf, packet[2:]))
+
+
+class TestUnitMqttClient(unittest.IsolatedAsyncioTestCase):
+
+    _TIMEOUT = 1
+
+    async def asyncSetUp(self):
+        self.broker = MqttBroker()
+        await self.broker.start()
+        self.addCleanup(self.broker.stop)
+
+    def _client(self, **kwargs):
+        client = MqttClient(
+            host='localhost',
+            port=self.broker.port,
+            client_id='test',
+            **kwargs,
+        )
+        self.addAsyncCleanup(client.stop)
+        return client
+
+    async def test_unit_publish_while_disconnected_is_buffered(self):
+        metrics = QolsysMetrics()
+        client = self._client(metrics=metrics)
+
+        future = client.publish('a/b', 'buffered', retain=True)
+        self.assertEqual(1, metrics.gauge('mqtt_client_buffered', '').value)
+
+        client.start()
+        await asyncio.wait_for(future, self._TIMEOUT)
+
+        message = await self.broker.wait_for_next_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'a/b'},
+            startpos=0,
+            raise_on_timeout=True,
+        )
+        self.assertEqual('buffered', message['payload'])
+        self.assertTrue(message['retain'])
+        self.assertEqual(0, metrics.gauge('mqtt_client_buffered', '').value)
+
+    async def test_unit_publish_qos1_resolves_on_puback(self):
+        metrics = QolsysMetrics()
+        client = self._client(metrics=metrics)
+        client.start()
+        await client.wait_connected(timeout=self._TIMEOUT)
+
+        future = client.publish('a/b', 'acknowledged', qos=1)
+        self.assertEqual(1, metrics.gauge('mqtt_client_inflight', '').value)
+
+        await asyncio.wait_for(future, self._TIMEOUT)
+        self.assertEqual(0, metrics.gauge('mqtt_client_inflight', '').value)
+
+        message = await self.broker.find_last_publish(
+            filters={'topic': 'a/b'},
+            raise_if_not_found=True,
+        )
+        self.assertEqual(1, message['qos'])
+
+    async def test_unit_publish_after_stop_fails(self):
+        client = self._client()
+        client.start()
+        await client.wait_connected(timeout=self._TIMEOUT)
+        await client.stop()
+
+        with self.assertRaises(ConnectionError):
+            await asyncio.wait_for(client.publish('a/b', 'late'),
+                                   self._TIMEOUT)
+
+    async def test_unit_receives_messages_matching_subscriptions(self):
+        received = []
+        client = self._client(on_message=received.append)
+        client.subscribe('a/+/c')
+        client.subscribe('d/#')
+        client.start()
+        await client.wait_connected(timeout=self._TIMEOUT)
+
+        for topic in ('a/b/c', 'a/b/d', 'd', 'd/e/f', 'e'):
+            self.broker.publish(topic, topic)
+        await asyncio.sleep(.1)
+
+        self.assertEqual([
+            MqttMessage('a/b/c', b'a/b/c', 0, False),
+            MqttMessage('d', b'd', 0, False),
+            MqttMessage('d/e/f', b'd/e/f', 0, False),
+        ], received)
+
+    async def test_unit_pings_when_only_receiving(self):
+        client = self._client(keepalive=1)
+        client.subscribe('a/b')
+        client.start()
+        await client.wait_connected(timeout=self._TIMEOUT)
+
+        # The client has to send a packet within the keep alive period,
+        # even if it keeps receiving messages
+        for _ in range(12):
+            self.broker.publish('a/b', 'message')
+            await asyncio.sleep(.1)
+
+        self.assertGreaterEqual(self.broker.pings, 1)
+        self.assertTrue(client.connected)
+
+    async def test_unit_publishes_birth_and_will(self):
+        client = self._client(
+            birth=MqttMessage('test/status', 'online', retain=True),
+            will=MqttMessage('test/status', 'offline', retain=True),
+        )
+        client.start()
+        await client.wait_connected(timeout=self._TIMEOUT)
+
+        message = await self.broker.wait_for_next_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'test/status'},
+            startpos=0,
+            raise_on_timeout=True,
+        )
+        self.assertEqual('online', message['payload'])
+
+        await client.stop()
+
+        message = await self.broker.wait_for_next_publish(
+            timeout=self._TIMEOUT,
+            filters={'topic': 'test/status'},
+            continued=True,
+            raise_on_timeout=True,
+        )
+        self.assertEqual('offline', message['payload'])
+        self.assertTrue(message['retain'])
+
+    async def test_unit_connection_refused(self):
+        self.broker.refuse_connections(5)
+
+        logger = mock.Mock()
+        client = self._client(logger=logger)
+        client.start()
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await client.wait_connected(timeout=.2)
+
+        self.assertFalse(client.connected)
+        logger.warning.assert_called_once()
+        self.assertIn('not authorized', logger.warning.call_args[0][0])
@@ -0,0 +1,119 @@
+import asyncio
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.mqtt.testenv  # noqa: F401
+
+from mqtt.publisher import MqttPublishQueue
+
+
+class TestUnitMqttPublishQueue(unittest.IsolatedAsyncioTestCase):
+
+    async def test_unit_publishes_after_window(self):
+        mqtt_publish = mock.Mock()
+        queue = MqttPublishQueue(mqtt_publish=mqtt_publish)
+
+        queue.publish(namespace='mqtt', topic='a', payload='1', retain=True)
+        mqtt_publish.assert_not_called()
+
+        await asyncio.sleep(0.01)
+
+        mqtt_publish.assert_called_once_with(
+            namespace='mqtt', topic='a', payload='1', retain=True)
+
+    async def test_unit_coalesces_messages_on_same_topic(self):
+        mqtt_publish = mock.Mock()
+        queue = MqttPublishQueue(mqtt_publish=mqtt_publish)
+
+        queue.publish(namespace='mqtt', topic='a', payload='1')
+        queue.publish(namespace='mqtt', topic='b', payload='2')
+        queue.publish(namespace='mqtt', topic='a', payload='3')
+        queue.publish(namespace='other', topic='a', payload='4')
+
+        await queue.flush()
+
+        # The last value wins, at the position of the first message
+        self.assertEqual(
+            [
+                mock.call(namespace='mqtt', topic='a', payload='3'),
+                mock.call(namespace='mqtt', topic='b', payload='2'),
+                mock.call(namespace='other', topic='a', payload='4'),
+            ],
+            mqtt_publish.call_args_list,
+        )
+        self.assertEqual(1, queue.stats['coalesced'])
+        self.assertEqual(3, queue.stats['published'])
+
+    async def test_unit_flushes_in_bounded_batches(self):
+        batches = []
+        current_batch = []
+
+        async def publish_done():
+            # Record the batch once all its messages have been sent
+            if current_batch:
+                batches.append(list(current_batch))
+                current_batch.clear()
+
+        def mqtt_publish(topic, **kwargs):
+            current_batch.append(topic)
+            return asyncio.ensure_future(publish_done())
+
+        queue = MqttPublishQueue(mqtt_publish=mqtt_publish, batch_size=2)
+        for topic in 'abcde':
+            queue.publish(topic=topic, payload=topic)
+
+        await queue.flush()
+
+        self.assertEqual([['a', 'b'], ['c', 'd'], ['e']], batches)
+
+    async def test_unit_window_delays_and_coalesces(self):
+        mqtt_publish = mock.Mock()
+        queue = MqttPublishQueue(mqtt_publish=mqtt_publish, window=0.05)
+
+        queue.publish(topic='a', payload='1')
+        await asyncio.sleep(0.01)
+        queue.publish(topic='a', payload='2')
+        await asyncio.sleep(0.01)
+
+        mqtt_publish.assert_not_called()
+        self.assertEqual(1, queue.depth)
+
+        await asyncio.sleep(0.1)
+
+        mqtt_publish.assert_called_once_with(topic='a', payload='2')
+        self.assertEqual(0, queue.depth)
+
+    async def test_unit_reports_stats(self):
+        mqtt_publish = mock.Mock()
+        queue = MqttPublishQueue(mqtt_publish=mqtt_publish)
+
+        self.assertIsNone(queue.stats['avg_flush_latency'])
+
+        for topic in 'abc':
+            queue.publish(topic=topic, payload=topic)
+        self.assertEqual(3, queue.depth)
+
+        await queue.flush()
+
+        stats = queue.stats
+        self.assertEqual(0, stats['depth'])
+        self.assertEqual(3, stats['max_depth'])
+        self.assertEqual(3, stats['published'])
+        self.assertEqual(1, stats['flushes'])
+        self.assertGreaterEqual(stats['last_flush_latency'], 0)
+
+    async def test_unit_keeps_publishing_on_error(self):
+        mqtt_publish = mock.Mock(side_effect=[RuntimeError('boom'), None])
+        queue = MqttPublishQueue(mqtt_publish=mqtt_publish)
+
+        queue.publish(topic='a', payload='1')
+        queue.publish(topic='b', payload='2')
+
+        await queue.flush()
+
+        self.assertEqual(2, mqtt_publish.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,15 +1,18 @@
+import asyncio
 import unittest
 
 from unittest import mock
 
 import tests.unit.qolsysgw.mqtt.testenv  # noqa: F401
 
+from mqtt.updater import MqttSensorDebouncer
 from mqtt.updater import MqttUpdater
 from mqtt.updater import MqttWrapperFactory
 from mqtt.updater import MqttWrapperQolsysState
 from mqtt.updater import MqttWrapperQolsysPartition
 from mqtt.updater import MqttWrapperQolsysSensor
 from qolsys.config import QolsysGatewayConfig
+from qolsys.metrics import QolsysMetrics
 from qolsys.state import QolsysState
 from qolsys.partition import QolsysPartition
 from qolsys.sensors import QolsysSensor
@@ -161,6 +164,78 @@ class TestUnitMqttUpdater(unittest.TestCase):
         new_sensor.register.assert_called_once_with(updater, callback=updater._sensor_update)
         wrapped[new_sensor].configure.assert_called_once_with(partition=partition)
 
+    def test_unit_partition_update_remove_sensor_sets_sensor_unavailable(self):
+        state = mock.create_autospec(QolsysState)
+        factory = mock.create_autospec(MqttWrapperFactory)
+
+        updater = MqttUpdater(state, factory)
+
+        partition = mock.create_autospec(QolsysPartition)
+        partition.name = f'TestPartition ({id(partition)})'
+
+        old_sensor = mock.create_autospec(QolsysSensor)
+
+        wrapped = {
+            old_sensor: mock.create_autospec(MqttWrapperQolsysSensor),
+        }
+        factory.wrap.side_effect = lambda obj: wrapped[obj]
+
+        updater._partition_update(partition,
+                                  change=QolsysPartition.NOTIFY_REMOVE_SENSOR,
+                                  prev_value=old_sensor)
+
+        old_sensor.unregister.assert_called_once_with(updater)
+        wrapped[old_sensor].set_unavailable.assert_called_once_with()
+        wrapped[old_sensor].configure.assert_not_called()
+
+    def test_unit_state_update_add_partition_configures_partition(self):
+        state = mock.create_autospec(QolsysState)
+        factory = mock.create_autospec(MqttWrapperFactory)
+
+        updater = MqttUpdater(state, factory)
+
+        sensor = mock.create_autospec(QolsysSensor)
+        partition = mock.create_autospec(QolsysPartition)
+        partition.sensors = [sensor]
+
+        wrapped = {
+            partition: mock.create_autospec(MqttWrapperQolsysPartition),
+            sensor: mock.create_autospec(MqttWrapperQolsysSensor),
+        }
+        factory.wrap.side_effect = lambda obj: wrapped[obj]
+
+        updater._state_update(state, change=QolsysState.NOTIFY_ADD_PARTITION,
+                              new_value=partition)
+
+        partition.register.assert_called_once_with(updater, callback=updater._partition_update)
+        wrapped[partition].configure.assert_called_once_with()
+        sensor.register.assert_called_once_with(updater, callback=updater._sensor_update)
+        wrapped[sensor].configure.assert_called_once_with(partition=partition)
+
+    def test_unit_state_update_remove_partition_sets_entities_unavailable(self):
+        state = mock.create_autospec(QolsysState)
+        factory = mock.create_autospec(MqttWrapperFactory)
+
+        updater = MqttUpdater(state, factory)
+
+        sensor = mock.create_autospec(QolsysSensor)
+        partition = mock.create_autospec(QolsysPartition)
+        partition.sensors = [sensor]
+
+        wrapped = {
+            partition: mock.create_autospec(MqttWrapperQolsysPartition),
+            sensor: mock.create_autospec(MqttWrapperQolsysSensor),
+        }
+        factory.wrap.side_effect = lambda obj: wrapped[obj]
+
+        updater._state_update(state, change=QolsysState.NOTIFY_REMOVE_PARTITION,
+                              prev_value=partition)
+
+        partition.unregister.assert_called_once_with(updater)
+        wrapped[partition].set_unavailable.assert_called_once_with()
+        sensor.unregister.assert_called_once_with(updater)
+        wrapped[sensor].set_unavailable.assert_called_once_with()
+
     def test_unit_partition_update_update_status_updates_partition_state(self):
         state = mock.create_autospec(QolsysState)
         factory = mock.create_autospec(MqttWrapperFactory)
@@ -256,6 +331,202 @@ class TestUnitMqttUpdater(unittest.TestCase):
 
         wrapped[sensor].update_attributes.assert_called_once_with()
 
+    def test_unit_sensor_update_batch_handles_each_change_once(self):
+        state = mock.create_autospec(QolsysState)
+        factory = mock.create_autospec(MqttWrapperFactory)
+
+        updater = MqttUpdater(state, factory)
+
+        sensor = mock.create_autospec(QolsysSensor)
+        sensor.name = f'TestSensor ({id(sensor)})'
+
+        wrapped = {
+            sensor: mock.create_autospec(MqttWrapperQolsysSensor),
+        }
+        factory.wrap.side_effect = lambda obj: wrapped[obj]
+
+        updater._sensor_update(sensor,
+                               change=QolsysSensor.NOTIFY_BATCH,
+                               changes=[
+                                   {'change': QolsysSensor.NOTIFY_UPDATE_TAMPERED,
+                                    'prev_value': False, 'new_value': True},
+                                   {'change': QolsysSensor.NOTIFY_UPDATE_ATTRIBUTES},
+                                   {'change': QolsysSensor.NOTIFY_UPDATE_STATUS,
+                                    'prev_value': 'Closed', 'new_value': 'Open'},
+                                   {'change': QolsysSensor.NOTIFY_UPDATE_ATTRIBUTES},
+                               ])
+
+        wrapped[sensor].update_state.assert_called_once_with()
+        wrapped[sensor].update_attributes.assert_called_once_with()
+
+
+class TestUnitMqttSensorDebouncer(unittest.IsolatedAsyncioTestCase):
+
+    _DELAY = .1
+
+    def _sensor(self, sensor_type='Motion', zone_id=1, sensor_id=None):
+        return QolsysSensor.from_json({
+            'id': sensor_id or f'001-{zone_id:04d}',
+            'type': sensor_type,
+            'name': f'{sensor_type} {zone_id}',
+            'group': 'awayinstantmotion',
+            'status': 'Closed',
+            'state': '0',
+            'zone_id': zone_id,
+            'zone_type': 2,
+            'zone_physical_type': 1,
+            'zone_alarm_type': 3,
+            'partition_id': 0,
+        }, partition=None)
+
+    def _debouncer(self, debounce):
+        self.published = []
+        self.published_zones = []
+
+        def publish(sensor):
+            self.published.append((sensor.id, sensor.status))
+            self.published_zones.append(
+                (sensor.id, sensor.zone_id, sensor.status))
+
+        self.metrics = QolsysMetrics()
+        return MqttSensorDebouncer(
+            debounce=debounce,
+            publish=publish,
+            metrics=self.metrics,
+        )
+
+    def _suppressed(self):
+        return self.metrics.counter('sensor_publishes_suppressed', '').value()
+
+    async def test_unit_publishes_leading_and_trailing_edges(self):
+        debouncer = self._debouncer({'default': self._DELAY})
+        sensor = self._sensor()
+
+        for status in ('Open', 'Closed', 'Open', 'Closed'):
+            sensor.status = status
+            debouncer.update(sensor)
+
+        self.assertEqual([('001-0001', 'Open')], self.published)
+
+        await asyncio.sleep(self._DELAY * 1.5)
+
+        self.assertEqual([
+            ('001-0001', 'Open'),
+            ('001-0001', 'Closed'),
+        ], self.published)
+        self.assertEqual(2, self._suppressed())
+
+    async def test_unit_publishes_right_away_after_delay(self):
+        debouncer = self._debouncer({'default': self._DELAY})
+        sensor = self._sensor()
+
+        sensor.status = 'Open'
+        debouncer.update(sensor)
+        await asyncio.sleep(self._DELAY * 1.5)
+        sensor.status = 'Closed'
+        debouncer.update(sensor)
+
+        self.assertEqual([
+            ('001-0001', 'Open'),
+            ('001-0001', 'Closed'),
+        ], self.published)
+        self.assertEqual(0, self._suppressed())
+
+    async def test_unit_debounces_each_sensor_separately(self):
+        debouncer = self._debouncer({'default': self._DELAY})
+        sensors = [self._sensor(zone_id=1), self._sensor(zone_id=2)]
+
+        for sensor in sensors:
+            sensor.status = 'Open'
+            debouncer.update(sensor)
+
+        self.assertEqual([
+            ('001-0001', 'Open'),
+            ('001-0002', 'Open'),
+        ], self.published)
+
+    async def test_unit_debounces_sensors_sharing_an_id_separately(self):
+        debouncer = self._debouncer({'default': self._DELAY})
+        sensors = [self._sensor(zone_id=1, sensor_id='001-0000'),
+                   self._sensor(zone_id=2, sensor_id='001-0000')]
+
+        for status in ('Open', 'Closed'):
+            for sensor in sensors:
+                sensor.status = status
+                debouncer.update(sensor)
+
+        self.assertEqual([
+            ('001-0000', 1, 'Open'),
+            ('001-0000', 2, 'Open'),
+        ], self.published_zones)
+
+        # Resetting one of the sensors does not cancel the trailing publish
+        # of the other one
+        debouncer.reset(sensors[0])
+        sensors[0].status = 'Open'
+        debouncer.update(sensors[0])
+
+        await asyncio.sleep(self._DELAY * 1.5)
+
+        # The final state of each sensor is published
+        self.assertEqual([
+            ('001-0000', 1, 'Open'),
+            ('001-0000', 2, 'Open'),
+            ('001-0000', 1, 'Open'),
+            ('001-0000', 2, 'Closed'),
+        ], self.published_zones)
+
+    async def test_unit_uses_delay_of_sensor_type(self):
+        debouncer = self._debouncer({'Motion': 5, 'default': 1})
+
+        self.assertEqual(5, debouncer.delay(self._sensor('Motion')))
+        # Inherits the delay of the motion sensors
+        self.assertEqual(5, debouncer.delay(self._sensor('Panel Motion')))
+        self.assertEqual(1, debouncer.delay(self._sensor('Door_Window')))
+
+    async def test_unit_alarm_sensors_are_exempt(self):
+        debouncer = self._debouncer({'default': self._DELAY,
+                                     'SmokeDetector': self._DELAY})
+
+        for sensor_type in ('SmokeDetector', 'CODetector', 'Water'):
+            sensor = self._sensor(sensor_type)
+            self.assertEqual(0, debouncer.delay(sensor))
+
+            self.published.clear()
+            for status in ('Open', 'Closed', 'Open'):
+                sensor.status = status
+                debouncer.update(sensor)
+
+            self.assertEqual(['Open', 'Closed', 'Open'],
+                             [status for _, status in self.published])
+
+    async def test_unit_reset_cancels_trailing_publish(self):
+        debouncer = self._debouncer({'default': self._DELAY})
+        sensor = self._sensor()
+
+        for status in ('Open', 'Closed'):
+            sensor.status = status
+            debouncer.update(sensor)
+        debouncer.reset(sensor)
+
+        await asyncio.sleep(self._DELAY * 1.5)
+
+        self.assertEqual([('001-0001', 'Open')], self.published)
+
+    async def test_unit_flush_publishes_pending_states(self):
+        debouncer = self._debouncer({'default': 60})
+        sensor = self._sensor()
+
+        for status in ('Open', 'Closed'):
+            sensor.status = status
+            debouncer.update(sensor)
+        debouncer.flush()
+
+        self.assertEqual([
+            ('001-0001', 'Open'),
+            ('001-0001', 'Closed'),
+        ], self.published)
+
 
 class TestUnitMqttWrapperQolsys(unittest.TestCase):
 
@@ -451,5 +722,111 @@ class TestUnitMqttWrapperQolsys(unittest.TestCase):
         self.assertDictEqual(expected, actual)
 
 
+class TestUnitMqttWrapperFactoryConfigureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.mqtt_publish = mock.MagicMock()
+
+        mqtt_plugin_cfg = mock.MagicMock()
+        mqtt_plugin_cfg.get.return_value = None
+
+        cfg = mock.create_autospec(QolsysGatewayConfig)
+        for k, v in QolsysGatewayConfig._DEFAULT_CONFIG.items():
+            if v is not QolsysGatewayConfig._SENTINEL:
+                setattr(cfg, k, v)
+
+        self.factory = MqttWrapperFactory(
+            mqtt_publish=self.mqtt_publish,
+            cfg=cfg,
+            mqtt_plugin_cfg=mqtt_plugin_cfg,
+            session_token='TestSessionToken',
+        )
+
+        self.partition = QolsysPartition(
+            partition_id=0,
+            name='TestPartition',
+            status='DISARM',
+            secure_arm=False,
+        )
+        self.zone = {
+            'id': '001-0000',
+            'type': 'Door_Window',
+            'name': 'TestSensor',
+            'group': 'entryexitdelay',
+            'status': 'Closed',
+            'state': '0',
+            'zone_id': 10000,
+            'zone_physical_type': 1,
+            'zone_alarm_type': 3,
+            'zone_type': 1,
+            'partition_id': 0,
+        }
+        self.sensor = QolsysSensor.from_json(self.zone, self.partition)
+        self.partition.add_sensor(self.sensor)
+
+    def _config_publishes(self):
+        return [
+            c for c in self.mqtt_publish.call_args_list
+            if c.kwargs['topic'].endswith('/config')
+        ]
+
+    def test_unit_configure_unchanged_does_not_republish(self):
+        for _ in range(3):
+            self.factory.wrap(self.partition).configure()
+            self.factory.wrap(self.sensor).configure(partition=self.partition)
+
+        self.assertEqual(2, len(self._config_publishes()))
+
+        # But the availability and state are still published every time
+        availability = [
+            c for c in self.mqtt_publish.call_args_list
+            if c.kwargs['topic'].endswith('/availability')
+        ]
+        self.assertEqual(6, len(availability))
+
+    def test_unit_configure_does_not_recompute_payload(self):
+        self.factory.wrap(self.sensor).configure(partition=self.partition)
+
+        with mock.patch.object(MqttWrapperQolsysSensor,
+                               'configure_payload') as configure_payload:
+            self.factory.wrap(self.sensor).configure(partition=self.partition)
+
+        configure_payload.assert_not_called()
+
+    def test_unit_configure_republishes_when_inputs_change(self):
+        self.factory.wrap(self.partition).configure()
+        self.partition.secure_arm = True
+        self.factory.wrap(self.partition).configure()
+
+        publishes = self._config_publishes()
+        self.assertEqual(2, len(publishes))
+        self.assertNotEqual(publishes[0].kwargs['payload'],
+                            publishes[1].kwargs['payload'])
+
+    def test_unit_configure_renamed_sensor_publishes_new_topic(self):
+        self.factory.wrap(self.sensor).configure(partition=self.partition)
+        self.sensor.update(QolsysSensor.from_json(
+            {**self.zone, 'name': 'RenamedSensor'}, self.partition))
+        self.factory.wrap(self.sensor).configure(partition=self.partition)
+
+        self.assertEqual(
+            [
+                'homeassistant/binary_sensor/testsensor/config',
+                'homeassistant/binary_sensor/renamedsensor/config',
+            ],
+            [c.kwargs['topic'] for c in self._config_publishes()],
+        )
+
+    def test_unit_configure_without_cache_always_publishes(self):
+        self.factory.wrap(self.partition).configure()
+
+        other_factory = MqttWrapperFactory(*self.factory._args,
+                                           **{**self.factory._kwargs,
+                                              'configure_cache': None})
+        other_factory.wrap(self.partition).configure()
+
+        self.assertEqual(2, len(self._config_publishes()))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
 
 from mqtt.utils import normalize_name_to_id
+from mqtt.utils import topic_matches
 
 
 class TestUnitNormalizeNameToId(unittest.TestCase):
@@ -25,6 +26,38 @@ class TestUnitNormalizeNameToId(unittest.TestCase):
         self.assertEqual('__',
                          normalize_name_to_id('北亰'))
 
+    def test_unit_returns_value_with_control_chars_replaced(self):
+        self.assertEqual('my_door', normalize_name_to_id('my\tdoor'))
+
+    def test_unit_caches_normalized_names(self):
+        normalize_name_to_id.cache_clear()
+        normalize_name_to_id('Salle à manger')
+        normalize_name_to_id('Salle à manger')
+
+        info = normalize_name_to_id.cache_info()
+        self.assertEqual((1, 1), (info.hits, info.misses))
+        self.assertEqual('salle_a_manger',
+                         normalize_name_to_id('Salle à manger'))
+
+
+class TestUnitTopicMatches(unittest.TestCase):
+
+    def test_unit_matches_exact_topic(self):
+        self.assertTrue(topic_matches('qolsys/panel/event',
+                                      'qolsys/panel/event'))
+        self.assertFalse(topic_matches('qolsys/panel/event',
+                                       'qolsys/panel/control'))
+
+    def test_unit_matches_single_level_wildcard(self):
+        self.assertTrue(topic_matches('qolsys/+/event', 'qolsys/panel/event'))
+        self.assertFalse(topic_matches('qolsys/+/event', 'qolsys/event'))
+        self.assertFalse(topic_matches('qolsys/+', 'qolsys/panel/event'))
+
+    def test_unit_matches_multi_level_wildcard(self):
+        self.assertTrue(topic_matches('qolsys/#', 'qolsys/panel/event'))
+        self.assertTrue(topic_matches('#', 'qolsys/panel/event'))
+        self.assertFalse(topic_matches('qolsys/#', 'homeassistant/panel'))
+
 
 if __name__ == '__main__':
     unittest.main()
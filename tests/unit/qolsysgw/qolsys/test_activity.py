@@ -0,0 +1,117 @@
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+
+from qolsys.activity import QolsysSensorActivity
+from qolsys.sensors import QolsysSensor
+
+
+class TestUnitQolsysSensorActivity(unittest.TestCase):
+
+    def test_unit_keeps_transitions_in_order(self):
+        activity = QolsysSensorActivity()
+        activity.record(QolsysSensorActivity.OPEN, at=1)
+        activity.record(QolsysSensorActivity.CLOSED, at=2)
+        activity.record(QolsysSensorActivity.TAMPERED, at=3)
+
+        self.assertEqual(3, len(activity))
+        self.assertEqual([(1, 'open'), (2, 'closed'), (3, 'tampered')],
+                         activity.transitions())
+
+    def test_unit_keeps_last_transitions_when_full(self):
+        activity = QolsysSensorActivity(capacity=4)
+        for at in range(10):
+            activity.record(at % 2, at=at)
+
+        self.assertEqual(4, len(activity))
+        self.assertEqual([(6, 'open'), (7, 'closed'),
+                          (8, 'open'), (9, 'closed')],
+                         activity.transitions())
+
+    def test_unit_average_open_duration(self):
+        activity = QolsysSensorActivity()
+        self.assertIsNone(activity.average_open_seconds)
+
+        # A close without a known open is not part of the average
+        activity.record(QolsysSensorActivity.CLOSED, at=0)
+        activity.record(QolsysSensorActivity.OPEN, at=10)
+        activity.record(QolsysSensorActivity.CLOSED, at=12)
+        activity.record(QolsysSensorActivity.OPEN, at=20)
+        activity.record(QolsysSensorActivity.TAMPERED, at=21)
+        activity.record(QolsysSensorActivity.CLOSED, at=26)
+
+        self.assertEqual(4, activity.average_open_seconds)
+        self.assertEqual(26, activity.last_changed_at)
+
+    @mock.patch('qolsys.activity.time.monotonic')
+    def test_unit_opens_per_hour_decays(self, monotonic):
+        activity = QolsysSensorActivity()
+        monotonic.return_value = 0
+        self.assertEqual(0, activity.opens_per_hour)
+
+        for at in range(10):
+            activity.record(QolsysSensorActivity.OPEN, at=at)
+            activity.record(QolsysSensorActivity.CLOSED, at=at + .5)
+
+        monotonic.return_value = 10
+        self.assertAlmostEqual(10, activity.opens_per_hour, places=1)
+
+        # After a time constant without opens, the rate is divided by e
+        monotonic.return_value = 10 + QolsysSensorActivity.RATE_WINDOW
+        self.assertAlmostEqual(3.67, activity.opens_per_hour, places=1)
+
+    def test_unit_as_dict(self):
+        activity = QolsysSensorActivity()
+        self.assertEqual({
+            'opens_per_hour': 0,
+            'average_open_seconds': None,
+            'last_changed': None,
+        }, activity.as_dict())
+
+        activity.record(QolsysSensorActivity.OPEN)
+        activity.record(QolsysSensorActivity.CLOSED)
+
+        data = activity.as_dict()
+        self.assertEqual(1, data['opens_per_hour'])
+        self.assertEqual(0, data['average_open_seconds'])
+        self.assertRegex(data['last_changed'],
+                         r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}\+00:00$')
+
+
+class TestUnitQolsysSensorActivityRecording(unittest.TestCase):
+
+    def _sensor(self):
+        return QolsysSensor.from_json({
+            'id': '001-0001',
+            'type': 'Door_Window',
+            'name': 'My Door',
+            'group': 'entryexitdelay',
+            'status': 'Closed',
+            'state': '0',
+            'zone_id': 1,
+            'zone_type': 1,
+            'zone_physical_type': 1,
+            'zone_alarm_type': 3,
+            'partition_id': 0,
+        }, partition=None)
+
+    def test_unit_records_status_and_tamper_transitions(self):
+        sensor = self._sensor()
+        sensor.open()
+        sensor.open()
+        sensor.closed()
+        sensor.closed()
+
+        self.assertEqual(['open', 'tampered', 'untampered', 'closed'],
+                         [kind for _, kind in sensor.activity.transitions()])
+
+    def test_unit_records_status_from_summary_update(self):
+        sensor = self._sensor()
+        updated = self._sensor()
+        updated.status = 'Open'
+        sensor.update(updated)
+
+        self.assertEqual(['open'],
+                         [kind for _, kind in sensor.activity.transitions()])
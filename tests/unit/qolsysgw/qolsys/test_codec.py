@@ -0,0 +1,116 @@
+import importlib.util
+import json
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+
+from qolsys import codec
+from qolsys.actions import QolsysActionInfo
+from qolsys.codec import QolsysJsonCodec
+from qolsys.codec import QolsysJsonCodecOrjson
+from qolsys.codec import QolsysJsonCodecStdlib
+from qolsys.events import QolsysEvent
+
+
+HAS_ORJSON = importlib.util.find_spec('orjson') is not None
+
+
+class TestUnitQolsysJsonCodec(unittest.TestCase):
+
+    def tearDown(self):
+        codec.reset()
+
+    def _codecs(self):
+        codecs = [QolsysJsonCodecStdlib()]
+        if HAS_ORJSON:
+            codecs.append(QolsysJsonCodecOrjson())
+        return codecs
+
+    def test_unit_stdlib_output_matches_json_dumps(self):
+        data = {'a': [1, 2.5, None, True], 'b': 'é"\n'}
+
+        self.assertEqual(json.dumps(data), QolsysJsonCodecStdlib().dumps(data))
+
+    def test_unit_round_trip(self):
+        data = get_summary().event
+
+        for c in self._codecs():
+            with self.subTest(codec=c.NAME):
+                self.assertEqual(data, c.loads(c.dumps(data)))
+                self.assertEqual(data, c.loads(c.dumps_bytes(data)))
+                self.assertEqual(c.dumps(data).encode(), c.dumps_bytes(data))
+
+    def test_unit_loads_bytes(self):
+        for c in self._codecs():
+            with self.subTest(codec=c.NAME):
+                self.assertEqual({'name': 'Entrée'},
+                                 c.loads('{"name": "Entrée"}'.encode()))
+                self.assertEqual({'name': 'Entrée'},
+                                 c.loads(bytearray('{"name": "Entrée"}'.encode())))
+
+    def test_unit_loads_raises_json_decode_error(self):
+        for c in self._codecs():
+            with self.subTest(codec=c.NAME):
+                with self.assertRaises(json.JSONDecodeError):
+                    c.loads('{not json')
+
+    def test_unit_get_by_name(self):
+        self.assertIsInstance(QolsysJsonCodec.get('json'),
+                              QolsysJsonCodecStdlib)
+
+        with self.assertRaises(ValueError):
+            QolsysJsonCodec.get('unknown')
+
+    def test_unit_get_auto_uses_fastest_available(self):
+        expected = QolsysJsonCodecOrjson if HAS_ORJSON else QolsysJsonCodecStdlib
+        self.assertIsInstance(QolsysJsonCodec.get('auto'), expected)
+        self.assertIsInstance(QolsysJsonCodec.get(None), expected)
+
+    def test_unit_use_switches_module_functions(self):
+        self.assertIsInstance(codec.current(), QolsysJsonCodecStdlib)
+        self.assertEqual('{"a": 1}', codec.dumps({'a': 1}))
+
+        if not HAS_ORJSON:
+            self.skipTest('orjson is not installed')
+
+        codec.use('orjson')
+        self.assertIsInstance(codec.current(), QolsysJsonCodecOrjson)
+        self.assertEqual('{"a":1}', codec.dumps({'a': 1}))
+        self.assertEqual(b'{"a":1}', codec.dumps_bytes({'a': 1}))
+
+    @unittest.skipUnless(HAS_ORJSON, 'orjson is not installed')
+    @mock.patch('qolsys.codec.LOGGER')
+    def test_unit_use_warns_when_replacing_a_different_codec(self, logger):
+        codec.use('json')
+        codec.use('json')
+        logger.warning.assert_not_called()
+
+        codec.use('orjson')
+        logger.warning.assert_called_once()
+        self.assertIn("'orjson' instead of 'json'",
+                      logger.warning.call_args[0][0])
+
+    @unittest.skipUnless(HAS_ORJSON, 'orjson is not installed')
+    def test_unit_events_and_actions_with_orjson(self):
+        line = json.dumps(get_summary().event)
+        expected = QolsysEvent.from_json(line)
+
+        codec.use('orjson')
+
+        event = QolsysEvent.from_json(line)
+        self.assertEqual([str(p) for p in expected.partitions],
+                         [str(p) for p in event.partitions])
+        self.assertEqual(expected.raw, event.raw)
+
+        action = QolsysActionInfo()
+        self.assertEqual(
+            {**action.data, 'token': 'abc'},
+            json.loads(action.with_token_bytes('abc')),
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,319 @@
+import json
+import unittest
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+
+from qolsys.control import QolsysControl
+from qolsys.control import QolsysControlArmAway
+from qolsys.control import QolsysControlTriggerFire
+from qolsys.events import QolsysEvent
+from qolsys.events import QolsysEventArming
+from qolsys.events import QolsysEventInfo
+from qolsys.events import QolsysEventInfoSecureArm
+from qolsys.events import QolsysEventInfoSummary
+from qolsys.events import QolsysEventInfoSummaryStreamParser
+from qolsys.events import QolsysEventZoneEventActive
+from qolsys.events import QolsysEventZoneEventUpdate
+from qolsys.exceptions import UnableToParseEventException
+from qolsys.exceptions import UnableToParseSensorException
+from qolsys.exceptions import UnknownQolsysControlException
+from qolsys.exceptions import UnknownQolsysEventException
+from qolsys.exceptions import UnknownQolsysSensorException
+from qolsys.sensors import QolsysSensor
+from qolsys.sensors import QolsysSensorMotion
+from qolsys.sensors import QolsysSensorPanelMotion
+
+
+ZONE = {
+    'id': '001-0011',
+    'type': 'Panel Motion',
+    'name': 'Panel Motion',
+    'group': 'safetymotion',
+    'status': 'Closed',
+    'state': '0',
+    'zone_id': 10011,
+    'zone_physical_type': 1,
+    'zone_alarm_type': 3,
+    'zone_type': 119,
+    'partition_id': 0,
+}
+
+
+class TestUnitQolsysEventFromJson(unittest.TestCase):
+
+    def test_unit_dispatches_on_event_type(self):
+        event = QolsysEvent.from_json(
+            '{"event": "ARMING", "arming_type": "DISARM", '
+            '"partition_id": 0, "version": 1}')
+
+        self.assertIsInstance(event, QolsysEventArming)
+        self.assertEqual('DISARM', event.arming_type)
+
+    def test_unit_dispatches_on_info_type(self):
+        event = QolsysEvent.from_json({
+            'event': 'INFO',
+            'info_type': 'SECURE_ARM',
+            'partition_id': 0,
+            'value': True,
+            'version': 1,
+        })
+
+        self.assertIsInstance(event, QolsysEventInfoSecureArm)
+        self.assertTrue(event.value)
+
+    def test_unit_dispatches_on_zone_event_type(self):
+        event = QolsysEvent.from_json({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'zone': {'zone_id': 10, 'status': 'Open'},
+            'version': 1,
+        })
+
+        self.assertIsInstance(event, QolsysEventZoneEventActive)
+        self.assertEqual(10, event.zone.id)
+
+        event = QolsysEvent.from_json({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_UPDATE',
+            'zone': ZONE,
+            'version': 1,
+        })
+
+        self.assertIsInstance(event, QolsysEventZoneEventUpdate)
+        self.assertIsInstance(event.zone, QolsysSensorPanelMotion)
+
+    def test_unit_subclass_from_json_accepts_own_events(self):
+        event = QolsysEventInfo.from_json({
+            'event': 'INFO',
+            'info_type': 'SECURE_ARM',
+            'partition_id': 0,
+            'value': False,
+            'version': 1,
+        })
+
+        self.assertIsInstance(event, QolsysEventInfoSecureArm)
+
+    def test_unit_subclass_from_json_refuses_other_events(self):
+        with self.assertRaises(UnableToParseEventException):
+            QolsysEventInfo.from_json({
+                'event': 'ARMING',
+                'arming_type': 'DISARM',
+                'partition_id': 0,
+            })
+
+    def test_unit_raises_on_missing_event_type(self):
+        with self.assertRaisesRegex(UnknownQolsysEventException,
+                                    'Event type not found'):
+            QolsysEvent.from_json({'not': 'expected'})
+
+    def test_unit_raises_on_unknown_event_type(self):
+        with self.assertRaisesRegex(UnknownQolsysEventException,
+                                    "Event type 'UNKNOWN' unsupported"):
+            QolsysEvent.from_json({'event': 'UNKNOWN'})
+
+    def test_unit_raises_on_unknown_event_subtype(self):
+        with self.assertRaisesRegex(UnknownQolsysEventException,
+                                    "Event INFO subtype 'UNKNOWN' unsupported"):
+            QolsysEvent.from_json({'event': 'INFO', 'info_type': 'UNKNOWN'})
+
+        with self.assertRaisesRegex(UnknownQolsysEventException,
+                                    "Event ZONE_EVENT subtype 'None' unsupported"):
+            QolsysEvent.from_json({'event': 'ZONE_EVENT'})
+
+
+class TestUnitQolsysSensorFromJson(unittest.TestCase):
+
+    def test_unit_dispatches_on_sensor_type(self):
+        sensor = QolsysSensor.from_json(ZONE, None)
+
+        self.assertIsInstance(sensor, QolsysSensorPanelMotion)
+        self.assertEqual('001-0011', sensor.id)
+        self.assertEqual(10011, sensor.zone_id)
+
+    def test_unit_subclass_from_json_accepts_child_types(self):
+        sensor = QolsysSensorMotion.from_json(ZONE, None)
+
+        self.assertIsInstance(sensor, QolsysSensorPanelMotion)
+
+    def test_unit_subclass_from_json_refuses_other_types(self):
+        with self.assertRaises(UnableToParseSensorException):
+            QolsysSensorPanelMotion.from_json({**ZONE, 'type': 'Motion'}, None)
+
+    def test_unit_raises_on_unknown_sensor_type(self):
+        with self.assertRaises(UnknownQolsysSensorException):
+            QolsysSensor.from_json({**ZONE, 'type': 'Unknown'}, None)
+
+
+class TestUnitQolsysControlFromJson(unittest.TestCase):
+
+    def test_unit_dispatches_on_action(self):
+        control = QolsysControl.from_json({
+            'action': 'TRIGGER_FIRE',
+            'partition_id': 0,
+        })
+
+        self.assertIsInstance(control, QolsysControlTriggerFire)
+
+    def test_unit_dispatches_on_normalized_action(self):
+        control = QolsysControl.from_json({
+            'action': 'arm-away',
+            'partition_id': 0,
+        })
+
+        self.assertIsInstance(control, QolsysControlArmAway)
+
+    def test_unit_raises_on_unknown_action(self):
+        with self.assertRaises(UnknownQolsysControlException):
+            QolsysControl.from_json({'action': 'ARM', 'partition_id': 0})
+
+
+class TestUnitQolsysModelSlots(unittest.TestCase):
+
+    def test_unit_summary_objects_have_no_dict(self):
+        event = QolsysEvent.from_json(get_summary().event)
+        self.assertFalse(hasattr(event, '__dict__'))
+
+        for partition in event.partitions:
+            self.assertFalse(hasattr(partition, '__dict__'))
+
+            for sensor in partition.sensors:
+                self.assertFalse(hasattr(sensor, '__dict__'),
+                                 f'for sensor class {type(sensor).__name__}')
+
+    def test_unit_events_have_no_dict(self):
+        events = [
+            {'event': 'ARMING', 'arming_type': 'DISARM', 'partition_id': 0},
+            {'event': 'ALARM', 'alarm_type': '', 'partition_id': 0},
+            {'event': 'ERROR', 'error_type': 'usercode',
+             'description': 'desc', 'partition_id': 0},
+            {'event': 'INFO', 'info_type': 'SECURE_ARM', 'value': True,
+             'partition_id': 0},
+            {'event': 'ZONE_EVENT', 'zone_event_type': 'ZONE_ACTIVE',
+             'zone': {'zone_id': 10, 'status': 'Open'}},
+            {'event': 'ZONE_EVENT', 'zone_event_type': 'ZONE_UPDATE',
+             'zone': ZONE},
+            {'event': 'ZONE_EVENT', 'zone_event_type': 'ZONE_ADD',
+             'zone': ZONE},
+        ]
+
+        for data in events:
+            event = QolsysEvent.from_json(data)
+            self.assertFalse(hasattr(event, '__dict__'),
+                             f'for event class {type(event).__name__}')
+
+    def test_unit_event_from_str_keeps_str_only(self):
+        raw_str = ('{"event": "ARMING", "arming_type": "DISARM", '
+                   '"partition_id": 0, "version": 1}')
+        event = QolsysEvent.from_json(raw_str)
+
+        self.assertIs(raw_str, event.raw_str)
+        self.assertEqual({
+            'event': 'ARMING',
+            'arming_type': 'DISARM',
+            'partition_id': 0,
+            'version': 1,
+        }, event.raw)
+
+
+class TestUnitQolsysEventInfoSummaryStreamParser(unittest.TestCase):
+
+    def _describe(self, event):
+        return [
+            (str(partition), [
+                (str(sensor), sensor.partition is partition)
+                for sensor in partition.sensors
+            ])
+            for partition in event.partitions
+        ]
+
+    def _stream(self, line, chunk_size):
+        parser = QolsysEventInfoSummaryStreamParser()
+        data = line.encode()
+        for i in range(0, len(data), chunk_size):
+            parser.feed(data[i:i + chunk_size])
+        parser.feed(b'', final=True)
+        return parser
+
+    def test_unit_streamed_summary_matches_from_json(self):
+        summary = get_summary().event
+        # Non-ASCII characters, so that chunks split them
+        summary['partition_list'][0]['zone_list'][0]['name'] = 'Porte d’entrée ✓'
+        line = json.dumps(summary)
+        expected = QolsysEvent.from_json(line)
+
+        for chunk_size in (1, 7, 64, len(line)):
+            with self.subTest(chunk_size=chunk_size):
+                parser = self._stream(line, chunk_size)
+                self.assertTrue(parser._spans)
+
+                event = parser.parse(line)
+
+                self.assertIsInstance(event, QolsysEventInfoSummary)
+                self.assertEqual(self._describe(expected),
+                                 self._describe(event))
+                self.assertIs(line, event.raw_str)
+
+    def test_unit_streamed_summary_with_any_key_order(self):
+        summary = get_summary().event
+        summary = {
+            'partition_list': [
+                {
+                    'zone_list': partition['zone_list'],
+                    **{k: v for k, v in partition.items()
+                       if k != 'zone_list'},
+                }
+                for partition in summary['partition_list']
+            ],
+            **{k: v for k, v in summary.items() if k != 'partition_list'},
+        }
+        line = json.dumps(summary, indent=2).replace('\n', ' ')
+        expected = QolsysEvent.from_json(line)
+
+        event = self._stream(line, 13).parse(line)
+
+        self.assertEqual(self._describe(expected), self._describe(event))
+
+    def test_unit_not_fed_line_uses_from_json(self):
+        line = json.dumps(get_summary().event)
+
+        parser = QolsysEventInfoSummaryStreamParser()
+        event = parser.parse(line)
+
+        self.assertIsInstance(event, QolsysEventInfoSummary)
+        self.assertEqual(self._describe(QolsysEvent.from_json(line)),
+                         self._describe(event))
+
+    def test_unit_streamed_other_events_use_from_json(self):
+        line = json.dumps({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_UPDATE',
+            'zone': ZONE,
+            'zone_list': [ZONE],
+        })
+
+        event = self._stream(line, 10).parse(line)
+
+        self.assertIsInstance(event, QolsysEventZoneEventUpdate)
+
+    def test_unit_streamed_invalid_json_raises(self):
+        line = json.dumps(get_summary().event)[:-10]
+
+        with self.assertRaises(json.JSONDecodeError):
+            self._stream(line, 10).parse(line)
+
+    def test_unit_parse_resets_the_parser(self):
+        line = json.dumps(get_summary().event)
+        parser = self._stream(line, 100)
+        parser.parse(line)
+
+        self.assertFalse(parser._spans)
+        self.assertFalse(parser._zone_sensors)
+
+        event = parser.parse('{"event": "ARMING", "arming_type": "DISARM", '
+                             '"partition_id": 0, "version": 1}')
+        self.assertIsInstance(event, QolsysEventArming)
+
+
+if __name__ == '__main__':
+    unittest.main()
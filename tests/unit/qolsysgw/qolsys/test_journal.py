@@ -0,0 +1,169 @@
+import json
+import os
+import tempfile
+import unittest
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+
+from qolsys.actions import QolsysActionDisarm
+from qolsys.exceptions import QolsysException
+from qolsys.exceptions import UnknownQolsysEventException
+from qolsys.exceptions import recorded_on
+from qolsys.journal import QolsysJournal
+from qolsys.metrics import QolsysMetrics
+from qolsys.state import QolsysState
+
+
+class TestUnitQolsysJournal(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, 'journal')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _zone_active(self, zone_id, status):
+        return json.dumps({
+            'event': 'ZONE_EVENT',
+            'zone_event_type': 'ZONE_ACTIVE',
+            'version': 1,
+            'zone': {
+                'status': status,
+                'zone_id': zone_id,
+            },
+            'requestID': '<request_id>',
+        })
+
+    def test_unit_records_are_read_back_in_order(self):
+        metrics = QolsysMetrics()
+        journal = QolsysJournal(self.path, metrics=metrics)
+        journal.received('ACK')
+        journal.sent(QolsysActionDisarm(partition_id=0,
+                                        panel_code='1234').redacted)
+        journal.received(self._zone_active(10000, 'Open'))
+        journal.close()
+
+        records = list(QolsysJournal.read(self.path))
+        self.assertEqual(
+            [QolsysJournal.KIND_RECEIVED, QolsysJournal.KIND_SENT,
+             QolsysJournal.KIND_RECEIVED],
+            [r.kind for r in records],
+        )
+        self.assertEqual(b'ACK', records[0].payload)
+        self.assertNotIn(b'1234', records[1].payload)
+        self.assertIn(b'<redacted>', records[1].payload)
+        self.assertEqual(sorted(r.timestamp for r in records),
+                         [r.timestamp for r in records])
+
+        self.assertEqual({'received': 2, 'sent': 1},
+                         metrics.as_dict()['journal_records'])
+
+    def test_unit_segments_are_rotated_and_pruned(self):
+        journal = QolsysJournal(self.path, max_segment_size=256,
+                                max_segments=3)
+        for i in range(50):
+            journal.append(QolsysJournal.KIND_RECEIVED, f'line {i:02d}',
+                           timestamp=1000 + i)
+        journal.close()
+
+        segments = QolsysJournal.segments(self.path)
+        self.assertEqual(3, len(segments))
+        for segment in segments:
+            self.assertLessEqual(os.path.getsize(segment), 256)
+
+        # Only the most recent records are kept, without gaps
+        payloads = [r.payload for r in QolsysJournal.read(self.path)]
+        self.assertEqual(b'line 49', payloads[-1])
+        first = int(payloads[0].split()[1])
+        self.assertEqual([f'line {i:02d}'.encode()
+                          for i in range(first, 50)], payloads)
+
+    def test_unit_read_time_range(self):
+        journal = QolsysJournal(self.path, max_segment_size=1024,
+                                index_interval=64)
+        for i in range(200):
+            journal.append(QolsysJournal.KIND_RECEIVED, f'line {i}',
+                           timestamp=1000 + i)
+        journal.close()
+        self.assertGreater(len(QolsysJournal.segments(self.path)), 1)
+
+        records = list(QolsysJournal.read(self.path, start=1050.5,
+                                          end=1120))
+        self.assertEqual([float(1051 + i) for i in range(70)],
+                         [r.timestamp for r in records])
+
+        self.assertEqual([], list(QolsysJournal.read(self.path,
+                                                     start=2000)))
+
+    def test_unit_read_from_a_timestamp_shared_by_several_records(self):
+        journal = QolsysJournal(self.path, index_interval=1)
+        journal.append(QolsysJournal.KIND_RECEIVED, 'before',
+                       timestamp=1000)
+        for i in range(3):
+            journal.append(QolsysJournal.KIND_RECEIVED, f'line {i}',
+                           timestamp=1001)
+        # The clock going back keeps the timestamp of the last record
+        journal.append(QolsysJournal.KIND_RECEIVED, 'line 3',
+                       timestamp=999)
+        journal.close()
+
+        records = list(QolsysJournal.read(self.path, start=1001))
+        self.assertEqual([f'line {i}'.encode() for i in range(4)],
+                         [r.payload for r in records])
+
+    def test_unit_read_filters_kinds(self):
+        journal = QolsysJournal(self.path)
+        journal.received('ACK')
+        journal.sent('{"action": "INFO"}')
+        journal.close()
+
+        records = list(QolsysJournal.read(
+            self.path, kinds=(QolsysJournal.KIND_SENT, )))
+        self.assertEqual([b'{"action": "INFO"}'],
+                         [r.payload for r in records])
+
+    def test_unit_truncated_record_is_ignored(self):
+        journal = QolsysJournal(self.path)
+        journal.received('first')
+        journal.received('second')
+        journal.close()
+
+        segment = QolsysJournal.segments(self.path)[0]
+        with open(segment, 'r+b') as f:
+            f.truncate(os.path.getsize(segment) - 2)
+
+        with self.assertLogs('qolsys.journal', level='WARNING'):
+            records = list(QolsysJournal.read(self.path))
+        self.assertEqual([b'first'], [r.payload for r in records])
+
+    def test_unit_replay_applies_events_to_state(self):
+        journal = QolsysJournal(self.path)
+        journal.sent('{"action": "INFO"}')
+        journal.received('ACK')
+        journal.received(json.dumps(get_summary(zone_ids=[10000]).event))
+        journal.received(self._zone_active(10000, 'Open'))
+        journal.received('not json')
+        journal.close()
+
+        state = QolsysJournal.replay(self.path)
+        self.assertEqual('Open', state.zone(10000).status)
+
+    def test_unit_replay_records_exceptions_on_replayed_state(self):
+        journal = QolsysJournal(self.path)
+        journal.received(json.dumps({'event': 'unknown'}))
+        journal.close()
+
+        live_state = QolsysState()
+        with recorded_on(live_state):
+            state = QolsysJournal.replay(self.path)
+
+            self.assertIsInstance(state.last_exception,
+                                  UnknownQolsysEventException)
+            self.assertIsNone(live_state.last_exception)
+            self.assertIs(live_state, QolsysException.STATE.get())
+
+
+if __name__ == '__main__':
+    unittest.main()
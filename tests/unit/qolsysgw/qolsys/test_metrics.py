@@ -0,0 +1,189 @@
+import asyncio
+import unittest
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+
+from qolsys.metrics import QolsysMetrics
+from qolsys.metrics import QolsysMetricsServer
+
+
+class TestUnitQolsysMetrics(unittest.TestCase):
+
+    def test_unit_counter_render(self):
+        metrics = QolsysMetrics()
+        counter = metrics.counter('lines', 'Lines read')
+        counter.inc()
+        counter.inc(2)
+
+        self.assertEqual(
+            '# HELP qolsysgw_lines Lines read\n'
+            '# TYPE qolsysgw_lines counter\n'
+            'qolsysgw_lines_total 3\n',
+            metrics.render(),
+        )
+
+    def test_unit_counter_with_labels_render(self):
+        metrics = QolsysMetrics()
+        counter = metrics.counter('failures', 'Failures',
+                                  labelnames=('reason', ))
+        counter.inc(reason='b')
+        counter.inc(reason='a"\n')
+        counter.inc(reason='b')
+
+        self.assertEqual(2, counter.value(reason='b'))
+        self.assertEqual(
+            '# HELP qolsysgw_failures Failures\n'
+            '# TYPE qolsysgw_failures counter\n'
+            'qolsysgw_failures_total{reason="a\\"\\n"} 1\n'
+            'qolsysgw_failures_total{reason="b"} 2\n',
+            metrics.render(),
+        )
+
+    def test_unit_counter_requires_its_labels(self):
+        metrics = QolsysMetrics()
+        counter = metrics.counter('failures', 'Failures',
+                                  labelnames=('reason', ))
+
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+        with self.assertRaises(ValueError):
+            counter.inc(reason='a', other='b')
+
+    def test_unit_gauge_render(self):
+        metrics = QolsysMetrics()
+        metrics.gauge('depth', 'Depth', function=lambda: 4)
+        metrics.gauge('backoff', 'Backoff').set(.5)
+        metrics.gauge('latency', 'Latency', function=lambda: None)
+
+        self.assertEqual(
+            '# HELP qolsysgw_depth Depth\n'
+            '# TYPE qolsysgw_depth gauge\n'
+            'qolsysgw_depth 4\n'
+            '# HELP qolsysgw_backoff Backoff\n'
+            '# TYPE qolsysgw_backoff gauge\n'
+            'qolsysgw_backoff 0.5\n'
+            '# HELP qolsysgw_latency Latency\n'
+            '# TYPE qolsysgw_latency gauge\n',
+            metrics.render(),
+        )
+
+    def test_unit_histogram_render(self):
+        metrics = QolsysMetrics()
+        histogram = metrics.histogram('latency_seconds', 'Latency',
+                                      buckets=(.1, 1))
+        histogram.observe(.05)
+        histogram.observe(.1)
+        histogram.observe(.5)
+        histogram.observe(2)
+
+        self.assertEqual(
+            '# HELP qolsysgw_latency_seconds Latency\n'
+            '# TYPE qolsysgw_latency_seconds histogram\n'
+            'qolsysgw_latency_seconds_bucket{le="0.1"} 2\n'
+            'qolsysgw_latency_seconds_bucket{le="1"} 3\n'
+            'qolsysgw_latency_seconds_bucket{le="+Inf"} 4\n'
+            'qolsysgw_latency_seconds_sum 2.65\n'
+            'qolsysgw_latency_seconds_count 4\n',
+            metrics.render(),
+        )
+
+    def test_unit_scoped_metrics_render(self):
+        metrics = QolsysMetrics()
+        for panel, depth in (('site1', 1), ('site2', 2)):
+            scope = metrics.scoped(panel=panel)
+            scope.counter('failures', 'Failures',
+                          labelnames=('reason', )).inc(reason='a')
+            scope.gauge('depth', 'Depth', function=lambda d=depth: d)
+
+        self.assertEqual(
+            '# HELP qolsysgw_failures Failures\n'
+            '# TYPE qolsysgw_failures counter\n'
+            'qolsysgw_failures_total{panel="site1",reason="a"} 1\n'
+            'qolsysgw_failures_total{panel="site2",reason="a"} 1\n'
+            '# HELP qolsysgw_depth Depth\n'
+            '# TYPE qolsysgw_depth gauge\n'
+            'qolsysgw_depth{panel="site1"} 1\n'
+            'qolsysgw_depth{panel="site2"} 2\n',
+            metrics.render(),
+        )
+        self.assertDictEqual(
+            {
+                'failures': {'site1/a': 1, 'site2/a': 1},
+                'depth': {'site1': 1, 'site2': 2},
+            },
+            metrics.as_dict(),
+        )
+
+    def test_unit_register_returns_existing_metric(self):
+        metrics = QolsysMetrics()
+        counter = metrics.counter('lines', 'Lines read')
+
+        self.assertIs(counter, metrics.counter('lines', 'Lines read'))
+
+        with self.assertRaises(ValueError):
+            metrics.gauge('lines', 'Lines read')
+
+    def test_unit_as_dict(self):
+        metrics = QolsysMetrics()
+        metrics.counter('lines', 'Lines read').inc(3)
+        metrics.counter('failures', 'Failures',
+                        labelnames=('reason', )).inc(reason='a')
+        metrics.gauge('depth', 'Depth', function=lambda: 4)
+        metrics.histogram('latency_seconds', 'Latency').observe(2)
+
+        self.assertDictEqual(
+            {
+                'lines': 3,
+                'failures': {'a': 1},
+                'depth': 4,
+                'latency_seconds': {'count': 1, 'sum': 2, 'avg': 2},
+            },
+            metrics.as_dict(),
+        )
+
+
+class TestUnitQolsysMetricsServer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.metrics = QolsysMetrics()
+        self.metrics.counter('lines', 'Lines read').inc(3)
+
+        self.server = QolsysMetricsServer(metrics=self.metrics, port=0)
+        await self.server.start()
+
+    async def asyncTearDown(self):
+        await self.server.stop()
+
+    async def _get(self, path):
+        reader, writer = await asyncio.open_connection(
+            '127.0.0.1', self.server.port)
+        writer.write(f'GET {path} HTTP/1.1\r\n'
+                     'Host: localhost\r\n'
+                     '\r\n'.encode())
+        await writer.drain()
+
+        response = await reader.read()
+        writer.close()
+
+        head, body = response.decode().split('\r\n\r\n', 1)
+        return head.split('\r\n'), body
+
+    async def test_unit_scrape_metrics(self):
+        head, body = await self._get('/metrics')
+
+        self.assertEqual('HTTP/1.1 200 OK', head[0])
+        self.assertIn('Content-Type: text/plain; version=0.0.4; '
+                      'charset=utf-8', head)
+        self.assertEqual(self.metrics.render(), body)
+        self.assertIn('qolsysgw_lines_total 3\n', body)
+
+    async def test_unit_scrape_unknown_path(self):
+        head, body = await self._get('/unknown')
+
+        self.assertEqual('HTTP/1.1 404 Not Found', head[0])
+        self.assertEqual('', body)
+
+
+if __name__ == '__main__':
+    unittest.main()
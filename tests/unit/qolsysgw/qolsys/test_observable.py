@@ -0,0 +1,165 @@
+import logging
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+
+from qolsys.observable import QolsysObservable
+from qolsys.sensors import QolsysSensor
+from qolsys.sensors import QolsysSensorDoorWindow
+
+
+class TestUnitQolsysObservable(unittest.TestCase):
+
+    def _observed(self):
+        observable = QolsysObservable()
+        observer = mock.Mock()
+        observable.register(observer, callback=observer.callback)
+        return observable, observer
+
+    def test_unit_notify_calls_observers(self):
+        observable, observer = self._observed()
+
+        observable.notify(change='a', new_value=1)
+
+        observer.callback.assert_called_once_with(
+            observable, change='a', new_value=1)
+
+    def test_unit_notify_without_observers(self):
+        observable = QolsysObservable()
+        observable.notify(change='a')
+
+        observer = mock.Mock()
+        observable.register(observer, callback=observer.callback)
+        observable.unregister(observer)
+        observable.notify(change='a')
+
+        observer.callback.assert_not_called()
+
+    def test_unit_batch_sends_single_notification(self):
+        observable, observer = self._observed()
+
+        with observable.batch():
+            observable.notify(change='a', new_value=1)
+            observable.notify(change='b', new_value=2)
+
+            observer.callback.assert_not_called()
+
+        observer.callback.assert_called_once_with(
+            observable,
+            change=QolsysObservable.NOTIFY_BATCH,
+            changes=[
+                {'change': 'a', 'new_value': 1},
+                {'change': 'b', 'new_value': 2},
+            ],
+        )
+
+    def test_unit_batch_of_one_sends_the_notification(self):
+        observable, observer = self._observed()
+
+        with observable.batch():
+            observable.notify(change='a', new_value=1)
+
+        observer.callback.assert_called_once_with(
+            observable, change='a', new_value=1)
+
+    def test_unit_empty_batch_does_not_notify(self):
+        observable, observer = self._observed()
+
+        with observable.batch():
+            pass
+
+        observer.callback.assert_not_called()
+
+    def test_unit_nested_batches_notify_once(self):
+        observable, observer = self._observed()
+
+        with observable.batch():
+            observable.notify(change='a')
+            with observable.batch():
+                observable.notify(change='b')
+            observable.notify(change='c')
+
+        observer.callback.assert_called_once_with(
+            observable,
+            change=QolsysObservable.NOTIFY_BATCH,
+            changes=[{'change': 'a'}, {'change': 'b'}, {'change': 'c'}],
+        )
+
+    def test_unit_notify_does_not_format_when_not_debugging(self):
+        observable, observer = self._observed()
+
+        with mock.patch('qolsys.observable.LOGGER') as logger, \
+                mock.patch.object(QolsysObservable, '__str__') as to_str:
+            logger.isEnabledFor.return_value = False
+            observable.notify(change='a')
+
+            logger.isEnabledFor.assert_called_with(logging.DEBUG)
+            logger.debug.assert_not_called()
+            to_str.assert_not_called()
+
+
+class TestUnitQolsysSensorNotifications(unittest.TestCase):
+
+    ZONE = {
+        'id': '001-0000',
+        'type': 'Door_Window',
+        'name': 'My Door',
+        'group': 'entryexitdelay',
+        'status': 'Closed',
+        'state': '0',
+        'zone_id': 10000,
+        'zone_physical_type': 1,
+        'zone_alarm_type': 3,
+        'zone_type': 1,
+        'partition_id': 0,
+    }
+
+    def test_unit_update_sends_single_notification(self):
+        sensor = QolsysSensor.from_json(self.ZONE, None)
+        observer = mock.Mock()
+        sensor.register(observer, callback=observer.callback)
+
+        sensor.update(QolsysSensor.from_json({
+            **self.ZONE,
+            'status': 'Open',
+            'group': 'instantperimeter',
+            'zone_type': 2,
+        }, None))
+
+        observer.callback.assert_called_once_with(
+            sensor,
+            change=QolsysSensor.NOTIFY_BATCH,
+            changes=[
+                {'change': QolsysSensor.NOTIFY_UPDATE_STATUS,
+                 'prev_value': 'Closed', 'new_value': 'Open'},
+                {'change': 'update_group',
+                 'prev_value': 'entryexitdelay',
+                 'new_value': 'instantperimeter'},
+                {'change': 'update_zone_type',
+                 'prev_value': 1, 'new_value': 2},
+                {'change': QolsysSensor.NOTIFY_UPDATE_ATTRIBUTES},
+            ],
+        )
+
+    def test_unit_tampered_sends_single_notification(self):
+        sensor = QolsysSensorDoorWindow.from_json(self.ZONE, None)
+        observer = mock.Mock()
+        sensor.register(observer, callback=observer.callback)
+
+        sensor.tampered = True
+
+        observer.callback.assert_called_once_with(
+            sensor,
+            change=QolsysSensor.NOTIFY_BATCH,
+            changes=[
+                {'change': QolsysSensor.NOTIFY_UPDATE_TAMPERED,
+                 'prev_value': False, 'new_value': True},
+                {'change': QolsysSensor.NOTIFY_UPDATE_ATTRIBUTES},
+            ],
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+import json
+import os
+import tempfile
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+
+from qolsys.events import QolsysEvent
+from qolsys.exceptions import QolsysException
+from qolsys.exceptions import UnableToParseEventException
+from qolsys.exceptions import recorded_on
+from qolsys.metrics import QolsysMetrics
+from qolsys.partition import QolsysPartition
+from qolsys.snapshot import QolsysStateSnapshot
+from qolsys.state import QolsysState
+
+
+class TestUnitQolsysStateSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._tmpdir.name, 'panel', 'state.json')
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _state(self):
+        state = QolsysState(QolsysEvent.from_json(
+            get_summary(partition_ids=[0, 1]).event))
+
+        partition = state.partition(0)
+        partition.triggered(alarm_type='POLICE')
+        partition.errored(error_type='DISARM_FAILED',
+                          error_description='Invalid usercode')
+
+        # Reporting open while already open is a tamper
+        state.zone(10001).open()
+        self.assertTrue(state.zone(10001).tampered)
+
+        return state
+
+    def test_unit_snapshot_restores_the_state(self):
+        state = self._state()
+        metrics = QolsysMetrics()
+        self.assertTrue(QolsysStateSnapshot(self.path, state,
+                                            metrics=metrics).save())
+        self.assertEqual(1, metrics.as_dict()['state_snapshot_saves'])
+
+        restored = QolsysState()
+        observer = mock.Mock()
+        restored.register(observer, callback=observer.state)
+
+        saved_at = QolsysStateSnapshot(self.path, restored).load()
+        self.assertIsNotNone(saved_at)
+        self.assertEqual(state.to_dict(), restored.to_dict())
+
+        partition = restored.partition(0)
+        self.assertEqual('ALARM', partition.status)
+        self.assertEqual('POLICE', partition.alarm_type)
+        self.assertEqual('DISARM_FAILED', partition.last_error_type)
+        self.assertEqual(1, partition.disarm_failed)
+        self.assertTrue(restored.zone(10001).tampered)
+        self.assertEqual(len(state.partitions), observer.state.call_count)
+
+    def test_unit_live_summary_reconciles_restored_state(self):
+        QolsysStateSnapshot(self.path, self._state()).save()
+
+        restored = QolsysState()
+        QolsysStateSnapshot(self.path, restored).load()
+
+        observer = mock.Mock()
+        for partition in restored.partitions:
+            partition.register(observer, callback=observer.partition)
+
+        restored.update(QolsysEvent.from_json(
+            get_summary(partition_ids=[0, 1]).event))
+
+        self.assertEqual('DISARM', restored.partition(0).status)
+        observer.partition.assert_any_call(
+            restored.partition(0),
+            change=QolsysPartition.NOTIFY_UPDATE_STATUS,
+            prev_value='ALARM', new_value='DISARM',
+        )
+        # The partition that did not change is not notified
+        self.assertNotIn(restored.partition(1),
+                         [c.args[0] for c in observer.partition.call_args_list])
+
+    def test_unit_save_only_when_changed(self):
+        state = self._state()
+        snapshot = QolsysStateSnapshot(self.path, state)
+
+        self.assertTrue(snapshot.save())
+        self.assertFalse(snapshot.save())
+
+        state.zone(10000).open()
+        self.assertTrue(snapshot.save())
+
+    def test_unit_empty_state_is_not_saved(self):
+        self.assertFalse(QolsysStateSnapshot(self.path, QolsysState()).save())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_unit_missing_snapshot(self):
+        self.assertIsNone(QolsysStateSnapshot(self.path, QolsysState()).load())
+
+    def test_unit_invalid_snapshot_is_ignored(self):
+        os.makedirs(os.path.dirname(self.path))
+        for content in ('not json', json.dumps({'version': 0, 'state': {}})):
+            with open(self.path, 'w') as f:
+                f.write(content)
+
+            state = QolsysState()
+            with self.assertLogs('qolsys.snapshot'):
+                self.assertIsNone(QolsysStateSnapshot(self.path, state).load())
+            self.assertEqual([], list(state.partitions))
+
+    def test_unit_corrupt_snapshot_restores_nothing(self):
+        QolsysStateSnapshot(self.path, self._state()).save()
+
+        # The partitions are parsed, but restoring the attributes of the
+        # second one fails once the first one was restored
+        with open(self.path) as f:
+            data = json.load(f)
+        data['state']['partition_list'][1]['disarm_failed'] = 'invalid'
+        with open(self.path, 'w') as f:
+            json.dump(data, f)
+
+        state = QolsysState()
+        observer = mock.Mock()
+        state.register(observer, callback=observer.state)
+
+        with self.assertLogs('qolsys.snapshot'):
+            self.assertIsNone(QolsysStateSnapshot(self.path, state).load())
+        self.assertEqual([], list(state.partitions))
+        observer.state.assert_not_called()
+
+    def test_unit_load_keeps_exceptions_recorded_on_the_state(self):
+        QolsysStateSnapshot(self.path, self._state()).save()
+
+        state = QolsysState()
+        with recorded_on(state):
+            self.assertIsNotNone(QolsysStateSnapshot(self.path, state).load())
+            self.assertIs(state, QolsysException.STATE.get())
+
+            exception = UnableToParseEventException('after load')
+        self.assertIs(exception, state.last_exception)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os.path
+import ssl
+import unittest
+
+from unittest import mock
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+from testutils.mock_panel import CERTS_DIR
+
+from qolsys.exceptions import QolsysIdleTimeoutException
+from qolsys.exceptions import QolsysLineTooLongException
+from qolsys.events import QolsysEventInfoSummary
+from qolsys.metrics import QolsysMetrics
+from qolsys.socket import QolsysLineReader
+from qolsys.socket import QolsysSocket
+
+
+class TestUnitQolsysLineReader(unittest.IsolatedAsyncioTestCase):
+
+    def _reader(self, *chunks):
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+        return reader
+
+    async def _readlines(self, line_reader):
+        lines = []
+        while (line := await line_reader.readline()) is not None:
+            lines.append(line)
+        return lines
+
+    async def test_unit_reads_lines(self):
+        line_reader = QolsysLineReader(
+            self._reader(b'first\nsec', b'ond\n\nth', b'ird'),
+            chunk_size=4,
+        )
+
+        self.assertEqual(['first', 'second', '', 'third'],
+                         await self._readlines(line_reader))
+
+    async def test_unit_reads_lines_longer_than_streamreader_limit(self):
+        line = 'x' * (1024 * 1024)
+        line_reader = QolsysLineReader(
+            self._reader(f'{line}\nACK\n'.encode()))
+
+        self.assertEqual([line, 'ACK'], await self._readlines(line_reader))
+
+    async def test_unit_decodes_characters_split_between_chunks(self):
+        data = 'Porte d’entrée\n'.encode()
+        line_reader = QolsysLineReader(
+            self._reader(*[data[i:i + 1] for i in range(len(data))]),
+            chunk_size=1,
+        )
+
+        self.assertEqual(['Porte d’entrée'],
+                         await self._readlines(line_reader))
+
+    async def test_unit_skips_lines_longer_than_max_line_size(self):
+        line_reader = QolsysLineReader(
+            self._reader(b'short\n', b'x' * 100, b'x' * 100, b'\nafter\n'),
+            max_line_size=50,
+            chunk_size=16,
+        )
+
+        self.assertEqual('short', await line_reader.readline())
+        with self.assertRaisesRegex(QolsysLineTooLongException,
+                                    'Skipped line of 200 bytes'):
+            await line_reader.readline()
+        self.assertEqual('after', await line_reader.readline())
+        self.assertIsNone(await line_reader.readline())
+
+    async def test_unit_feeds_long_lines_to_stream_parser(self):
+        stream_parser = mock.Mock()
+        line_reader = QolsysLineReader(
+            self._reader(b'short\n', b'long' * 8, b'line\nshort\n'),
+            chunk_size=8,
+            stream_parser=stream_parser,
+            stream_threshold=16,
+        )
+
+        self.assertEqual('short', await line_reader.readline())
+        self.assertEqual([mock.call.reset()], stream_parser.mock_calls)
+        stream_parser.reset_mock()
+
+        self.assertEqual('long' * 8 + 'line', await line_reader.readline())
+        fed = b''.join(c.args[0] for c in stream_parser.feed.call_args_list)
+        self.assertEqual(('long' * 8 + 'line').encode(), fed)
+        self.assertEqual({'final': True},
+                         stream_parser.feed.call_args_list[-1].kwargs)
+        stream_parser.reset.assert_not_called()
+        stream_parser.reset_mock()
+
+        self.assertEqual('short', await line_reader.readline())
+        self.assertEqual([mock.call.reset()], stream_parser.mock_calls)
+
+    async def test_unit_raises_after_idle_timeout(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(b'first\n')
+        line_reader = QolsysLineReader(reader, idle_timeout=0.05)
+
+        self.assertEqual('first', await line_reader.readline())
+        last_read_at = line_reader.last_read_at
+
+        with self.assertRaisesRegex(QolsysIdleTimeoutException,
+                                    'Nothing received for 0.05 seconds'):
+            await line_reader.readline()
+        self.assertEqual(last_read_at, line_reader.last_read_at)
+
+        reader.feed_data(b'second\n')
+        self.assertEqual('second', await line_reader.readline())
+        self.assertGreater(line_reader.last_read_at, last_read_at)
+
+
+class TestUnitQolsysSocket(unittest.IsolatedAsyncioTestCase):
+
+    async def _start_panel(self, close_after):
+        """
+        Start a TLS server that answers the INFO request with the summary,
+        and closes the connection after `close_after` connections
+        """
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(
+            os.path.join(CERTS_DIR, 'mock-panel-server.crt'),
+            os.path.join(CERTS_DIR, 'mock-panel-server.key'),
+        )
+
+        self.connections = 0
+        summary = json.dumps(get_summary().event).encode()
+
+        async def serve(reader, writer):
+            self.connections += 1
+            await reader.read(4096)
+            writer.write(b'ACK\n' + summary + b'\n')
+            await writer.drain()
+            if self.connections < close_after:
+                writer.close()
+            else:
+                await reader.read()
+
+        server = await asyncio.start_server(serve, 'localhost', 0,
+                                            ssl=context)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        return server.sockets[0].getsockname()[1]
+
+    async def test_unit_reconnects_resuming_tls_session(self):
+        port = await self._start_panel(close_after=3)
+
+        summaries = []
+        resynced = asyncio.Event()
+
+        async def callback(event):
+            if isinstance(event, QolsysEventInfoSummary):
+                summaries.append(event)
+                if len(summaries) == 3:
+                    resynced.set()
+
+        metrics = QolsysMetrics(prefix=None)
+        qolsys_socket = QolsysSocket(hostname='localhost', port=port,
+                                     callback=callback, metrics=metrics)
+        listen = asyncio.create_task(qolsys_socket.listen())
+        try:
+            await asyncio.wait_for(resynced.wait(), timeout=5)
+        finally:
+            listen.cancel()
+            await asyncio.gather(listen, return_exceptions=True)
+
+        metrics = metrics.as_dict()
+        self.assertEqual(3, metrics['panel_connections'])
+        self.assertEqual(1, metrics['panel_dns_resolutions'])
+        self.assertEqual(2, metrics['panel_tls_sessions_resumed'])
+        self.assertEqual(3, metrics['panel_resync_seconds']['count'])
+        # The connection worked, so the reconnections are immediate
+        self.assertEqual(0, metrics['panel_reconnect_backoff_seconds'])
+
+    def test_unit_idle_timeout_is_off_by_default(self):
+        # A quiet panel that does not answer the keep-alives must not get
+        # its connection reset
+        qolsys_socket = QolsysSocket(hostname='localhost', keep_alive=30)
+        self.assertIsNone(qolsys_socket._idle_timeout)
+
+        qolsys_socket = QolsysSocket(hostname='localhost', idle_timeout=90)
+        self.assertEqual(90, qolsys_socket._idle_timeout)
+
+    def test_unit_backoff_is_jittered_and_capped(self):
+        qolsys_socket = QolsysSocket(hostname='localhost')
+
+        for attempts, (low, high) in ((1, (.5, 1)), (3, (2, 4)),
+                                      (20, (30, 60))):
+            qolsys_socket._reconnect_attempts = attempts
+            delays = {qolsys_socket._backoff() for _ in range(20)}
+
+            self.assertGreater(len(delays), 1)
+            for delay in delays:
+                self.assertGreaterEqual(delay, low)
+                self.assertLessEqual(delay, high)
+
+
+if __name__ == '__main__':
+    unittest.main()
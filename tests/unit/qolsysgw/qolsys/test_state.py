@@ -0,0 +1,311 @@
+import unittest
+
+from copy import deepcopy
+from unittest import mock
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+from testutils.fixtures_data import get_summary
+
+from qolsys.events import QolsysEvent
+from qolsys.partition import QolsysPartition
+from qolsys.sensors import QolsysSensor
+from qolsys.sensors import QolsysSensorMotion
+from qolsys.state import QolsysState
+
+
+class TestUnitQolsysStateUpdate(unittest.TestCase):
+
+    def _summary(self, modifier=None, **kwargs):
+        event = deepcopy(get_summary(**kwargs).event)
+        if modifier:
+            modifier(event)
+        return QolsysEvent.from_json(event)
+
+    def _observed_state(self, **kwargs):
+        state = QolsysState(self._summary(**kwargs))
+
+        observer = mock.Mock()
+        state.register(observer, callback=observer.state)
+        for partition in state.partitions:
+            partition.register(observer, callback=observer.partition)
+            for sensor in partition.sensors:
+                sensor.register(observer, callback=observer.sensor)
+
+        return state, observer
+
+    def test_unit_first_update_adds_partitions(self):
+        state = QolsysState()
+        observer = mock.Mock()
+        state.register(observer, callback=observer.state)
+
+        state.update(self._summary())
+
+        self.assertEqual(2, len(state.partitions))
+        observer.state.assert_has_calls([
+            mock.call(state, change=QolsysState.NOTIFY_ADD_PARTITION,
+                      new_value=state.partition(0)),
+            mock.call(state, change=QolsysState.NOTIFY_ADD_PARTITION,
+                      new_value=state.partition(1)),
+        ])
+
+    def test_unit_same_summary_does_not_notify(self):
+        state, observer = self._observed_state()
+        partition0 = state.partition(0)
+        sensor = partition0.zone(10000)
+
+        state.update(self._summary())
+
+        self.assertEqual([], observer.mock_calls)
+
+        # The objects we already knew of are kept
+        self.assertIs(partition0, state.partition(0))
+        self.assertIs(sensor, state.partition(0).zone(10000))
+
+    def test_unit_changed_sensor_status_notifies_sensor_only(self):
+        state, observer = self._observed_state()
+        sensor = state.partition(0).zone(10000)
+
+        def modifier(event):
+            event['partition_list'][0]['zone_list'][0]['status'] = 'Open'
+
+        state.update(self._summary(modifier))
+
+        self.assertEqual('Open', sensor.status)
+        self.assertEqual(
+            [mock.call.sensor(sensor, change=QolsysSensor.NOTIFY_UPDATE_STATUS,
+                              prev_value='Closed', new_value='Open')],
+            observer.mock_calls,
+        )
+
+    def test_unit_changed_partition_status_notifies_partition(self):
+        state, observer = self._observed_state()
+        partition = state.partition(1)
+
+        state.update(self._summary(partition_status={1: 'ARM_AWAY'}))
+
+        self.assertEqual('ARM_AWAY', partition.status)
+        observer.partition.assert_called_once_with(
+            partition, change=QolsysPartition.NOTIFY_UPDATE_STATUS,
+            prev_value='DISARM', new_value='ARM_AWAY')
+        observer.state.assert_not_called()
+        observer.sensor.assert_not_called()
+
+    def test_unit_removed_zone_notifies_removal(self):
+        state, observer = self._observed_state()
+        sensor = state.partition(0).zone(10000)
+
+        def modifier(event):
+            del event['partition_list'][0]['zone_list'][0]
+
+        state.update(self._summary(modifier))
+
+        self.assertIsNone(state.partition(0).zone(10000))
+        self.assertEqual(
+            [mock.call.partition(state.partition(0),
+                                 change=QolsysPartition.NOTIFY_REMOVE_SENSOR,
+                                 prev_value=sensor)],
+            observer.mock_calls,
+        )
+
+    def test_unit_added_zone_notifies_addition(self):
+        state, observer = self._observed_state(zone_ids=[10000])
+
+        state.update(self._summary(zone_ids=[10000, 10001]))
+
+        sensor = state.partition(0).zone(10001)
+        self.assertIsNotNone(sensor)
+        self.assertIs(state.partition(0), sensor.partition)
+        self.assertEqual(
+            [mock.call.partition(state.partition(0),
+                                 change=QolsysPartition.NOTIFY_ADD_SENSOR,
+                                 new_value=sensor)],
+            observer.mock_calls,
+        )
+
+    def test_unit_zone_moved_between_partitions(self):
+        state, observer = self._observed_state()
+        sensor = state.partition(0).zone(10000)
+
+        def modifier(event):
+            zone = event['partition_list'][0]['zone_list'].pop(0)
+            zone['partition_id'] = 1
+            event['partition_list'][1]['zone_list'].append(zone)
+
+        state.update(self._summary(modifier))
+
+        self.assertIsNone(state.partition(0).zone(10000))
+        moved = state.partition(1).zone(10000)
+        self.assertIsNotNone(moved)
+        self.assertIs(state.partition(1), moved.partition)
+        self.assertEqual(
+            [
+                mock.call.partition(state.partition(0),
+                                    change=QolsysPartition.NOTIFY_REMOVE_SENSOR,
+                                    prev_value=sensor),
+                mock.call.partition(state.partition(1),
+                                    change=QolsysPartition.NOTIFY_ADD_SENSOR,
+                                    new_value=moved),
+            ],
+            observer.mock_calls,
+        )
+
+    def test_unit_zone_with_different_sensor_is_replaced(self):
+        state, observer = self._observed_state()
+        sensor = state.partition(0).zone(10000)
+
+        def modifier(event):
+            event['partition_list'][0]['zone_list'][0]['type'] = 'Motion'
+
+        state.update(self._summary(modifier))
+
+        replaced = state.partition(0).zone(10000)
+        self.assertIsInstance(replaced, QolsysSensorMotion)
+        self.assertEqual(
+            [
+                mock.call.partition(state.partition(0),
+                                    change=QolsysPartition.NOTIFY_REMOVE_SENSOR,
+                                    prev_value=sensor),
+                mock.call.partition(state.partition(0),
+                                    change=QolsysPartition.NOTIFY_ADD_SENSOR,
+                                    new_value=replaced),
+            ],
+            observer.mock_calls,
+        )
+
+    def test_unit_removed_partition_notifies_removal(self):
+        state, observer = self._observed_state()
+        partition1 = state.partition(1)
+
+        state.update(self._summary(partition_ids=[0]))
+
+        self.assertIsNone(state.partition(1))
+        self.assertEqual(
+            [mock.call.state(state, change=QolsysState.NOTIFY_REMOVE_PARTITION,
+                             prev_value=partition1)],
+            observer.mock_calls,
+        )
+
+
+class TestUnitQolsysStateIndexes(unittest.TestCase):
+
+    def _summary(self, modifier=None, **kwargs):
+        event = deepcopy(get_summary(**kwargs).event)
+        if modifier:
+            modifier(event)
+        return QolsysEvent.from_json(event)
+
+    def _zone_sensor(self, from_zone_id, **kwargs):
+        for partition in get_summary().event['partition_list']:
+            for zone in partition['zone_list']:
+                if zone['zone_id'] == from_zone_id:
+                    return QolsysSensor.from_json({**zone, **kwargs}, None)
+
+    def test_unit_indexes_summary(self):
+        state = QolsysState(self._summary())
+
+        self.assertIs(state.partition(0).zone(10000), state.zone(10000))
+        self.assertIs(state.partition(1), state.zone_partition(20000))
+        self.assertIs(state.partition(0).zone(10000), state.sensor('001-0000'))
+        self.assertIsNone(state.zone(99999))
+        self.assertIsNone(state.zone_partition(99999))
+        self.assertIsNone(state.sensor('999-9999'))
+
+    def test_unit_sensor_returns_first_sensor_with_id(self):
+        state = QolsysState(self._summary())
+
+        # Both zones 20080 and 200802 use the sensor id 002-0080
+        self.assertEqual(20080, state.sensor('002-0080').zone_id)
+        self.assertEqual(20080, state.partition(1).sensor('002-0080').zone_id)
+        self.assertEqual('002-0080', state.zone(20080).unique_id)
+        self.assertEqual('002-0080_200802', state.zone(200802).unique_id)
+
+        state.partition(1).remove_zone(20080)
+
+        self.assertEqual(200802, state.sensor('002-0080').zone_id)
+        self.assertEqual(200802, state.partition(1).sensor('002-0080').zone_id)
+        self.assertEqual('002-0080', state.zone(200802).unique_id)
+
+    def test_unit_indexes_follow_summary_changes(self):
+        state = QolsysState(self._summary())
+
+        def modifier(event):
+            # Remove zone 10000, and move zone 10001 to partition 1
+            zone_list = event['partition_list'][0]['zone_list']
+            del zone_list[0]
+            zone = zone_list.pop(0)
+            zone['partition_id'] = 1
+            event['partition_list'][1]['zone_list'].append(zone)
+
+        state.update(self._summary(modifier))
+
+        self.assertIsNone(state.zone(10000))
+        self.assertIsNone(state.zone_partition(10000))
+        self.assertIsNone(state.sensor('001-0000'))
+
+        self.assertIs(state.partition(1).zone(10001), state.zone(10001))
+        self.assertIs(state.partition(1), state.zone_partition(10001))
+        self.assertIs(state.partition(1).zone(10001), state.sensor('001-0001'))
+
+    def test_unit_indexes_follow_removed_partition(self):
+        state = QolsysState(self._summary())
+        partition1 = state.partition(1)
+
+        state.update(self._summary(partition_ids=[0]))
+
+        self.assertIsNone(state.zone(20000))
+        self.assertIsNone(state.zone_partition(20000))
+        self.assertIsNone(state.sensor('002-0000'))
+
+        # Changes on the removed partition do not affect the state anymore
+        partition1.add_sensor(self._zone_sensor(10000, zone_id=30000))
+        self.assertIsNone(state.zone(30000))
+
+    def test_unit_indexes_follow_zone_add(self):
+        state = QolsysState(self._summary(zone_ids=[10000]))
+
+        sensor = self._zone_sensor(10001)
+        state.zone_add(sensor)
+
+        self.assertIs(sensor, state.zone(10001))
+        self.assertIs(state.partition(0), state.zone_partition(10001))
+        self.assertIs(sensor, state.sensor('001-0001'))
+
+    def test_unit_indexes_follow_zone_update_to_other_partition(self):
+        state = QolsysState(self._summary())
+
+        sensor = self._zone_sensor(10000, partition_id=1)
+        state.zone_update(sensor)
+
+        self.assertIsNone(state.partition(0).zone(10000))
+        self.assertIs(sensor, state.zone(10000))
+        self.assertIs(state.partition(1), state.zone_partition(10000))
+        self.assertIs(sensor, state.sensor('001-0000'))
+
+    def test_unit_indexes_follow_zone_update_of_sensor_id(self):
+        state = QolsysState(self._summary())
+        sensor = state.zone(10000)
+
+        state.zone_update(self._zone_sensor(10000, id='001-9999'))
+
+        self.assertIs(sensor, state.zone(10000))
+        self.assertEqual('001-9999', sensor.id)
+        self.assertIsNone(state.sensor('001-0000'))
+        self.assertIsNone(state.partition(0).sensor('001-0000'))
+        self.assertIs(sensor, state.sensor('001-9999'))
+        self.assertIs(sensor, state.partition(0).sensor('001-9999'))
+
+    def test_unit_zone_open_and_closed_use_index(self):
+        state = QolsysState(self._summary())
+
+        state.zone_open(20000)
+        self.assertEqual('Open', state.zone(20000).status)
+
+        state.zone_closed(20000)
+        self.assertEqual('Closed', state.zone(20000).status)
+
+        # Unknown zones are ignored
+        state.zone_open(99999)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+import asyncio
+import unittest
+
+import tests.unit.qolsysgw.qolsys.testenv  # noqa: F401
+
+from qolsys.actions import QolsysActionArmAway
+from qolsys.actions import QolsysActionDisarm
+from qolsys.actions import QolsysActionInfo
+from qolsys.events import QolsysEvent
+from qolsys.metrics import QolsysMetrics
+from qolsys.tracker import QolsysActionTracker
+
+
+class TestUnitQolsysActionTracker(unittest.IsolatedAsyncioTestCase):
+
+    def _tracker(self, **kwargs):
+        self.written = []
+        self.metrics = QolsysMetrics(prefix=None)
+
+        async def write(action, on_written):
+            self.written.append(action)
+            on_written()
+
+        return QolsysActionTracker(write=write, metrics=self.metrics,
+                                   **kwargs)
+
+    def _arming(self, partition_id=0, arming_type='DISARM'):
+        return QolsysEvent.from_json({
+            'event': 'ARMING',
+            'arming_type': arming_type,
+            'partition_id': partition_id,
+            'version': 1,
+            'requestID': '<request_id>',
+        })
+
+    def _error(self, partition_id=0):
+        return QolsysEvent.from_json({
+            'event': 'ERROR',
+            'error_type': 'usercode',
+            'description': 'Please Enable Six Digit User Code',
+            'partition_id': partition_id,
+            'nonce': 'qolsys',
+            'version': 1,
+            'requestID': '<request_id>',
+        })
+
+    async def test_unit_action_completed_by_ack_then_event(self):
+        tracker = self._tracker()
+
+        inflight = await tracker.send(QolsysActionDisarm(partition_id=0))
+        self.assertEqual([inflight.action], self.written)
+        self.assertEqual(1, self.metrics.as_dict()['panel_actions_inflight'])
+
+        self.assertIs(inflight, tracker.ack())
+        self.assertFalse(inflight.done.done())
+
+        self.assertIs(inflight, tracker.event(self._arming()))
+        self.assertTrue(inflight.done.done())
+        self.assertEqual('completed', inflight.result)
+        self.assertEqual([], tracker.inflight)
+
+        metrics = self.metrics.as_dict()
+        self.assertEqual({'DISARM/completed': 1}, metrics['panel_actions'])
+        self.assertEqual(1, metrics['panel_action_ack_latency_seconds']
+                                   ['DISARM']['count'])
+        self.assertEqual(1, metrics['panel_action_latency_seconds']
+                                   ['DISARM']['count'])
+        self.assertEqual(0, metrics['panel_actions_inflight'])
+
+    async def test_unit_event_before_ack_waits_for_ack(self):
+        tracker = self._tracker()
+
+        inflight = await tracker.send(QolsysActionDisarm(partition_id=0))
+        tracker.event(self._arming())
+        self.assertFalse(inflight.done.done())
+
+        tracker.ack()
+        self.assertTrue(inflight.done.done())
+        self.assertEqual('completed', inflight.result)
+
+    async def test_unit_acks_are_matched_in_order(self):
+        tracker = self._tracker()
+
+        first = await tracker.send(QolsysActionInfo())
+        second = await tracker.send(QolsysActionDisarm(partition_id=0))
+
+        self.assertIs(first, tracker.ack())
+        self.assertIs(second, tracker.ack())
+        self.assertIsNone(tracker.ack())
+
+    async def test_unit_acks_are_matched_in_written_order(self):
+        pending = []
+
+        async def write(action, on_written):
+            pending.append(on_written)
+
+        tracker = QolsysActionTracker(write=write)
+
+        first = await tracker.send(QolsysActionInfo())
+        second = await tracker.send(QolsysActionDisarm(partition_id=0))
+        self.assertIsNone(tracker.ack())
+
+        # The second action was written first, e.g. as it has priority
+        pending[1]()
+        pending[0]()
+
+        self.assertIs(second, tracker.ack())
+        self.assertIs(first, tracker.ack())
+
+    async def test_unit_acks_of_untracked_writes_are_skipped(self):
+        tracker = self._tracker()
+
+        first = await tracker.send(QolsysActionInfo())
+        tracker.untracked_written()
+        second = await tracker.send(QolsysActionDisarm(partition_id=0))
+
+        self.assertIs(first, tracker.ack())
+        self.assertIsNone(tracker.ack())
+        self.assertIs(second, tracker.ack())
+
+    async def test_unit_events_are_matched_by_partition(self):
+        tracker = self._tracker()
+
+        part0 = await tracker.send(QolsysActionArmAway(partition_id=0))
+        part1 = await tracker.send(QolsysActionDisarm(partition_id=1))
+        tracker.ack()
+        tracker.ack()
+
+        self.assertIs(part1, tracker.event(self._arming(partition_id=1)))
+        self.assertIsNone(tracker.event(self._arming(partition_id=2)))
+        self.assertIs(part0, tracker.event(self._arming(
+            partition_id=0, arming_type='EXIT_DELAY')))
+
+    async def test_unit_error_event_completes_action_as_error(self):
+        tracker = self._tracker()
+
+        inflight = await tracker.send(QolsysActionDisarm(partition_id=0))
+        tracker.ack()
+        tracker.event(self._error())
+
+        self.assertEqual('error', inflight.result)
+        self.assertEqual({'DISARM/error': 1},
+                         self.metrics.as_dict()['panel_actions'])
+
+    async def test_unit_ack_timeout_retries_then_fails(self):
+        tracker = self._tracker(ack_timeout=0.01, retries=1)
+
+        inflight = await tracker.send(QolsysActionDisarm(partition_id=0))
+        await asyncio.wait_for(inflight.done, timeout=1)
+
+        self.assertEqual('ack_timeout', inflight.result)
+        self.assertEqual(2, inflight.attempts)
+        self.assertEqual(2, len(self.written))
+
+        metrics = self.metrics.as_dict()
+        self.assertEqual({'DISARM': 1}, metrics['panel_action_retries'])
+        self.assertEqual({'DISARM/ack_timeout': 1}, metrics['panel_actions'])
+
+    async def test_unit_event_timeout(self):
+        tracker = self._tracker(event_timeout=0.01)
+
+        inflight = await tracker.send(QolsysActionDisarm(partition_id=0))
+        tracker.ack()
+        await asyncio.wait_for(inflight.done, timeout=1)
+
+        self.assertEqual('event_timeout', inflight.result)
+
+    async def test_unit_disconnected_fails_actions_in_flight(self):
+        tracker = self._tracker()
+
+        inflight = await tracker.send(QolsysActionDisarm(partition_id=0))
+        tracker.disconnected()
+
+        self.assertEqual('disconnected', inflight.result)
+        self.assertEqual([], tracker.inflight)
+        self.assertIsNone(tracker.ack())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,11 +1,15 @@
+import json
 import os
 import subprocess
+import tempfile
+import time
 import unittest
 
 from unittest import mock
 
 from tests.unit.qolsysgw.qolsys.testenv import FIXTURES_DIR
 
+from qolsys.utils import MacResolver
 from qolsys.utils import get_mac_from_host
 
 
@@ -15,6 +19,10 @@ class TestUnitGetMacFromHost(unittest.TestCase):
         with mock.patch('subprocess.run', side_effect=subprocess.SubprocessError):
             self.assertIsNone(get_mac_from_host('random_host'))
 
+    def test_unit_returns_none_if_arp_is_not_available(self):
+        with mock.patch('subprocess.run', side_effect=FileNotFoundError):
+            self.assertIsNone(get_mac_from_host('random_host'))
+
     def test_unit_returns_none_on_mac_address_not_found(self):
         fixture = os.path.join(FIXTURES_DIR, 'subprocess_run_arp_unknown_host.txt')
         with open(fixture, 'rb') as f:
@@ -33,5 +41,65 @@ class TestUnitGetMacFromHost(unittest.TestCase):
                              '01:12:76:ef:11:02')
 
 
+class TestUnitMacResolver(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self._tmpdir.name, 'mac_cache.json')
+        self.proc_net_arp = os.path.join(FIXTURES_DIR, 'proc_net_arp.txt')
+
+        fixture = os.path.join(FIXTURES_DIR,
+                               'subprocess_run_arp_known_host.txt')
+        with open(fixture, 'rb') as f:
+            self.arp_output = f.read()
+
+    def tearDown(self):
+        self._tmpdir.cleanup()
+
+    def _resolver(self, **kwargs):
+        return MacResolver(cache_path=self.cache_path,
+                           proc_net_arp=self.proc_net_arp, **kwargs)
+
+    async def test_unit_resolve_from_proc_net_arp(self):
+        with mock.patch('subprocess.run') as run:
+            self.assertEqual('01:12:76:ef:11:02',
+                             await self._resolver().resolve('192.168.1.10'))
+        run.assert_not_called()
+
+    async def test_unit_resolve_falls_back_to_arp(self):
+        with mock.patch('subprocess.run',
+                        return_value=mock.Mock(stdout=self.arp_output)) as run:
+            # Incomplete entries of the ARP table are ignored
+            self.assertEqual('01:12:76:ef:11:02',
+                             await self._resolver().resolve('192.168.1.11'))
+        run.assert_called_once()
+
+    async def test_unit_resolve_uses_cache_on_disk(self):
+        self.assertEqual('01:12:76:ef:11:02',
+                         await self._resolver().resolve('192.168.1.10'))
+        with open(self.cache_path) as f:
+            self.assertIn('192.168.1.10', json.load(f))
+
+        resolver = MacResolver(cache_path=self.cache_path,
+                               proc_net_arp='/nonexistent')
+        with mock.patch('subprocess.run') as run:
+            self.assertEqual('01:12:76:ef:11:02',
+                             await resolver.resolve('192.168.1.10'))
+        run.assert_not_called()
+
+    async def test_unit_resolve_ignores_expired_cache(self):
+        with open(self.cache_path, 'w') as f:
+            json.dump({'192.168.1.10': {'mac': 'aa:aa:aa:aa:aa:aa',
+                                        'at': time.time() - 120}}, f)
+
+        self.assertEqual('01:12:76:ef:11:02',
+                         await self._resolver(ttl=60).resolve('192.168.1.10'))
+
+    async def test_unit_resolve_not_found(self):
+        with mock.patch('subprocess.run', side_effect=FileNotFoundError):
+            self.assertIsNone(await self._resolver().resolve('192.168.1.11'))
+        self.assertFalse(os.path.exists(self.cache_path))
+
+
 if __name__ == '__main__':
     unittest.main()